@@ -0,0 +1,488 @@
+"""Benchmarks do MTechClicker.
+
+    python bench.py startup [--runs 5] [--exe dist/MTechClicker.exe] [--backend null]
+    python bench.py wakeups [--seconds 5] [--exe ...]
+    python bench.py stop [--trials 200] [--scenario autoclick|macro] [--via engine|thread] [--load 2] [--call-us 200]
+    python bench.py --out novo.json engine [--seconds 2] [--quick] [--baseline base.json] [--tolerance 15]
+    python bench.py compare base.json novo.json [--tolerance 15]
+
+startup: tempo até a janela aparecer e até o backend de input ficar pronto
+(GUI, via MTC_STARTUP_PROBE), tempo até o primeiro clique pela CLI e a
+quebra de `-X importtime` dos módulos mais caros. A primeira execução conta
+como fria (sem __pycache__ / --onefile recém-descompactado), as demais como
+quentes.
+wakeups: despertares por segundo com o app parado e com um autoclick (backend
+null) rodando, por origem (tick, notificador, listener, settings) e, no
+Linux, trocas de contexto do processo inteiro.
+stop: latência da parada (stop_event.set() -> worker fora, teclas/botões
+soltos) sob carga (threads ocupando a CPU/GIL) e com um custo simulado por
+chamada de backend; conta também eventos injetados depois do stop (fora as
+liberações) e teclas que ficaram presas. `--via engine` (padrão) passa por
+Engine.submit/Engine.stop, o caminho do app; `thread` roda runner.run numa
+thread. Sai com 1 se algum evento saiu depois do stop.
+engine: sem display nem mainloop do Tk, com o backend null: cps máximo
+(runner numa thread, job do engine e uma réplica do loop da v1), jitter a
+10/100/1000 cps, vazão de macros de 1k/100k passos, load/save do settings
+contra o tamanho da macro, custo por evento do listener e custo da comparação
+dos passos de espera por leitura (1/32/128 px) e latência do find_click
+(tela toda, cache, deslocado, ROI) numa tela sintética 1080p. Salve o JSON
+(--out) como baseline; `--baseline` ou `compare` apontam as métricas que
+pioraram além da tolerância (código de saída 1).
+Resultado em JSON no stdout (ou em --out).
+"""
+import argparse, json, math, os, random, shutil, statistics, subprocess, sys, threading, time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+MAIN = HERE / "main.py"
+
+def _cmd(exe: str | None, *args: str, importtime=False) -> list[str]:
+    if exe: return [exe, *args]
+    return [sys.executable, *(["-X", "importtime"] if importtime else []), str(MAIN), *args]
+
+def _json_line(out: str) -> dict | None:
+    for line in reversed(out.splitlines()):
+        line = line.strip()
+        if line.startswith("{"):
+            try: return json.loads(line)
+            except ValueError: pass
+    return None
+
+def _run(cmd: list[str], env: dict | None = None, timeout=60.0) -> tuple[dict | None, str]:
+    try:
+        p = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout,
+                           env={**os.environ, **(env or {})})
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return None, repr(e)
+    return _json_line(p.stdout), p.stderr
+
+def _clear_pycache():
+    shutil.rmtree(HERE / "__pycache__", ignore_errors=True)
+
+def _summary(samples: list[float]) -> dict:
+    if not samples: return {}
+    return {"cold": round(samples[0], 3),
+            "warm_median": round(statistics.median(samples[1:]), 3) if len(samples) > 1 else None,
+            "warm_min": round(min(samples[1:]), 3) if len(samples) > 1 else None,
+            "runs": len(samples)}
+
+def parse_importtime(stderr: str, top=15) -> list[dict]:
+    """Linhas `import time: self | cumulative | módulo` → os `top` mais caros
+    (cumulativo), só módulos de primeiro nível da árvore."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line: continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3: continue
+        self_us, cum_us, name = parts
+        if name.startswith("  "): continue   # submódulo (indentado além do espaço do separador)
+        try:
+            rows.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cum_us) / 1000})
+        except ValueError:
+            continue
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+def bench_startup(runs: int, exe: str | None, backend: str) -> dict:
+    res: dict = {"exe": exe, "python": None if exe else sys.version.split()[0], "backend": backend}
+
+    win, ready, gui_err = [], [], None
+    for i in range(runs):
+        if i == 0 and not exe: _clear_pycache()
+        data, err = _run(_cmd(exe), {"MTC_STARTUP_PROBE": "1"})
+        if not data:
+            gui_err = err.strip().splitlines()[-1] if err.strip() else "sem saída"
+            break
+        win.append(data["time_to_window_ms"]); ready.append(data["time_to_backend_ms"])
+    res["gui"] = {"time_to_window_ms": _summary(win), "time_to_backend_ms": _summary(ready)}
+    if gui_err: res["gui"]["error"] = gui_err
+
+    first = []
+    for i in range(runs):
+        if i == 0 and not exe: _clear_pycache()
+        data, err = _run(_cmd(exe, "autoclick", "--count", "1", "--backend", backend))
+        if data and "first_click_ms" in data: first.append(data["first_click_ms"])
+    res["cli"] = {"time_to_first_click_ms": _summary(first)}
+
+    if not exe:
+        _, err = _run(_cmd(None, "autoclick", "--count", "1", "--backend", backend, importtime=True))
+        res["importtime_cli"] = parse_importtime(err)
+        if not gui_err:
+            _, err = _run(_cmd(None, importtime=True), {"MTC_STARTUP_PROBE": "1"})
+            res["importtime_gui"] = parse_importtime(err)
+    return res
+
+def bench_wakeups(seconds: float, exe: str | None) -> dict:
+    data, err = _run(_cmd(exe), {"MTC_WAKEUP_PROBE": str(seconds)}, timeout=seconds * 2 + 60)
+    if not data:
+        return {"error": err.strip().splitlines()[-1] if err.strip() else "sem saída"}
+    return data
+
+def _percentiles(samples: list[float]) -> dict:
+    xs = sorted(samples)
+    pick = lambda q: round(xs[min(len(xs) - 1, int(q * len(xs)))], 3)
+    return {"n": len(xs), "mean": round(statistics.fmean(xs), 3), "p50": pick(0.5),
+            "p90": pick(0.9), "p99": pick(0.99), "max": round(xs[-1], 3)}
+
+STOP_MACRO = [
+    {"kind": "key_down", "value": {"token": "w"}},
+    {"kind": "path", "value": {"points": [[0, 0, 0], [200, 120, 80], [400, 0, 160]]}},
+    {"kind": "click", "value": {"button": "left", "x": 400, "y": 0}},
+    {"kind": "hold", "value": {"token": "a", "seconds": 0.03}},
+    {"kind": "mouse_down", "value": {"button": "left", "x": 10, "y": 10}},
+    {"kind": "delay", "value": {"seconds": 0.02}},
+    {"kind": "mouse_up", "value": {"button": "left", "x": 20, "y": 20}},
+    {"kind": "key_up", "value": {"token": "w"}},
+]
+
+def bench_stop(trials: int, scenario: str, load: int, call_us: float, via: str = "engine") -> dict:
+    import main as app
+
+    class SlowBackend(app.RecordingBackend):
+        """RecordingBackend que gasta `call_us` em cada chamada (backend real lento)."""
+        def _rec(self, kind, x, y):
+            super()._rec(kind, x, y)
+            end = time.perf_counter() + call_us / 1e6
+            while time.perf_counter() < end: pass
+
+    done = threading.Event()
+    def burn():
+        while not done.is_set(): sum(range(2000))
+    burners = [threading.Thread(target=burn, daemon=True) for _ in range(load)]
+    for t in burners: t.start()
+
+    prog = app.compile_macro(STOP_MACRO)
+    releases = (app.REC_KEY_UP, app.REC_BTN_UP)
+    lat, after, stuck = [], 0, 0
+    finished: dict[int, threading.Event] = {}
+    engine = app.Engine(on_done=lambda job: finished[job.id].set()) if via == "engine" else None
+    try:
+        for _ in range(trials):
+            backend, stop = SlowBackend(), threading.Event()
+            if scenario == "autoclick":
+                cfg = app.AutoclickRun("left", False, None, None, 0.001, 0.0, math.inf, "skip")
+                runner = app.AutoclickRunner(cfg, stop, backend); job = runner.run
+            else:
+                runner = app.MacroRunner(prog, stop, True, backend); job = lambda: runner.run(0)
+            if engine:
+                steps = (lambda r=runner: r.steps(0)) if scenario == "macro" else None
+                j = engine.submit(runner, "", scenario, steps=steps); ended = finished[j.id] = threading.Event()
+                time.sleep(random.uniform(0.02, 0.12))
+                t_stop = time.perf_counter()
+                engine.stop(j.id); t_stop_ns = time.perf_counter_ns()   # o flag já está setado aqui
+                ended.wait()
+            else:
+                t = threading.Thread(target=job); t.start()
+                time.sleep(random.uniform(0.02, 0.12))
+                t_stop = time.perf_counter()
+                stop.set(); t_stop_ns = time.perf_counter_ns(); t.join()
+            lat.append((runner.ended_at - t_stop) * 1000)
+            after += sum(1 for ts, kind, _, _ in backend.events() if ts > t_stop_ns and kind not in releases)
+            stuck += len(backend.held) + len(backend.held_buttons)
+    finally:
+        done.set()
+    return {"scenario": scenario, "via": via, "load_threads": load, "backend_call_us": call_us,
+            "run_switch_interval_ms": app.RUN_SWITCH_INTERVAL * 1000,
+            "stop_latency_ms": _percentiles(lat), "events_after_stop": after, "held_after_stop": stuck}
+
+# ---------------- suíte headless do engine (backend null) ----------------
+def _legacy_v1_clicks(app, backend, delay: float, seconds: float) -> list[float]:
+    """Réplica do loop de versions/code/main_v1.py (clica, depois dorme em
+    fatias de até 20 ms até agora + delay), que não dá para importar sem
+    display (Tk/pyautogui/pynput no topo). Devolve os instantes dos cliques."""
+    stop, ts = threading.Event(), []
+    end_all = time.perf_counter() + seconds
+    while not stop.is_set() and time.perf_counter() < end_all:
+        backend.click("left"); ts.append(time.perf_counter())
+        end = time.time() + delay
+        while time.time() < end and not stop.is_set():
+            time.sleep(min(0.02, end - time.time()))
+    return ts
+
+def _interval_stats(ts: list[float], delay: float) -> dict:
+    if len(ts) < 2: return {}
+    iv = [(b - a) * 1e6 for a, b in zip(ts, ts[1:])]
+    jit = [abs(x - delay * 1e6) for x in iv]
+    elapsed = ts[-1] - ts[0]
+    return {"clicks": len(ts), "achieved_cps": round((len(ts) - 1) / elapsed, 2) if elapsed > 0 else None,
+            "interval_us": _percentiles(iv), "jitter_us": _percentiles(jit)}
+
+def _autoclick(app, delay: float, seconds: float, engine=None):
+    """Roda um AutoclickRunner por `seconds` (drive() numa thread, ou como job do engine)."""
+    cfg = app.AutoclickRun("left", False, None, None, delay, 0.0, math.inf, "skip")
+    stop = threading.Event()
+    runner = app.AutoclickRunner(cfg, stop, app.NullBackend(), app.PauseGate(),
+                                 engine.cursor if engine else None)
+    if engine:
+        job = engine.submit(runner, "bench", "autoclick")
+        time.sleep(seconds); engine.stop(job.id)
+        while engine.running(): time.sleep(0.001)
+    else:
+        t = threading.Thread(target=runner.run); t.start()
+        time.sleep(seconds); stop.set(); t.join()
+    return runner
+
+def _runner_stats(r) -> dict:
+    tel = r.telemetry.summary()
+    return {"clicks": r.clicks, "missed": r.missed, "late": r.late, "achieved_cps": r.stats()["achieved_cps"],
+            "late_us": tel["late"], "jitter_us": tel["jitter"]}
+
+def suite_maxcps(app, seconds: float, engine) -> dict:
+    # intervalo 0: o atraso em relação ao deadline não tem sentido aqui
+    keep = ("clicks", "achieved_cps")
+    out = {name: {k: v for k, v in _runner_stats(_autoclick(app, 0.0, seconds, eng)).items() if k in keep}
+           for name, eng in (("thread", None), ("engine", engine))}
+    ts = _legacy_v1_clicks(app, app.NullBackend(), 0.0, seconds)
+    out["legacy_v1"] = {"clicks": len(ts), "achieved_cps": round(len(ts) / seconds, 2)}
+    return out
+
+def suite_jitter(app, seconds: float, engine) -> dict:
+    out = {}
+    for cps in (10, 100, 1000):
+        delay, secs = 1.0 / cps, max(seconds, 20.0 / cps)   # ao menos ~20 intervalos
+        out[str(cps)] = {"engine": _runner_stats(_autoclick(app, delay, secs, engine)),
+                         "legacy_v1": _interval_stats(_legacy_v1_clicks(app, app.NullBackend(), delay, secs), delay)}
+    return out
+
+def _macro_steps(n: int) -> list[dict]:
+    """`n` passos sem espera (clique, tecla e delay 0 alternados)."""
+    kinds = ({"kind": "click", "value": {"button": "left", "x": 10, "y": 20}},
+             {"kind": "key", "value": {"token": "a"}},
+             {"kind": "delay", "value": {"seconds": 0.0}})
+    return [kinds[i % 3] for i in range(n)]
+
+def suite_macro(app, sizes: list[int]) -> dict:
+    out = {}
+    for n in sizes:
+        steps = _macro_steps(n)
+        t0 = time.perf_counter(); prog = app.compile_macro(steps); t_compile = time.perf_counter() - t0
+        row = {"compile_ms": round(t_compile * 1000, 3)}
+        for mode in ("timeline", "relative"):
+            r = app.MacroRunner(prog, threading.Event(), mode == "timeline", app.NullBackend())
+            t0 = time.perf_counter(); r.run(1); dt = time.perf_counter() - t0
+            row[mode] = {"steps_per_s": round(n / dt), "elapsed_ms": round(dt * 1000, 3)}
+        out[str(n)] = row
+    return out
+
+def suite_settings(app, sizes: list[int], repeats: int) -> dict:
+    import tempfile
+    out = {}
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "settings.json"
+        for n in sizes:
+            s = app.AppSettings(macro_steps=_macro_steps(n))
+            save, load = [], []
+            for _ in range(repeats):
+                t0 = time.perf_counter(); app.save_settings(s, path); save.append((time.perf_counter() - t0) * 1000)
+                t0 = time.perf_counter(); app.load_settings(path); load.append((time.perf_counter() - t0) * 1000)
+            out[str(n)] = {"bytes": path.stat().st_size, "save_ms": _percentiles(save), "load_ms": _percentiles(load)}
+    return out
+
+def suite_listener(app, events: int) -> dict:
+    """Custo por evento do lado do hook (push no ring) e do consumidor
+    (_drain: roteamento de atalho e gravação de macro com movimentos)."""
+    class Btn:
+        def __init__(self, name): self.name = name
+    class FakeApp:
+        settings = app.AppSettings(macro_record_moves=True)
+        routes = {"mouse.x2": ("stop", "")}
+        def __init__(self): self.steps, self.dispatched = 0, 0
+        def dispatch(self, *a, **k): self.dispatched += 1
+        def append_macro_step(self, step): self.steps += 1
+        def append_macro_delay(self, s): self.steps += 1
+        def append_macro_click(self, *a): self.steps += 1
+        def append_macro_key(self, tok): self.steps += 1
+        def clear_macro_steps_ui(self): pass
+        def set_status(self, text): pass
+        def notify_capture(self): pass
+        def ui_call(self, fn, *a): pass
+
+    out = {}
+    for scenario in ("hotkeys", "recording"):
+        fake = FakeApp()
+        lis = app.GlobalListener(fake, None)
+        lis._scheduled = True   # o consumo é chamado à mão abaixo, sem o engine
+        if scenario == "recording": lis.start_macro_rec()
+        left, x2 = Btn("left"), Btn("x2")
+        ring_cap = lis.m_ring._cap // 2
+        consume_ns = 0
+        for base in range(0, events, ring_cap):
+            for i in range(base, min(events, base + ring_cap)):
+                if scenario == "recording" and i % 8:
+                    lis.on_move(i % 1920, (i * 7) % 1080)
+                else:
+                    lis.on_click(i % 1920, 500, x2 if scenario == "hotkeys" else left, True)
+            t0 = time.perf_counter_ns(); lis._drain(); consume_ns += time.perf_counter_ns() - t0
+            lis._scheduled = True
+        n, avg, mx, dropped = lis.hook_stats()
+        out[scenario] = {"events": n, "hook_us": {"mean": round(avg, 3), "max": round(mx, 3)}, "dropped": dropped,
+                         "consume_us_per_event": round(consume_ns / 1000 / max(1, n), 3),
+                         "dispatched": fake.dispatched, "macro_steps": fake.steps}
+    return out
+
+WAIT_SIZES = (1, 32, 128)   # lado da região (px)
+
+def suite_waits(app, polls: int) -> dict:
+    """Custo da comparação de cada leitura dos passos wait_* (sem a captura,
+    que depende do display) e a volta de uma macro cuja tela fica pronta em
+    100 ms: delay fixo pessimista de 500 ms vs. passo de espera."""
+    out: dict = {"numpy": app.installed("numpy"), "match_us": {}}
+    for side in WAIT_SIZES:
+        buf = bytes((40, 80, 120)) * (side * side)
+        other = bytes((41, 80, 120)) * (side * side)
+        row = {}
+        for mode, value in (("color", {"color": "#ff0000", "tolerance": 8}), ("hash", {"hash": "0" * 16}),
+                            ("change", {"tolerance": 4})):
+            spec = app.wait_spec({"kind": "wait_region", "value": {"x": 0, "y": 0, "w": side, "h": side,
+                                                                    "mode": mode, **value}})
+            match = app.wait_matcher(spec)
+            t0 = time.perf_counter()
+            for _ in range(polls): match(other, buf)
+            row[mode] = round((time.perf_counter() - t0) / polls * 1e6, 3)
+        out["match_us"][str(side)] = row
+
+    class Screen:   # a região vira vermelha 100 ms depois de a macro começar
+        name = "bench"
+        def __init__(self): self.t0 = time.perf_counter()
+        def grab(self, x, y, w, h):
+            return bytes((255, 0, 0) if time.perf_counter() - self.t0 >= 0.1 else (0, 0, 0)) * (w * h)
+    click = {"kind": "click", "value": {"button": "left", "x": 10, "y": 20}}
+    wait = {"kind": "wait_pixel", "value": {"x": 10, "y": 20, "color": "#ff0000", "timeout": 2, "rate_hz": 200}}
+    for name, gate in (("fixed_delay", {"kind": "delay", "value": {"seconds": 0.5}}), ("wait_pixel", wait)):
+        r = app.MacroRunner(app.compile_macro([click, gate, click]), threading.Event(), True,
+                            app.NullBackend(), grabber=Screen())
+        t0 = time.perf_counter(); r.run(1)
+        out[f"loop_ms_{name}"] = round((time.perf_counter() - t0) * 1000, 3)
+    return out
+
+def suite_find(app, repeats: int) -> dict:
+    """find_click numa tela sintética de 1920x1080 (ruído em blocos) com um
+    template de 48x48: 1ª busca (pirâmide na tela toda), re-busca pelo
+    cache do último acerto, elemento deslocado 10 px e busca numa ROI."""
+    if not app.installed("numpy"): return {"skipped": "numpy não instalado"}
+    import numpy as np
+    app.require(app.load_numpy)
+    rng = np.random.default_rng(7)
+    screen = np.repeat(np.repeat(rng.integers(0, 256, (270, 480, 3), dtype=np.uint8), 4, 0), 4, 1)
+    tx, ty = 1234, 567
+    tpl = app.gray(screen[ty:ty + 48, tx:tx + 48])
+
+    class Screen:
+        name = "bench"
+        def __init__(self, img): self.img = img
+        def bounds(self): return (0, 0, self.img.shape[1], self.img.shape[0])
+        def grab(self, x, y, w, h): return self.img[y:y + h, x:x + w].tobytes()
+    moved = screen.copy(); moved[ty:ty + 48, tx:tx + 48] = 0
+    moved[ty + 10:ty + 58, tx - 10:tx + 38] = screen[ty:ty + 48, tx:tx + 48]
+    out: dict = {"cv2": app.installed("cv2")}
+    for name, spec, img, warm in (("full", app.FindSpec("bench"), screen, False),
+                                  ("cached", app.FindSpec("bench"), screen, True),
+                                  ("moved", app.FindSpec("bench"), moved, True),
+                                  ("roi", app.FindSpec("bench", roi=(1100, 450, 400, 300)), screen, False)):
+        ms, hits = [], 0
+        for _ in range(repeats):
+            f = app.TemplateFinder(spec, tpl)
+            if warm: f.locate(Screen(screen))
+            t0 = time.perf_counter(); hit = f.locate(Screen(img)); ms.append((time.perf_counter() - t0) * 1000)
+            hits += hit is not None
+        out[name] = {"ms": _percentiles(ms), "found": hits}
+    return out
+
+# métricas comparadas pelo `compare`: caminho no JSON -> sentido bom
+BENCH_METRICS = {
+    "maxcps.engine.achieved_cps": "higher", "maxcps.thread.achieved_cps": "higher",
+    **{f"jitter.{c}.engine.jitter_us.{q}": "lower" for c in (10, 100, 1000) for q in ("p50", "p99")},
+    **{f"jitter.{c}.engine.late_us.p99": "lower" for c in (10, 100, 1000)},
+    **{f"macro.{n}.{m}.steps_per_s": "higher" for n in (1000, 100000) for m in ("timeline", "relative")},
+    **{f"macro.{n}.compile_ms": "lower" for n in (1000, 100000)},
+    **{f"settings.{n}.{op}.p50": "lower" for n in (0, 1000, 10000, 100000) for op in ("save_ms", "load_ms")},
+    **{f"listener.{s}.consume_us_per_event": "lower" for s in ("hotkeys", "recording")},
+    **{f"listener.{s}.hook_us.mean": "lower" for s in ("hotkeys", "recording")},
+    **{f"waits.match_us.{n}.{m}": "lower" for n in WAIT_SIZES for m in ("color", "hash", "change")},
+    **{f"find.{s}.ms.p50": "lower" for s in ("full", "cached", "moved", "roi")},
+}
+
+def bench_engine(seconds: float, quick: bool) -> dict:
+    import main as app
+    engine = app.Engine(); engine.start()
+    macro_sizes = [1000, 10000] if quick else [1000, 100000]
+    settings_sizes = [0, 1000] if quick else [0, 1000, 10000, 100000]
+    return {"python": sys.version.split()[0], "platform": sys.platform, "quick": quick,
+            "maxcps": suite_maxcps(app, seconds, engine),
+            "jitter": suite_jitter(app, seconds, engine),
+            "macro": suite_macro(app, macro_sizes),
+            "settings": suite_settings(app, settings_sizes, 3 if quick else 10),
+            "listener": suite_listener(app, 20_000 if quick else 200_000),
+            "waits": suite_waits(app, 200 if quick else 2000),
+            "find": suite_find(app, 5 if quick else 30)}
+
+def _lookup(data: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data: return None
+        data = data[part]
+    return data if isinstance(data, (int, float)) else None
+
+def compare(base: dict, new: dict, tolerance: float) -> dict:
+    """Métricas que pioraram mais que `tolerance` (fração) em relação à base."""
+    rows, regressions = [], []
+    for path, better in BENCH_METRICS.items():
+        a, b = _lookup(base, path), _lookup(new, path)
+        if a is None or b is None: continue
+        change = (b - a) / a if a else (0.0 if b == a else math.inf)
+        worse = change < -tolerance if better == "higher" else change > tolerance
+        row = {"metric": path, "base": a, "new": b, "change_pct": round(change * 100, 1), "better": better}
+        rows.append(row)
+        if worse: regressions.append(row)
+    return {"tolerance_pct": tolerance * 100, "compared": len(rows), "regressions": regressions, "all": rows}
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    st = sub.add_parser("startup", help="partida a frio/quente, janela e primeiro clique")
+    st.add_argument("--runs", type=int, default=5)
+    st.add_argument("--exe", help="executável do PyInstaller no lugar de `python main.py`")
+    st.add_argument("--backend", default="null", help="backend do clique da CLI (um backend real clica de verdade)")
+    wk = sub.add_parser("wakeups", help="despertares/s parado vs. rodando")
+    wk.add_argument("--seconds", type=float, default=5.0)
+    wk.add_argument("--exe", help="executável do PyInstaller no lugar de `python main.py`")
+    sp = sub.add_parser("stop", help="distribuição da latência de parada sob carga")
+    sp.add_argument("--trials", type=int, default=200)
+    sp.add_argument("--scenario", default="autoclick", choices=["autoclick", "macro"])
+    sp.add_argument("--via", default="engine", choices=["engine", "thread"], help="quem dirige o runner")
+    sp.add_argument("--load", type=int, default=2, help="threads ocupando CPU durante a medição")
+    sp.add_argument("--call-us", type=float, default=200.0, help="custo simulado de cada chamada de backend (µs)")
+    en = sub.add_parser("engine", help="suíte headless: cps máx., jitter, macros, settings, listener, esperas, find")
+    en.add_argument("--seconds", type=float, default=2.0, help="duração de cada medição de autoclick")
+    en.add_argument("--quick", action="store_true", help="tamanhos menores (CI)")
+    en.add_argument("--baseline", type=Path, help="compara com este JSON e sai com 1 se houver regressão")
+    en.add_argument("--tolerance", type=float, default=15.0, help="piora tolerada (%%) na comparação")
+    cp = sub.add_parser("compare", help="compara dois resultados de `engine`")
+    cp.add_argument("base", type=Path)
+    cp.add_argument("new", type=Path)
+    cp.add_argument("--tolerance", type=float, default=15.0, help="piora tolerada (%%)")
+    ap.add_argument("--out", type=Path, help="grava o JSON neste arquivo")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "startup":
+        result = bench_startup(max(1, args.runs), args.exe, args.backend)
+    elif args.cmd == "wakeups":
+        result = bench_wakeups(max(0.5, args.seconds), args.exe)
+    elif args.cmd == "stop":
+        result = bench_stop(max(1, args.trials), args.scenario, max(0, args.load), max(0.0, args.call_us), args.via)
+    elif args.cmd == "engine":
+        result = bench_engine(max(0.2, args.seconds), args.quick)
+        if args.baseline:
+            base = json.loads(args.baseline.read_text(encoding="utf-8"))
+            result["comparison"] = compare(base, result, args.tolerance / 100)
+    else:
+        base, new = (json.loads(p.read_text(encoding="utf-8")) for p in (args.base, args.new))
+        result = compare(base, new, args.tolerance / 100)
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out: args.out.write_text(text, encoding="utf-8")
+    print(text)
+    regressions = result.get("comparison", result).get("regressions") if args.cmd in ("engine", "compare") else None
+    if args.cmd == "stop": regressions = result["events_after_stop"]
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
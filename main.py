@@ -1,32 +1,200 @@
-import json, math, threading, time, tkinter as tk
-from dataclasses import dataclass, asdict, field
+from __future__ import annotations
+import time
+_T0 = time.perf_counter()   # início do processo (para medir partida a frio na CLI)
+import argparse, hashlib, heapq, importlib.util, itertools, json, math, mmap, os, re, struct, sys, threading
+from array import array
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field, fields, replace
 from pathlib import Path
-from tkinter import ttk, messagebox
 
-# ===== Backends de input (compatível com jogos) =====
-HAVE_PDI = True
-try:
+# ===== Imports pesados sob demanda =====
+# pyautogui, pydirectinput, pynput, Xlib, pystray e PIL somam centenas de ms na
+# partida (bem mais no --onefile, que descompacta tudo antes). Nada disso é
+# importado no topo: cada load_* publica os globais na primeira vez que um
+# backend, o listener ou a bandeja precisa, e a janela aparece antes disso.
+_loaded: dict[str, bool] = {}
+
+def installed(mod: str) -> bool:
+    """O módulo existe no ambiente? (não importa nada)"""
+    try: return importlib.util.find_spec(mod) is not None
+    except Exception: return False
+
+def lazy_import(loader) -> bool:
+    """Executa `loader` uma única vez; False se o import falhou."""
+    ok = _loaded.get(loader.__name__)
+    if ok is None:
+        try: loader(); ok = True
+        except Exception as e:
+            print(f"{loader.__name__}:", repr(e)); ok = False
+        _loaded[loader.__name__] = ok
+    return ok
+
+def require(loader):
+    if not lazy_import(loader): raise ImportError(f"{loader.__name__} falhou")
+
+class FailSafeException(Exception): pass
+FAILSAFE_ERRORS: tuple[type[BaseException], ...] = (FailSafeException,)
+
+def load_pdi():
+    global pdi
     import pydirectinput as pdi
     pdi.PAUSE = 0
     pdi.FAILSAFE = False
-except Exception:
-    HAVE_PDI = False
 
-import pyautogui
-pyautogui.FAILSAFE = True
+def load_pyautogui():
+    global pyautogui, FAILSAFE_ERRORS
+    import pyautogui
+    pyautogui.FAILSAFE = True
+    pyautogui.PAUSE = 0   # o ritmo é do scheduler; o sleep interno atrasaria o stop em 100 ms
+    FAILSAFE_ERRORS = (FailSafeException, pyautogui.FailSafeException)
+
+def load_pynput():
+    global keyboard, mouse
+    from pynput import keyboard, mouse
+
+def load_asyncio():
+    global asyncio
+    import asyncio   # ~100 ms a frio; só a thread do engine precisa
 
-from pynput import keyboard, mouse
+def load_futures():
+    global ThreadPoolExecutor
+    from concurrent.futures import ThreadPoolExecutor   # ~20 ms; só quando algo é despachado para o pool
 
-# ===== Tray (opcional) =====
-HAVE_TRAY = True
-try:
+def load_xlib():
+    global X, XK, xdisplay, xtest
+    from Xlib import X, XK, display as xdisplay
+    from Xlib.ext import xtest
+
+def load_numpy():
+    global np
+    import numpy as np
+
+def load_tray():
+    global pystray, Image, ImageDraw, ImageFont
     import pystray
     from PIL import Image, ImageDraw, ImageFont
-except Exception:
-    HAVE_TRAY = False
+
+# ===== GUI (Tk) — importada só pela interface, nunca pela CLI =====
+HAVE_TRAY = False
+
+def _import_gui():
+    global tk, ttk, messagebox, filedialog, simpledialog, HAVE_TRAY
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog, simpledialog
+    HAVE_TRAY = installed("pystray") and installed("PIL")
 
 APP_NAME = "MTechClicker"
+UI_DRAIN_MS = 50   # intervalo de agrupamento das atualizações vindas do listener
+TICK_MS = 100      # atualização das estatísticas (só enquanto um worker roda)
+WAKEUPS: Counter[str] = Counter()   # despertares por origem (medição de ociosidade)
+MAX_LIST_STEPS = 5000   # passos exibidos na lista (macros da biblioteca podem ter 100k+)
+RECORDED_LABEL = "(gravada)"
 SETTINGS_FILE = Path(__file__).with_name("settings.json")
+MACROS_DIR = Path(__file__).with_name("macros")
+
+# ----------------- tracing (Chrome trace-event) -----------------
+class _Span:
+    __slots__ = ("tracer", "name", "t0")
+    def __init__(self, tracer, name):
+        self.tracer, self.name = tracer, name
+    def __enter__(self): self.t0 = time.perf_counter(); return self
+    def __exit__(self, *exc): self.tracer.complete(self.name, self.t0, time.perf_counter())
+
+class _NoSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): pass
+_NOSPAN = _NoSpan()
+
+class Tracer:
+    """Spans e eventos instantâneos num buffer circular pré-alocado (colunas
+    em array), exportados no formato trace-event do Chrome (Perfetto,
+    chrome://tracing). Desligado, cada ponto instrumentado custa um teste de
+    `on`; ligado, uma gravação são alguns stores em array, sem alocar. Cheio,
+    sobrescreve os mais antigos."""
+    PH_SPAN, PH_INSTANT = 0, 1
+
+    def __init__(self, capacity: int = 1 << 17):
+        self.on = False
+        self.capacity = capacity
+        self._ts = array("d", bytes(8 * capacity))
+        self._dur = array("d", bytes(8 * capacity))
+        self._tid = array("q", bytes(8 * capacity))
+        self._name = array("i", bytes(4 * capacity))
+        self._ph = array("B", bytes(capacity))
+        self._names: dict[str, int] = {}
+        self._threads: dict[int, str] = {}   # nomes guardados na 1ª gravação (a thread pode acabar antes do export)
+        self._seq = itertools.count()   # next() é atômico: várias threads gravam
+        self.count = 0
+        self.t0 = 0.0
+
+    def start(self):
+        self._seq = itertools.count(); self.count = 0
+        self.t0 = time.perf_counter(); self.on = True
+
+    def stop(self): self.on = False
+
+    def _nid(self, name: str) -> int:
+        nid = self._names.get(name)
+        if nid is None: nid = self._names.setdefault(name, len(self._names))
+        return nid
+
+    def _put(self, ph: int, name: str, t: float, dur: float):
+        i = next(self._seq)
+        self.count = i + 1
+        i %= self.capacity
+        tid = threading.get_ident()
+        if tid not in self._threads: self._threads[tid] = threading.current_thread().name
+        self._ts[i] = t; self._dur[i] = dur; self._ph[i] = ph
+        self._tid[i] = tid; self._name[i] = self._nid(name)
+
+    def complete(self, name: str, t0: float, t1: float):
+        """Span já medido (perf_counter)."""
+        if self.on: self._put(self.PH_SPAN, name, t0, t1 - t0)
+
+    def instant(self, name: str, t: float | None = None):
+        if self.on: self._put(self.PH_INSTANT, name, time.perf_counter() if t is None else t, 0.0)
+
+    def span(self, name: str):
+        """`with TRACE.span("nome"):` — objeto vazio compartilhado quando desligado."""
+        return _Span(self, name) if self.on else _NOSPAN
+
+    def events(self) -> list[dict]:
+        names = {v: k for k, v in self._names.items()}
+        n = min(self.count, self.capacity)
+        first = self.count - n
+        pid, t0, out = os.getpid(), self.t0, []
+        for tid, tname in list(self._threads.items()):
+            out.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": tname}})
+        for j in range(first, first + n):
+            i = j % self.capacity
+            ev = {"name": names.get(self._name[i], "?"), "pid": pid, "tid": self._tid[i],
+                  "ts": round((self._ts[i] - t0) * 1e6, 3)}
+            if self._ph[i] == self.PH_SPAN: ev["ph"] = "X"; ev["dur"] = round(self._dur[i] * 1e6, 3)
+            else: ev["ph"] = "i"; ev["s"] = "t"
+            out.append(ev)
+        return out
+
+    def export(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"traceEvents": self.events(), "displayTimeUnit": "ms",
+                "otherData": {"app": APP_NAME, "dropped": max(0, self.count - self.capacity)}}
+        path.write_text(json.dumps(data), encoding="utf-8")
+        return path
+
+TRACE = Tracer()
+
+def traced(name: str):
+    """Decorador: span `name` em cada chamada enquanto o tracing estiver ligado."""
+    def deco(fn):
+        def wrapper(*args, **kwargs):
+            if not TRACE.on: return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally: TRACE.complete(name, t0, time.perf_counter())
+        wrapper.__name__, wrapper.__doc__, wrapper.__wrapped__ = fn.__name__, fn.__doc__, fn
+        return wrapper
+    return deco
 
 # ----------------- MODELOS -----------------
 @dataclass
@@ -35,6 +203,11 @@ class AppSettings:
     start_countdown: float = 0.0
     hotkey_toggle: str = "f8"      # inicia/para (toggle)
     hotkey_emergency: str = "esc"  # parada de emergência
+    hotkey_pause: str = ""         # pausa/retoma o que estiver rodando ("" = sem atalho)
+    input_backend: str = "auto"    # auto | sendinput | xtest | pydirectinput | pyautogui | pynput | null | recording
+    telemetry_export: str = "off"  # off | json | csv (grava a telemetria de cada execução em telemetry/)
+    delay_profile: str = "uniform" # uniform | gaussian | lognormal | clamped (variação dos delays)
+    humanize_seed: int = 0         # semente da variação (0 = aleatória)
 
     # Autoclick
     delay_seconds: float = 0.20
@@ -46,16 +219,32 @@ class AppSettings:
     fixed_y: int | None = None
     run_mode: str = "until_stop"   # until_stop | fixed_amount
     run_amount: int = 100
+    miss_policy: str = "skip"      # skip | catchup (deadlines perdidos)
+    autoclick_mode: str = "single" # single (posição fixa/cursor) | multi (lista de alvos)
+    autoclick_targets: list[dict] = field(default_factory=list)   # [{"x","y","button","click_type","delay"},...]
+    autoclick_presets: dict[str, dict] = field(default_factory=dict)   # nome -> campos do autoclick
+    preset_hotkeys: dict[str, str] = field(default_factory=dict)       # token -> nome do preset
 
     # Macro
     macro_steps: list[dict] = field(default_factory=list)   # [{"kind":"key|click|delay","value":{...}},...]
     macro_use_recorded_delays: bool = True
     macro_forced_delay: float = 1.0
+    macro_delay_variation_pct: float = 0.0   # variação aplicada aos passos delay (mesmo perfil do autoclick)
     macro_loops: int = 0          # 0 = infinito
+    macro_playback: str = "relative"  # relative (sleeps encadeados, como sempre) | timeline (linha do tempo absoluta)
+    macro_record_moves: bool = False  # grava movimentos/arrastes (passos path + mouse_down/up)
+    macro_path_tolerance: float = 2.0 # px, tolerância da simplificação RDP
+    macro_path_rate_hz: float = 120.0 # taxa de interpolação no replay dos caminhos
+    macro_name: str = ""              # macro da biblioteca em uso ("" = passos gravados acima)
+    macro_hotkeys: dict[str, str] = field(default_factory=dict)   # token -> nome da macro
 
     def clamp(self):
         # comuns
         self.start_countdown = max(0.0, float(self.start_countdown))
+        if self.input_backend not in ("auto", *BACKENDS): self.input_backend = "auto"
+        if self.telemetry_export not in ("off", "json", "csv"): self.telemetry_export = "off"
+        if self.delay_profile not in DELAY_PROFILES: self.delay_profile = "uniform"
+        self.humanize_seed = max(0, int(self.humanize_seed or 0))
         # autoclick
         self.delay_seconds = max(0.0, float(self.delay_seconds))
         self.delay_variation_pct = max(0.0, min(100.0, float(self.delay_variation_pct)))
@@ -63,37 +252,726 @@ class AppSettings:
         if self.mouse_button not in ("left", "right", "middle"): self.mouse_button = "left"
         if self.click_type not in ("single", "double"): self.click_type = "single"
         if self.run_mode not in ("until_stop", "fixed_amount"): self.run_mode = "until_stop"
+        if self.miss_policy not in ("skip", "catchup"): self.miss_policy = "skip"
+        if self.autoclick_mode not in ("single", "multi"): self.autoclick_mode = "single"
+        self.autoclick_targets = [clamp_target(t) for t in list(self.autoclick_targets or []) if isinstance(t, dict)]
+        self.autoclick_presets = {str(n): {k: v for k, v in dict(p).items() if k in PRESET_FIELDS}
+                                  for n, p in dict(self.autoclick_presets or {}).items()}
+        self.preset_hotkeys = {str(k): str(v) for k, v in dict(self.preset_hotkeys or {}).items()
+                               if v in self.autoclick_presets}
         # macro
         self.macro_forced_delay = max(0.0, float(self.macro_forced_delay))
+        self.macro_delay_variation_pct = max(0.0, min(100.0, float(self.macro_delay_variation_pct)))
         self.macro_loops = max(0, int(self.macro_loops))  # 0 = infinito
+        if self.macro_playback not in ("timeline", "relative"): self.macro_playback = "relative"
+        self.macro_path_tolerance = max(0.0, float(self.macro_path_tolerance))
+        self.macro_path_rate_hz = max(1.0, min(1000.0, float(self.macro_path_rate_hz)))
+        self.macro_name = str(self.macro_name or "")
+        self.macro_hotkeys = {str(k): str(v) for k, v in dict(self.macro_hotkeys or {}).items()}
+
+def clamp_target(t: dict) -> dict:
+    """Normaliza um alvo do autoclick multi-alvo."""
+    return {"x": int(t.get("x", 0)), "y": int(t.get("y", 0)),
+            "button": t.get("button") if t.get("button") in ("left", "right", "middle") else "left",
+            "click_type": "double" if t.get("click_type") == "double" else "single",
+            "delay": max(0.001, float(t.get("delay", 0.2)))}
+
+# campos do autoclick guardados num preset
+PRESET_FIELDS = ("delay_seconds", "delay_variation_pct", "delay_profile", "mouse_button", "click_type", "use_fixed_position",
+                 "fixed_x", "fixed_y", "run_mode", "run_amount", "miss_policy", "autoclick_mode", "autoclick_targets")
+
+def preset_settings(s: AppSettings, preset: str) -> AppSettings:
+    """Cópia das configurações com o preset de autoclick aplicado."""
+    out = replace(s, **s.autoclick_presets.get(preset, {})); out.clamp()
+    return out
 
-def load_settings() -> AppSettings:
+@traced("settings.load")
+def load_settings(path: Path = SETTINGS_FILE) -> AppSettings:
     try:
-        if SETTINGS_FILE.exists():
-            data = json.loads(SETTINGS_FILE.read_text(encoding="utf-8"))
-            s = AppSettings(**data); s.clamp(); return s
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+            known = {f.name for f in fields(AppSettings)}   # ignora chaves de versões antigas
+            s = AppSettings(**{k: v for k, v in data.items() if k in known}); s.clamp(); return s
     except Exception:
         pass
     return AppSettings()
 
-def save_settings(s: AppSettings):
+def atomic_write_text(path: Path, text: str):
+    """Grava num temporário no mesmo diretório e renomeia por cima: um crash
+    no meio da escrita nunca deixa o arquivo truncado."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text); f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def json_copy(v):
+    """Cópia funda de uma árvore JSON (dict/list/escalares); ~6x mais rápida que asdict()."""
+    if isinstance(v, dict): return {k: json_copy(x) for k, x in v.items()}
+    if isinstance(v, list): return [json_copy(x) for x in v]
+    return v
+
+def settings_snapshot(s: AppSettings) -> dict:
+    """Normaliza e copia as configurações; chamar na thread dona delas (UI)."""
+    s.clamp()
+    return {f.name: json_copy(getattr(s, f.name)) for f in fields(s)}
+
+@traced("settings.save")
+def save_settings(s: AppSettings | dict, path: Path = SETTINGS_FILE):
+    """Grava as configurações; um dict é um snapshot já pronto (settings_snapshot)."""
     try:
-        s.clamp()
-        SETTINGS_FILE.write_text(json.dumps(asdict(s), indent=2), encoding="utf-8")
+        data = s if isinstance(s, dict) else settings_snapshot(s)
+        atomic_write_text(path, json.dumps(data, indent=2))
     except Exception as e:
         print("Falha ao salvar settings:", e)
 
-# ------------ util -------------
-def human_delay(base: float, variation_pct: float) -> float:
-    if variation_pct <= 0:
-        return max(0.0, base)
-    import random
-    amp = base * (variation_pct / 100.0)
-    return max(0.0, base + random.uniform(-amp, amp))
+class SettingsStore:
+    """Persistência write-behind: `mark_dirty()` só marca; uma thread grava
+    depois de `debounce` segundos sem novas alterações (no máximo `max_wait`
+    após a primeira), e `close()` grava o que faltar na saída. Ociosa, a
+    thread fica bloqueada na Condition, sem acordar.
+
+    A thread nunca lê `settings`: com `call` (ex.: App.ui_call) ela pede o
+    snapshot (clamp + cópia funda) à thread da UI e só serializa/grava a
+    cópia. Quem altera `settings` segura `lock` (reentrante), e quem lê de
+    outra thread (launch no pool) copia sob ele."""
+    def __init__(self, settings: AppSettings, path: Path = SETTINGS_FILE,
+                 debounce: float = 0.5, max_wait: float = 3.0, call=None):
+        self.settings = settings
+        self.path = path
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.call = call
+        self.lock = threading.RLock()
+        self._cv = threading.Condition()
+        self._io = threading.Lock()
+        self._dirty_since: float | None = None
+        self._last_mark = 0.0
+        self._closed = False
+        self._snap: dict | None = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self):
+        with self._cv:
+            self._last_mark = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = self._last_mark
+                self._cv.notify()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return settings_snapshot(self.settings)
+
+    def frozen(self) -> AppSettings:
+        """Cópia funda e normalizada para um job, de qualquer thread; não
+        toca em `settings` (o clamp é na cópia)."""
+        with self.lock:
+            s = AppSettings(**{f.name: json_copy(getattr(self.settings, f.name)) for f in fields(AppSettings)})
+        s.clamp(); return s
+
+    def flush(self):
+        """Grava agora (se houver algo pendente); snapshot na thread chamadora."""
+        with self._cv:
+            if self._dirty_since is None: return
+            self._dirty_since = None
+        snap = self.snapshot()
+        with self._io:
+            save_settings(snap, self.path)
+
+    def _hand_snapshot(self):
+        snap = self.snapshot()
+        with self._cv:
+            self._snap = snap
+            self._cv.notify()
+
+    def _flush_via_call(self):
+        cv = self._cv
+        with cv:
+            if self._dirty_since is None: return
+            self._dirty_since = None
+            self._snap = None
+        self.call(self._hand_snapshot)
+        with cv:
+            while self._snap is None and not self._closed:
+                cv.wait(); WAKEUPS["settings"] += 1
+            snap, self._snap = self._snap, None
+            if snap is None:   # fechando: devolve a pendência para o flush() do close()
+                self._dirty_since = self._last_mark; return
+        with self._io:
+            save_settings(snap, self.path)
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            self._cv.notify()
+        self._thread.join(timeout=2.0)
+        self.flush()
+
+    def _run(self):
+        cv = self._cv
+        while True:
+            with cv:
+                while self._dirty_since is None and not self._closed:
+                    cv.wait(); WAKEUPS["settings"] += 1
+                if self._closed: return
+                while not self._closed:
+                    now = time.monotonic()
+                    due = min(self._last_mark + self.debounce, self._dirty_since + self.max_wait)
+                    if now >= due: break
+                    cv.wait(due - now); WAKEUPS["settings"] += 1
+                if self._closed: return
+            if self.call is None: self.flush()
+            else: self._flush_via_call()
+
+# ------------ delays humanizados -------------
+DELAY_PROFILES = ("uniform", "gaussian", "lognormal", "clamped")
+DELAY_BATCH = 1024   # delays sorteados por lote
+
+class DelayStream:
+    """Delays humanizados sorteados em lotes: o loop quente só chama next(),
+    que indexa uma lista e refaz o lote quando acaba (vetorizado com NumPy
+    se instalado). Perfis, com amp = base * variação%:
+      uniform   → base ± amp (uniforme, o comportamento antigo)
+      gaussian  → normal(base, amp/2), ≥ 0
+      lognormal → média base, cauda longa para cima (σ log = ln(1+var)/2)
+      clamped   → normal(base, amp/2) cortada em base ± amp
+    Com `seed`, a sequência se repete a cada execução (no mesmo ambiente:
+    NumPy e o `random` da stdlib sorteiam sequências diferentes)."""
+    def __init__(self, base: float, variation_pct: float = 0.0, profile: str = "uniform",
+                 seed: int | None = None, batch: int = DELAY_BATCH):
+        self.base = max(0.0, float(base))
+        self.rel = max(0.0, float(variation_pct)) / 100.0
+        self.amp = self.base * self.rel
+        self.profile = profile if profile in DELAY_PROFILES else "uniform"
+        self.batch = max(1, batch)
+        self.constant = self.amp <= 0
+        self._fill = None
+        if not self.constant:
+            if installed("numpy") and lazy_import(load_numpy):
+                self._rng = np.random.default_rng(seed); self._fill = self._fill_numpy
+            else:
+                import random
+                self._rng = random.Random(seed); self._fill = self._fill_py
+        self._buf: list[float] = [self.base] if self.constant else []
+        self._i = 0 if self.constant else self.batch   # força o 1º lote no 1º next()
+
+    def next(self) -> float:
+        i = self._i
+        if i >= len(self._buf):
+            if self._fill: self._buf = self._fill(self.batch)
+            i = 0
+        self._i = i + 1
+        return self._buf[i]
+
+    def take(self, n: int) -> list[float]:
+        """`n` delays de uma vez (pré-cálculo de uma volta de macro)."""
+        if self.constant: return [self.base] * n
+        return self._fill(n)
+
+    def _fill_numpy(self, n: int) -> list[float]:
+        rng, base, amp, p = self._rng, self.base, self.amp, self.profile
+        if p == "uniform": x = rng.uniform(base - amp, base + amp, n)
+        elif p == "lognormal":
+            s = math.log1p(self.rel) / 2
+            x = base * rng.lognormal(-s * s / 2, s, n)
+        else:
+            x = rng.normal(base, amp / 2, n)
+            if p == "clamped": np.clip(x, base - amp, base + amp, out=x)
+        np.maximum(x, 0.0, out=x)
+        return x.tolist()
+
+    def _fill_py(self, n: int) -> list[float]:
+        rng, base, amp, p = self._rng, self.base, self.amp, self.profile
+        if p == "uniform":
+            u = rng.uniform; x = [u(base - amp, base + amp) for _ in range(n)]
+        elif p == "lognormal":
+            s = math.log1p(self.rel) / 2; ln, mu = rng.lognormvariate, -s * s / 2
+            x = [base * ln(mu, s) for _ in range(n)]
+        else:
+            g, sd = rng.gauss, amp / 2
+            x = [g(base, sd) for _ in range(n)]
+            if p == "clamped":
+                lo, hi = base - amp, base + amp
+                x = [lo if v < lo else hi if v > hi else v for v in x]
+        return [v if v > 0.0 else 0.0 for v in x]
+
+def sub_seed(seed: int | None, i: int) -> int | None:
+    """Semente derivada para o i-ésimo fluxo (alvos do multi-alvo, macro)."""
+    return None if seed is None else seed * 1_000_003 + i
+
+# ------------ agendador -------------
+SPIN_SECONDS = 0.002      # últimos ms da espera em busy-wait (sleep não é preciso)
+MAX_CATCHUP_BURST = 50    # limite de cliques em rajada na política 'catchup'
+RUN_SWITCH_INTERVAL = 0.001   # troca de GIL durante a execução (padrão do Python: 5 ms)
+
+class HiResTimer:
+    """Context manager: no Windows pede resolução de 1 ms ao timer do sistema.
+    Também encurta o intervalo de troca do GIL, que limita quanto tempo o
+    worker acordado pelo stop espera por outra thread ocupada."""
+    def __enter__(self):
+        self._on = False
+        self._switch = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch, RUN_SWITCH_INTERVAL))
+        if sys.platform == "win32":
+            try:
+                import ctypes; ctypes.windll.winmm.timeBeginPeriod(1); self._on = True
+            except Exception: pass
+        return self
+
+    def __exit__(self, *exc):
+        sys.setswitchinterval(self._switch)
+        if self._on:
+            try:
+                import ctypes; ctypes.windll.winmm.timeEndPeriod(1)
+            except Exception: pass
+
+def wait_until(deadline: float, stop_event: threading.Event, spin: float = SPIN_SECONDS) -> bool:
+    """Espera até `deadline` (perf_counter). Dorme no Event e faz spin no final.
+    Retorna False se o stop_event foi setado antes do deadline."""
+    clock = time.perf_counter
+    rem = deadline - clock()
+    if rem > spin:
+        if stop_event.wait(rem - spin): return False
+    elif stop_event.is_set():
+        return False
+    is_set = stop_event.is_set
+    while clock() < deadline:
+        if is_set(): return False
+    return not is_set()
+
+class ClickScheduler:
+    """Agendamento por deadline absoluto em relógio monotônico.
+
+    Cada deadline é o anterior + intervalo (não "agora + intervalo"), então o
+    custo do clique não se acumula. Deadlines perdidos seguem `policy`:
+    'skip' realinha na grade e descarta os cliques perdidos; 'catchup' dispara
+    os atrasados em sequência (até MAX_CATCHUP_BURST) para manter a média.
+    `missed` conta só os deadlines descartados; `late`, os cliques que ainda
+    saem, mas depois do próprio deadline."""
+    def __init__(self, stop_event: threading.Event, policy: str = "skip", spin: float = SPIN_SECONDS):
+        self.stop_event = stop_event
+        self.policy = policy
+        self.spin = spin
+        self.deadline = 0.0
+        self.missed = 0     # deadlines descartados (nunca disparados)
+        self.late = 0       # deadlines disparados atrasados
+
+    def start(self, t0: float | None = None):
+        self.deadline = time.perf_counter() if t0 is None else t0
+        self.missed = self.late = 0
+
+    def wait(self) -> bool:
+        return wait_until(self.deadline, self.stop_event, self.spin)
+
+    def advance(self, interval: float):
+        self.deadline += interval
+        late = time.perf_counter() - self.deadline
+        if late <= 0 or interval <= 0: return
+        behind = int(late // interval)
+        skip = behind if self.policy == "skip" else max(0, behind - MAX_CATCHUP_BURST)
+        if skip:
+            self.missed += skip
+            self.deadline += skip * interval
+        self.late += 1   # o próximo deadline já passou: sai atrasado
+
+@dataclass(frozen=True)
+class ClickTarget:
+    """Um alvo do autoclick multi-alvo, com ritmo próprio."""
+    x: int
+    y: int
+    button: str
+    double: bool
+    delay: float
+
+@dataclass(frozen=True)
+class AutoclickRun:
+    """Snapshot da config do autoclick, lido uma vez por execução. Com
+    `targets`, cada alvo usa seu próprio botão/tipo/intervalo."""
+    button: str
+    double: bool
+    x: int | None
+    y: int | None
+    delay: float
+    variation_pct: float
+    total: float
+    policy: str
+    targets: tuple[ClickTarget, ...] = ()
+    profile: str = "uniform"          # perfil da variação (DELAY_PROFILES)
+    seed: int | None = None           # None = aleatório a cada execução
+
+    @classmethod
+    def from_settings(cls, s: "AppSettings") -> "AutoclickRun":
+        fixed = s.use_fixed_position and s.fixed_x is not None and s.fixed_y is not None
+        targets = ()
+        if s.autoclick_mode == "multi":
+            targets = tuple(ClickTarget(t["x"], t["y"], t["button"], t["click_type"] == "double", t["delay"])
+                            for t in s.autoclick_targets)
+        return cls(button=s.mouse_button, double=s.click_type == "double",
+                   x=int(s.fixed_x) if fixed else None, y=int(s.fixed_y) if fixed else None,
+                   delay=s.delay_seconds, variation_pct=s.delay_variation_pct,
+                   total=math.inf if s.run_mode == "until_stop" else s.run_amount,
+                   policy=s.miss_policy, targets=targets, profile=s.delay_profile,
+                   seed=s.humanize_seed or None)
+
+# ------------ telemetria por execução -------------
+HIST_SUB_BITS = 6                  # 64 sub-baldes por oitava: erro relativo < 1,6%
+HIST_MAX_US = (1 << 26) - 1        # ~67 s; valores acima caem no último balde
+TELEMETRY_DIR = Path(__file__).with_name("telemetry")
+
+class Histogram:
+    """Histograma log-linear de memória fixa (estilo HDR) para inteiros em µs.
+
+    Até 2**HIST_SUB_BITS o balde é exato; acima, cada oitava tem a mesma
+    quantidade de baldes, então a precisão relativa é constante. record()
+    é só aritmética de bits e um incremento num array pré-alocado."""
+    __slots__ = ("counts", "n", "total", "min", "max")
+    SIZE = ((HIST_MAX_US.bit_length() - HIST_SUB_BITS) << (HIST_SUB_BITS - 1)) + (1 << HIST_SUB_BITS)
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * self.SIZE))
+        self.n = self.total = self.max = 0
+        self.min = HIST_MAX_US
+
+    def record(self, us: int):
+        if us < 0: us = 0
+        elif us > HIST_MAX_US: us = HIST_MAX_US
+        if us < 1 << HIST_SUB_BITS: i = us
+        else:
+            shift = us.bit_length() - HIST_SUB_BITS
+            i = (shift << (HIST_SUB_BITS - 1)) + (us >> shift)
+        self.counts[i] += 1
+        self.n += 1; self.total += us
+        if us > self.max: self.max = us
+        if us < self.min: self.min = us
+
+    @staticmethod
+    def value_at(i: int) -> float:
+        """Meio do balde `i`, em µs."""
+        if i < 1 << HIST_SUB_BITS: return float(i)
+        shift = (i >> (HIST_SUB_BITS - 1)) - 1
+        low = (i - (shift << (HIST_SUB_BITS - 1))) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def percentile(self, q: float) -> float:
+        if not self.n: return 0.0
+        rank, seen = max(1, math.ceil(q * self.n)), 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= rank: return max(float(self.min), min(self.value_at(i), float(self.max)))
+        return float(self.max)
+
+    def summary(self) -> dict:
+        if not self.n: return {"n": 0}
+        p = self.percentile
+        return {"n": self.n, "mean": round(self.total / self.n, 1), "min": self.min, "p50": p(0.5),
+                "p90": p(0.9), "p99": p(0.99), "p999": p(0.999), "max": self.max}
+
+class RunTelemetry:
+    """Tempos de uma execução em histogramas de tamanho fixo (µs):
+    inject = duração de cada chamada de backend; late = atraso do passo em
+    relação ao deadline (agendador); interval = intervalo real entre passos;
+    jitter = |intervalo - alvo|; cps = cliques em cada janela de 1 s. Separa
+    backend lento (inject) de agendador atrasado (late) e de jogo lento
+    (nenhum dos dois)."""
+    def __init__(self, target_interval: float | None = None):
+        self.target_interval = target_interval
+        self.inject, self.late, self.interval, self.jitter, self.cps = (Histogram() for _ in range(5))
+        self._last: float | None = None
+        self._win_start: float | None = None
+        self._win_clicks = 0
+        self.started_at = time.perf_counter()
+
+    def call(self, t0: float, t1: float):
+        self.inject.record(int((t1 - t0) * 1e6))
+
+    def step(self, deadline: float, now: float):
+        """Um passo saiu agora (`now`) para o `deadline` agendado."""
+        self.late.record(int((now - deadline) * 1e6))
+        if self._last is not None:
+            dt = now - self._last
+            self.interval.record(int(dt * 1e6))
+            if self.target_interval: self.jitter.record(int(abs(dt - self.target_interval) * 1e6))
+        self._last = now
+
+    def resync(self):
+        """Depois de uma pausa: o próximo intervalo não conta."""
+        self._last = None; self._win_start = None
+
+    def click(self, now: float):
+        ws = self._win_start
+        if ws is None:
+            self._win_start, self._win_clicks = now, 1; return
+        while now - ws >= 1.0:          # fecha as janelas cheias (as vazias contam 0)
+            self.cps.record(self._win_clicks); self._win_clicks = 0; ws += 1.0
+        self._win_start = ws; self._win_clicks += 1
+
+    HISTS = ("inject", "late", "interval", "jitter", "cps")
+
+    def summary(self) -> dict:
+        out = {"target_interval_us": round(self.target_interval * 1e6, 1) if self.target_interval else None,
+               "elapsed_s": round(time.perf_counter() - self.started_at, 3)}
+        for name in self.HISTS: out[name] = getattr(self, name).summary()
+        return out
+
+    def status_text(self) -> str:
+        def f(h: Histogram) -> str:
+            return f"{h.percentile(0.5) / 1000:.2f}/{h.percentile(0.99) / 1000:.2f}/{h.max / 1000:.2f}" if h.n else "—"
+        txt = f"Injeção {f(self.inject)} • Atraso {f(self.late)} • Intervalo {f(self.interval)}"
+        if self.target_interval: txt += f" (alvo {self.target_interval * 1000:.2f}) • Jitter {f(self.jitter)}"
+        if self.cps.n: txt += f" • cps p50 {self.cps.percentile(0.5):.0f}"
+        return txt + "  [ms p50/p99/máx]"
+
+    def export(self, path: Path, meta: dict | None = None) -> Path:
+        """Grava o resumo e os baldes não vazios: .csv (uma linha por balde) ou JSON."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        rows = [(name, Histogram.value_at(i), c) for name in self.HISTS
+                for i, c in enumerate(getattr(self, name).counts) if c]
+        if path.suffix.lower() == ".csv":
+            lines = ["metric,value_us,count"] + [f"{n},{v},{c}" for n, v, c in rows]
+            path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        else:
+            data = {**(meta or {}), "summary": self.summary(), "buckets": {}}
+            for n, v, c in rows: data["buckets"].setdefault(n, []).append([v, c])
+            path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        return path
+
+class TimedBackend:
+    """Repassa as chamadas ao backend real cronometrando cada injeção na
+    telemetria da execução; teclas/botões presos continuam no backend real.
+    `first_event_at` guarda o fim da primeira injeção, de qualquer tipo."""
+    def __init__(self, inner: InputBackend, tel: RunTelemetry):
+        self.inner, self.tel, self.name = inner, tel, inner.name
+        self.first_event_at: float | None = None
+
+    held = property(lambda self: self.inner.held)
+    held_buttons = property(lambda self: self.inner.held_buttons)
+    def key(self, tok: str): return self.inner.key(tok)
+    def position(self): return self.inner.position()
+
+    def click(self, button, double=False, x=None, y=None):
+        clock = time.perf_counter
+        t0 = clock(); self.inner.click(button, double, x, y); t1 = clock()
+        self.tel.call(t0, t1); self.tel.click(t1)
+        if self.first_event_at is None: self.first_event_at = t1
+        if TRACE.on: TRACE.complete("backend.click", t0, t1)
+
+    def _timed(self, name, fn, *args):
+        clock = time.perf_counter
+        t0 = clock(); fn(*args); t1 = clock()
+        self.tel.call(t0, t1)
+        if self.first_event_at is None: self.first_event_at = t1
+        if TRACE.on: TRACE.complete(name, t0, t1)
+
+    def move(self, x, y): self._timed("backend.move", self.inner.move, x, y)
+    def tap(self, key): self._timed("backend.tap", self.inner.tap, key)
+    def key_down(self, key): self._timed("backend.key_down", self.inner.key_down, key)
+    def key_up(self, key): self._timed("backend.key_up", self.inner.key_up, key)
+    def mouse_down(self, button, x=None, y=None): self._timed("backend.mouse_down", self.inner.mouse_down, button, x, y)
+    def mouse_up(self, button, x=None, y=None): self._timed("backend.mouse_up", self.inner.mouse_up, button, x, y)
+    def release_all(self): self.inner.release_all()
+
+# ------------ pausa -------------
+class PauseGate:
+    """Pausa cooperativa: quem consome os passos olha `paused` quando um
+    deadline chega e, se pausado, espera até retomar ou parar. O tempo
+    pausado volta para o gerador, que desloca a sua linha do tempo."""
+    def __init__(self):
+        self.paused = False
+        self._resume = threading.Event(); self._resume.set()
+
+    def pause(self): self.paused = True; self._resume.clear()
+    def resume(self): self.paused = False; self._resume.set()
+
+    def toggle(self) -> bool:
+        (self.resume if self.paused else self.pause)()
+        return self.paused
+
+    def hold(self, stop: threading.Event) -> float:
+        t0 = time.perf_counter()
+        while self.paused and not stop.is_set():
+            self._resume.wait()
+        return time.perf_counter() - t0
+
+# ------------ passos como geradores -------------
+# Os runners não esperam sozinhos: steps() é um gerador que produz o próximo
+# deadline (perf_counter) e recebe de volta o tempo que ficou pausado. Quem
+# consome faz a espera: drive() numa thread própria (CLI, benchmarks) ou o
+# Engine, que multiplexa vários jobs numa thread só.
+WAIT_CURSOR = -1.0   # produzido no lugar de um deadline: "espero o cursor ficar livre"
+OFFLOAD_POLL = 0.002 # drive(): de quanto em quanto olha o stop enquanto espera um Future
+
+OFFLOAD_WORKERS = 4
+_offload_pool = None
+_offload_lock = threading.Lock()
+
+def offload(fn, *args):
+    """Roda `fn(*args)` no pool de threads e devolve o Future. Os passos
+    produzem esse Future no lugar de um deadline: quem consome (Engine ou
+    drive()) espera sem bloquear os outros jobs nem o stop, e o gerador lê
+    o resultado com .result()."""
+    global _offload_pool
+    if _offload_pool is None:
+        with _offload_lock:
+            if _offload_pool is None:
+                require(load_futures)
+                _offload_pool = ThreadPoolExecutor(OFFLOAD_WORKERS, thread_name_prefix="offload")
+    return _offload_pool.submit(fn, *args)
+
+class CursorLock:
+    """Dono do cursor durante sequências de vários eventos (caminhos,
+    arrastes). Só é lido/escrito na thread que consome os geradores."""
+    __slots__ = ("owner",)
+    def __init__(self): self.owner = None
+
+def drive(gen, stop_event: threading.Event, gate: PauseGate) -> bool:
+    """Consome um gerador de passos na thread atual: espera cada deadline
+    (acordando no stop) ou Future de offload(), aplica a pausa e devolve o
+    tempo pausado."""
+    try:
+        deadline = next(gen)
+        while True:
+            if not isinstance(deadline, float):
+                while not deadline.done():
+                    if stop_event.wait(OFFLOAD_POLL): return False
+            elif deadline >= 0 and not wait_until(deadline, stop_event): return False
+            shift = gate.hold(stop_event) if gate.paused else 0.0
+            if stop_event.is_set(): return False
+            if TRACE.on:
+                t0 = time.perf_counter(); deadline = gen.send(shift)
+                TRACE.complete("step", t0, time.perf_counter())
+            else:
+                deadline = gen.send(shift)
+    except StopIteration as e:
+        return bool(e.value)
+    finally:
+        gen.close()
+
+class AutoclickRunner:
+    """Loop do autoclick sobre o ClickScheduler (usado pela UI e pela CLI).
+
+    Multi-alvo: um ClickScheduler por alvo, sempre atendendo o deadline mais
+    próximo de um heap (deadline, alvo)."""
+    def __init__(self, run: AutoclickRun, stop_event: threading.Event, backend: InputBackend | None = None,
+                 gate: PauseGate | None = None, cursor: CursorLock | None = None):
+        self.cfg = run
+        target = run.delay if not run.targets else 1.0 / sum(1.0 / t.delay for t in run.targets)
+        self.telemetry = RunTelemetry(target)
+        self.backend = TimedBackend(backend or get_backend(), self.telemetry)
+        self.stop_event = stop_event
+        self.gate = gate or PauseGate()
+        self.cursor = cursor or CursorLock()
+        self.sched = ClickScheduler(stop_event, run.policy)
+        self.scheds = [ClickScheduler(stop_event, run.policy) for _ in run.targets]
+        self.target_clicks = [0] * len(run.targets)
+        self.clicks = 0
+        self.started_at: float | None = None
+        self.ended_at: float | None = None
+
+    @property
+    def first_event_at(self) -> float | None: return self.backend.first_event_at
+
+    @property
+    def missed(self) -> int:
+        return sum(sc.missed for sc in self.scheds) if self.scheds else self.sched.missed
+
+    @property
+    def late(self) -> int:
+        return sum(sc.late for sc in self.scheds) if self.scheds else self.sched.late
+
+    def run(self) -> bool:
+        """Clica até `total` ou até o stop. Retorna True se completou."""
+        with HiResTimer():
+            return drive(self.steps(), self.stop_event, self.gate)
+
+    def steps(self):
+        if self.cfg.targets:
+            return (yield from self._steps_multi())
+        run, sched, backend, cursor = self.cfg, self.sched, self.backend, self.cursor
+        click, step, clock = backend.click, self.telemetry.step, time.perf_counter
+        stopped = self.stop_event.is_set
+        next_delay = DelayStream(run.delay, run.variation_pct, run.profile, run.seed).next
+        positioned = run.x is not None
+        sched.start(); self.started_at = sched.deadline
+        try:
+            while self.clicks < run.total:
+                shift = yield sched.deadline
+                if shift:
+                    sched.deadline += shift; self.telemetry.resync(); continue   # reancora depois da pausa
+                # clique posicionado não pode cortar o caminho/arraste de outro job
+                while positioned and cursor.owner is not None and cursor.owner is not self:
+                    yield WAIT_CURSOR
+                if stopped(): break   # quem quer que esteja dirigindo, nada sai depois do stop
+                step(sched.deadline, clock())
+                click(run.button, run.double, run.x, run.y)
+                self.clicks += 1
+                sched.advance(next_delay())
+        finally:
+            backend.release_all()
+            self.ended_at = time.perf_counter()
+        return self.clicks >= run.total
+
+    def _steps_multi(self):
+        run, backend, cursor = self.cfg, self.backend, self.cursor
+        targets, scheds, counts = run.targets, self.scheds, self.target_clicks
+        click, var = backend.click, run.variation_pct
+        step, clock, stopped = self.telemetry.step, time.perf_counter, self.stop_event.is_set
+        next_delay = [DelayStream(t.delay, var, run.profile, sub_seed(run.seed, i)).next
+                      for i, t in enumerate(targets)]
+        t0 = self.started_at = time.perf_counter()
+        for sc in scheds: sc.start(t0)
+        heap = [(t0, i) for i in range(len(targets))]
+        try:
+            while self.clicks < run.total:
+                deadline, i = heap[0]
+                shift = yield deadline
+                if shift:
+                    for sc in scheds: sc.deadline += shift
+                    heap = [(sc.deadline, j) for j, sc in enumerate(scheds)]; heapq.heapify(heap)
+                    self.telemetry.resync(); continue
+                while cursor.owner is not None and cursor.owner is not self:
+                    yield WAIT_CURSOR
+                if stopped(): break
+                t, sc = targets[i], scheds[i]
+                step(deadline, clock())
+                click(t.button, t.double, t.x, t.y)
+                self.clicks += 1; counts[i] += 1
+                sc.advance(next_delay[i]())
+                heapq.heapreplace(heap, (sc.deadline, i))
+        finally:
+            backend.release_all()
+            self.ended_at = time.perf_counter()
+        return self.clicks >= run.total
+
+    def target_rates(self) -> list[tuple[float, float, int]]:
+        """Por alvo: (cps alcançado, cps pedido, deadlines perdidos)."""
+        elapsed = (self.ended_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        return [(n / elapsed if elapsed > 0 else 0.0, 1.0 / t.delay, sc.missed)
+                for n, t, sc in zip(self.target_clicks, self.cfg.targets, self.scheds)]
+
+    def progress(self) -> str:
+        return (f"{self.clicks} cliques" + (f" ({self.missed} perdas)" if self.missed else "")
+                + (f" ({self.late} atrasados)" if self.late else ""))
+
+    def stats(self) -> dict:
+        elapsed = (self.ended_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        out = {"mode": "autoclick", "backend": self.backend.name, "clicks": self.clicks,
+               "missed": self.missed, "late": self.late, "elapsed_s": round(elapsed, 6),
+               "target_cps": round(1.0 / self.cfg.delay, 3) if self.cfg.delay > 0 else None,
+               "achieved_cps": round(self.clicks / elapsed, 3) if elapsed > 0 else None,
+               "telemetry": self.telemetry.summary()}
+        if self.cfg.targets:
+            out["target_cps"] = round(sum(1.0 / t.delay for t in self.cfg.targets), 3)
+            out["targets"] = [{"achieved_cps": round(a, 3), "target_cps": round(w, 3), "missed": m}
+                              for a, w, m in self.target_rates()]
+        return out
 
 def key_to_token(k) -> str | None:
     if isinstance(k, keyboard.KeyCode) and k.char:
-        return k.char.lower()
+        c = k.char
+        # com Ctrl segurado o Windows entrega o caractere de controle (\x06 p/ Ctrl+F)
+        if c < " " and getattr(k, "vk", None) and 0x30 <= k.vk <= 0x5A: c = chr(k.vk)
+        return c.lower()
     if isinstance(k, keyboard.Key):
         name = str(k).split(".")[-1].lower()
         if name == "page_up": return "pgup"
@@ -119,74 +997,1909 @@ def mouse_to_token(btn) -> str | None:
         return f"mouse.{name}"
     return None
 
+# modificadores dos atalhos compostos (ctrl+shift+f8); lados esquerdo/direito se fundem
+MODIFIERS = {"ctrl": "ctrl", "ctrl_l": "ctrl", "ctrl_r": "ctrl", "alt": "alt", "alt_l": "alt",
+             "alt_r": "alt", "alt_gr": "alt", "shift": "shift", "shift_l": "shift", "shift_r": "shift",
+             "cmd": "cmd", "cmd_l": "cmd", "cmd_r": "cmd"}
+MOD_ORDER = ("ctrl", "alt", "shift", "cmd")
+
+def chord_token(mods, tok: str) -> str:
+    """'ctrl+shift+f8' na ordem canônica; sem modificadores é o próprio token."""
+    return "+".join([m for m in MOD_ORDER if m in mods] + [tok])
+
 def token_label(tok: str) -> str:
+    if "+" in tok and len(tok) > 1: return "+".join(token_label(t) for t in tok.split("+"))
     if tok.startswith("mouse."): return tok.replace("mouse.", "mouse ")
     if tok == "pgup": return "PgUp"
     if tok == "pgdn": return "PgDn"
     return tok.upper()
 
 # -------- envio de inputs --------
+class InputBackend:
+    """Interface de injeção de input. Cada backend importa/usa sua lib;
+    os workers só falam com esta interface.
+
+    Backends com uma chamada por evento consultam a posição real antes de
+    mover e pulam o movimento redundante (o usuário pode ter mexido o mouse
+    entre dois cliques); os que mandam lotes põem o movimento sempre no lote."""
+    name = "base"
+
+    def __init__(self):
+        self._keys: dict[str, object] = {}   # token -> objeto nativo (resolvido uma vez)
+        self.held: set = set()               # teclas nativas pressionadas (key_down sem key_up)
+        self.held_buttons: set[str] = set()  # botões em mouse_down sem mouse_up
+
+    def _needs_move(self, x, y) -> bool:
+        return x is not None and y is not None and self.position() != (x, y)
+
+    def click(self, button: str, double: bool = False, x: int | None = None, y: int | None = None):
+        raise NotImplementedError
+
+    def move(self, x: int, y: int):
+        raise NotImplementedError
+
+    def position(self) -> tuple[int, int]:
+        raise NotImplementedError
+
+    # ---- teclas: o token é resolvido uma vez para o objeto nativo do backend ----
+    def resolve_key(self, tok: str):
+        """Objeto nativo do backend para o token, ou None se não suportado."""
+        return tok
+
+    def key(self, tok: str):
+        try:
+            return self._keys[tok]
+        except KeyError:
+            k = self._keys[tok] = self.resolve_key(tok)
+            return k
+
+    def _kdown(self, key): raise NotImplementedError
+    def _kup(self, key): raise NotImplementedError
+    def _tap(self, key): self._kdown(key); self._kup(key)
+
+    def key_down(self, key):
+        self.held.add(key); self._kdown(key)
+
+    def key_up(self, key):
+        self.held.discard(key); self._kup(key)
+
+    def tap(self, key): self._tap(key)
+
+    def press_key(self, tok: str):
+        k = self.key(tok)
+        if k is not None: self._tap(k)
+
+    # ---- botões separados (arrastar) ----
+    def _mdown(self, button: str, x, y): raise NotImplementedError
+    def _mup(self, button: str, x, y): raise NotImplementedError
+
+    def mouse_down(self, button: str, x: int | None = None, y: int | None = None):
+        self.held_buttons.add(button); self._mdown(button, x, y)
+
+    def mouse_up(self, button: str, x: int | None = None, y: int | None = None):
+        self.held_buttons.discard(button); self._mup(button, x, y)
+
+    def release_all(self):
+        for k in list(self.held): self.key_up(k)
+        for b in list(self.held_buttons): self.mouse_up(b)
+
+class PdiBackend(InputBackend):
+    name = "pydirectinput"
+
+    def __init__(self):
+        require(load_pdi)
+        super().__init__()
+
+    def click(self, button, double=False, x=None, y=None):
+        if self._needs_move(x, y): pdi.moveTo(x, y)
+        if double: pdi.doubleClick(button=button)
+        else:      pdi.click(button=button)
+
+    ALIASES = {"pgup": "pageup", "pgdn": "pagedown"}
+
+    def resolve_key(self, tok):
+        mapping = getattr(pdi, "KEYBOARD_MAPPING", None)
+        if mapping is None or tok in mapping: return tok
+        tok = self.ALIASES.get(tok, tok)
+        return tok if tok in mapping else None
+
+    def _kdown(self, key): pdi.keyDown(key)
+    def _kup(self, key): pdi.keyUp(key)
+    def _tap(self, key): pdi.press(key)
+
+    def _mdown(self, button, x, y):
+        if self._needs_move(x, y): pdi.moveTo(x, y)
+        pdi.mouseDown(button=button)
+
+    def _mup(self, button, x, y):
+        if self._needs_move(x, y): pdi.moveTo(x, y)
+        pdi.mouseUp(button=button)
+    def move(self, x, y):
+        if self._needs_move(x, y): pdi.moveTo(x, y)
+    def position(self):
+        p = pdi.position(); return int(p[0]), int(p[1])
+
+class PyAutoGuiBackend(InputBackend):
+    name = "pyautogui"
+
+    def __init__(self):
+        require(load_pyautogui)
+        super().__init__()
+
+    def click(self, button, double=False, x=None, y=None):
+        if self._needs_move(x, y): pyautogui.moveTo(x, y)
+        if double: pyautogui.doubleClick(button=button)
+        else:      pyautogui.click(button=button)
+
+    def resolve_key(self, tok): return tok if pyautogui.isValidKey(tok) else None
+    def _kdown(self, key): pyautogui.keyDown(key)
+    def _kup(self, key): pyautogui.keyUp(key)
+    def _tap(self, key): pyautogui.press(key)
+
+    def _mdown(self, button, x, y):
+        if self._needs_move(x, y): pyautogui.moveTo(x, y)
+        pyautogui.mouseDown(button=button)
+
+    def _mup(self, button, x, y):
+        if self._needs_move(x, y): pyautogui.moveTo(x, y)
+        pyautogui.mouseUp(button=button)
+    def move(self, x, y):
+        if self._needs_move(x, y): pyautogui.moveTo(x, y)
+    def position(self):
+        p = pyautogui.position(); return int(p.x), int(p.y)
+
+class PynputBackend(InputBackend):
+    name = "pynput"
+
+    NAMED = {"esc": "esc", "space": "space", "pgup": "page_up", "pgdn": "page_down", "home": "home",
+             "end": "end", "insert": "insert", "delete": "delete", "up": "up", "down": "down",
+             "left": "left", "right": "right", "tab": "tab", "enter": "enter", "backspace": "backspace"}
+
+    def __init__(self):
+        require(load_pynput)
+        super().__init__()
+        # controllers persistentes durante toda a vida do backend
+        self.mouse = mouse.Controller()
+        self.kb = keyboard.Controller()
+
+    def click(self, button, double=False, x=None, y=None):
+        if self._needs_move(x, y): self.mouse.position = (x, y)
+        self.mouse.click(getattr(mouse.Button, button), 2 if double else 1)
+
+    def resolve_key(self, tok):
+        if len(tok) == 1: return tok
+        name = self.NAMED.get(tok)
+        if name is None and tok.startswith("f") and tok[1:].isdigit(): name = tok
+        return getattr(keyboard.Key, name, None) if name else None
+
+    def _kdown(self, key): self.kb.press(key)
+    def _kup(self, key): self.kb.release(key)
+
+    def _mdown(self, button, x, y):
+        if self._needs_move(x, y): self.mouse.position = (x, y)
+        self.mouse.press(getattr(mouse.Button, button))
+
+    def _mup(self, button, x, y):
+        if self._needs_move(x, y): self.mouse.position = (x, y)
+        self.mouse.release(getattr(mouse.Button, button))
+
+    def move(self, x, y):
+        if self._needs_move(x, y): self.mouse.position = (x, y)
+    def position(self):
+        x, y = self.mouse.position; return int(x), int(y)
+
+# Virtual-keys do Windows para os tokens nomeados (letras/dígitos via VkKeyScanW)
+WIN_VK = {"esc":0x1B,"space":0x20,"pgup":0x21,"pgdn":0x22,"end":0x23,"home":0x24,"left":0x25,"up":0x26,
+          "right":0x27,"down":0x28,"insert":0x2D,"delete":0x2E,"tab":0x09,"enter":0x0D,"backspace":0x08}
+WIN_VK.update({f"f{n}": 0x6F + n for n in range(1, 25)})
+WIN_EXTENDED_VK = {0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x2D, 0x2E}
+
+class SendInputBackend(InputBackend):
+    """Windows: movimento + down + up (e o duplo clique inteiro) vão num único
+    SendInput, a partir de um buffer INPUT pré-alocado. Teclas por scancode
+    (como o pydirectinput), então funciona em jogos."""
+    name = "sendinput"
+    # botão -> (flag down, flag up, mouseData)
+    BUTTONS = {"left": (0x0002, 0x0004, 0), "right": (0x0008, 0x0010, 0), "middle": (0x0020, 0x0040, 0),
+               "x1": (0x0080, 0x0100, 1), "x2": (0x0080, 0x0100, 2)}
+    MOVE_ABS = 0x0001 | 0x8000 | 0x4000   # MOVE | ABSOLUTE | VIRTUALDESK
+    KEY_UP, KEY_SCANCODE, KEY_EXTENDED = 0x0002, 0x0008, 0x0001
+
+    def __init__(self):
+        super().__init__()
+        import ctypes
+        from ctypes import wintypes
+        class MOUSEINPUT(ctypes.Structure):
+            _fields_ = [("dx", wintypes.LONG), ("dy", wintypes.LONG), ("mouseData", wintypes.DWORD),
+                        ("dwFlags", wintypes.DWORD), ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+        class KEYBDINPUT(ctypes.Structure):
+            _fields_ = [("wVk", wintypes.WORD), ("wScan", wintypes.WORD), ("dwFlags", wintypes.DWORD),
+                        ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+        class HARDWAREINPUT(ctypes.Structure):
+            _fields_ = [("uMsg", wintypes.DWORD), ("wParamL", wintypes.WORD), ("wParamH", wintypes.WORD)]
+        class _U(ctypes.Union):
+            _fields_ = [("mi", MOUSEINPUT), ("ki", KEYBDINPUT), ("hi", HARDWAREINPUT)]
+        class INPUT(ctypes.Structure):
+            _fields_ = [("type", wintypes.DWORD), ("u", _U)]
+        self._ctypes = ctypes
+        self._user32 = ctypes.windll.user32
+        self._size = ctypes.sizeof(INPUT)
+        self._mbuf = (INPUT * 5)()   # move + 2x (down, up)
+        for inp in self._mbuf: inp.type = 0   # INPUT_MOUSE
+        self._kbuf = (INPUT * 2)()
+        for inp in self._kbuf: inp.type = 1   # INPUT_KEYBOARD
+        self._point = wintypes.POINT()
+        m = self._user32.GetSystemMetrics
+        self._vx, self._vy, self._vw, self._vh = m(76), m(77), max(2, m(78)), max(2, m(79))
+
+    def click(self, button, double=False, x=None, y=None):
+        down, up, _ = self.BUTTONS.get(button, self.BUTTONS["left"])
+        self._send_mouse(button, x, y, (down, up, down, up) if double else (down, up))
+
+    def _send_mouse(self, button, x, y, flags: tuple[int, ...]):
+        data = self.BUTTONS.get(button, self.BUTTONS["left"])[2]
+        buf, n = self._mbuf, 0
+        if x is not None and y is not None:
+            mi = buf[0].u.mi
+            mi.dx = ((x - self._vx) * 65535) // (self._vw - 1)
+            mi.dy = ((y - self._vy) * 65535) // (self._vh - 1)
+            mi.mouseData = 0; mi.dwFlags = self.MOVE_ABS
+            n = 1
+        for flag in flags:
+            mi = buf[n].u.mi
+            mi.dx = mi.dy = 0; mi.mouseData = data; mi.dwFlags = flag
+            n += 1
+        self._user32.SendInput(n, buf, self._size)
+
+    def _mdown(self, button, x, y):
+        self._send_mouse(button, x, y, (self.BUTTONS.get(button, self.BUTTONS["left"])[0],))
+
+    def _mup(self, button, x, y):
+        self._send_mouse(button, x, y, (self.BUTTONS.get(button, self.BUTTONS["left"])[1],))
+
+    def resolve_key(self, tok):
+        vk = WIN_VK.get(tok)
+        if vk is None:
+            if len(tok) != 1: return None
+            vk = self._user32.VkKeyScanW(ord(tok)) & 0xFF
+        scan = self._user32.MapVirtualKeyW(vk, 0)
+        if not scan: return None
+        return scan, self.KEY_SCANCODE | (self.KEY_EXTENDED if vk in WIN_EXTENDED_VK else 0)
+
+    def _send_keys(self, *events: tuple[int, int]):
+        for inp, (scan, flags) in zip(self._kbuf, events):
+            ki = inp.u.ki
+            ki.wVk = 0; ki.wScan = scan; ki.dwFlags = flags
+        self._user32.SendInput(len(events), self._kbuf, self._size)
+
+    def _kdown(self, key): self._send_keys(key)
+    def _kup(self, key): self._send_keys((key[0], key[1] | self.KEY_UP))
+    def _tap(self, key): self._send_keys(key, (key[0], key[1] | self.KEY_UP))
+
+    def move(self, x, y):
+        mi = self._mbuf[0].u.mi
+        mi.dx = ((x - self._vx) * 65535) // (self._vw - 1)
+        mi.dy = ((y - self._vy) * 65535) // (self._vh - 1)
+        mi.mouseData = 0; mi.dwFlags = self.MOVE_ABS
+        self._user32.SendInput(1, self._mbuf, self._size)
+
+    def position(self):
+        self._user32.GetCursorPos(self._ctypes.byref(self._point))
+        return int(self._point.x), int(self._point.y)
+
+# keysyms X11 para os tokens nomeados
+X_KEYSYMS = {"esc":"Escape","space":"space","pgup":"Prior","pgdn":"Next","home":"Home","end":"End",
+             "insert":"Insert","delete":"Delete","up":"Up","down":"Down","left":"Left","right":"Right",
+             "tab":"Tab","enter":"Return","backspace":"BackSpace"}
+X_KEYSYMS.update({f"f{n}": f"F{n}" for n in range(1, 25)})
+
+class XTestBackend(InputBackend):
+    """Linux/X11: eventos XTest enfileirados e enviados com um único flush
+    por clique/tecla (sem round-trip ao servidor)."""
+    name = "xtest"
+    BUTTONS = {"left": 1, "middle": 2, "right": 3, "x1": 8, "x2": 9}
+
+    def __init__(self):
+        require(load_xlib)
+        super().__init__()
+        self.d = xdisplay.Display()
+        self.root = self.d.screen().root
+
+    def click(self, button, double=False, x=None, y=None):
+        d, btn = self.d, self.BUTTONS.get(button, 1)
+        if x is not None and y is not None: xtest.fake_input(d, X.MotionNotify, x=x, y=y)
+        for _ in range(2 if double else 1):
+            xtest.fake_input(d, X.ButtonPress, btn)
+            xtest.fake_input(d, X.ButtonRelease, btn)
+        d.flush()
+
+    def resolve_key(self, tok):
+        ks = XK.string_to_keysym(X_KEYSYMS.get(tok, tok))
+        return (self.d.keysym_to_keycode(ks) or None) if ks else None
+
+    def _kdown(self, key):
+        xtest.fake_input(self.d, X.KeyPress, key); self.d.flush()
+
+    def _kup(self, key):
+        xtest.fake_input(self.d, X.KeyRelease, key); self.d.flush()
+
+    def _tap(self, key):
+        xtest.fake_input(self.d, X.KeyPress, key)
+        xtest.fake_input(self.d, X.KeyRelease, key)
+        self.d.flush()
+
+    def _mbutton(self, event, button, x, y):
+        if x is not None and y is not None: xtest.fake_input(self.d, X.MotionNotify, x=x, y=y)
+        xtest.fake_input(self.d, event, self.BUTTONS.get(button, 1))
+        self.d.flush()
+
+    def _mdown(self, button, x, y): self._mbutton(X.ButtonPress, button, x, y)
+    def _mup(self, button, x, y): self._mbutton(X.ButtonRelease, button, x, y)
+
+    def move(self, x, y):
+        xtest.fake_input(self.d, X.MotionNotify, x=x, y=y); self.d.flush()
+
+    def position(self):
+        p = self.root.query_pointer(); return int(p.root_x), int(p.root_y)
+
+class NullBackend(InputBackend):
+    """Não injeta nada: mede só o custo do engine (benchmarks, máquinas sem display)."""
+    name = "null"
+
+    def __init__(self):
+        super().__init__()
+        self._pos = (0, 0)
+
+    def click(self, button, double=False, x=None, y=None):
+        if x is not None and y is not None: self._pos = (x, y)
+
+    def _kdown(self, key): pass
+    def _kup(self, key): pass
+    def _tap(self, key): pass
+
+    def _mdown(self, button, x, y):
+        if x is not None and y is not None: self._pos = (x, y)
+
+    def _mup(self, button, x, y):
+        if x is not None and y is not None: self._pos = (x, y)
+    def move(self, x, y): self._pos = (x, y)
+    def position(self): return self._pos
+
+REC_CLICK, REC_DOUBLE, REC_KEY, REC_MOVE, REC_KEY_DOWN, REC_KEY_UP, REC_BTN_DOWN, REC_BTN_UP = range(8)
+
+class RecordingBackend(NullBackend):
+    """Registra cada chamada (perf_counter_ns, tipo, x, y) num buffer circular
+    pré-alocado; opcionalmente repassa para outro backend (`inner`)."""
+    name = "recording"
+
+    def __init__(self, capacity: int = 1 << 16, inner: InputBackend | None = None):
+        super().__init__()
+        self.capacity = capacity
+        self.inner = inner
+        self.ts = array("q", bytes(8 * capacity))
+        self.kind = array("B", bytes(capacity))
+        self.xs = array("i", bytes(4 * capacity))
+        self.ys = array("i", bytes(4 * capacity))
+        self.count = 0   # total de chamadas (pode passar da capacidade)
+
+    def _rec(self, kind: int, x, y):
+        i = self.count % self.capacity
+        self.ts[i] = time.perf_counter_ns(); self.kind[i] = kind
+        self.xs[i] = -1 if x is None else x; self.ys[i] = -1 if y is None else y
+        self.count += 1
+
+    def click(self, button, double=False, x=None, y=None):
+        self._rec(REC_DOUBLE if double else REC_CLICK, x, y)
+        if self.inner: self.inner.click(button, double, x, y)
+        else: super().click(button, double, x, y)
+
+    def resolve_key(self, tok): return self.inner.resolve_key(tok) if self.inner else tok
+
+    def _kdown(self, key):
+        self._rec(REC_KEY_DOWN, None, None)
+        if self.inner: self.inner._kdown(key)
+
+    def _kup(self, key):
+        self._rec(REC_KEY_UP, None, None)
+        if self.inner: self.inner._kup(key)
+
+    def _tap(self, key):
+        self._rec(REC_KEY, None, None)
+        if self.inner: self.inner._tap(key)
+
+    def _mdown(self, button, x, y):
+        self._rec(REC_BTN_DOWN, x, y)
+        if self.inner: self.inner._mdown(button, x, y)
+        else: super()._mdown(button, x, y)
+
+    def _mup(self, button, x, y):
+        self._rec(REC_BTN_UP, x, y)
+        if self.inner: self.inner._mup(button, x, y)
+        else: super()._mup(button, x, y)
+
+    def move(self, x, y):
+        self._rec(REC_MOVE, x, y)
+        if self.inner: self.inner.move(x, y)
+        else: super().move(x, y)
+
+    def position(self): return self.inner.position() if self.inner else super().position()
+
+    def events(self) -> list[tuple[int, int, int, int]]:
+        """Eventos retidos, do mais antigo ao mais novo: (ts_ns, tipo, x, y)."""
+        n = min(self.count, self.capacity)
+        first = self.count - n
+        idx = [(first + j) % self.capacity for j in range(n)]
+        return [(self.ts[i], self.kind[i], self.xs[i], self.ys[i]) for i in idx]
+
+BACKENDS = {"sendinput": SendInputBackend, "xtest": XTestBackend, "pydirectinput": PdiBackend,
+            "pyautogui": PyAutoGuiBackend, "pynput": PynputBackend,
+            "null": NullBackend, "recording": RecordingBackend}
+
+def backend_available(name: str) -> bool:
+    if name == "sendinput": return sys.platform == "win32"
+    if name == "xtest": return sys.platform.startswith("linux") and bool(os.environ.get("DISPLAY")) and installed("Xlib")
+    if name in ("pydirectinput", "pyautogui", "pynput"): return installed(name)
+    return name in BACKENDS
+
+def make_backend(name: str = "auto") -> InputBackend:
+    """Cria o backend pedido; 'auto' (ou indisponível) escolhe o primeiro
+    disponível, preferindo os que injetam em lote (sendinput/xtest)."""
+    if name != "auto" and backend_available(name):
+        try:
+            return BACKENDS[name]()
+        except Exception as e:
+            print(f"Backend '{name}' falhou ao iniciar:", repr(e))
+    if name != "auto":
+        print(f"Backend '{name}' indisponível, usando auto.")
+    for cand in ("sendinput", "xtest", "pydirectinput", "pyautogui", "pynput"):
+        if not backend_available(cand): continue
+        try:
+            return BACKENDS[cand]()
+        except Exception as e:
+            print(f"Backend '{cand}' falhou ao iniciar:", repr(e))
+    print("Nenhum backend de input disponível, usando null.")
+    return NullBackend()
+
+_backend: InputBackend | None = None
+
+def get_backend() -> InputBackend:
+    global _backend
+    if _backend is None: _backend = make_backend()
+    return _backend
+
+def set_backend(b: InputBackend | str) -> InputBackend:
+    global _backend
+    _backend = make_backend(b) if isinstance(b, str) else b
+    return _backend
+
 def do_mouse_click(button: str, double: bool, x: int | None = None, y: int | None = None):
-    if HAVE_PDI:
-        if x is not None and y is not None: pdi.moveTo(x, y)
-        if double:
-            if x is None: pdi.doubleClick(button=button)
-            else:         pdi.doubleClick(x=x, y=y, button=button)
+    get_backend().click(button, double, x, y)
+
+def press_key_token(tok: str):
+    get_backend().press_key(tok)
+
+# ------------ caminhos do mouse -------------
+PATH_GAP_NS = 100_000_000   # parada maior que isso quebra o caminho (vira delay = hover)
+PATH_MAX_POINTS = 2048      # pontos brutos por bloco antes de simplificar
+
+def simplify_path(pts: list[tuple[int, int, int]], tol: float) -> list[tuple[int, int, int]]:
+    """Ramer–Douglas–Peucker iterativo sobre (x, y); o terceiro campo (tempo)
+    acompanha os vértices mantidos."""
+    n = len(pts)
+    if n <= 2 or tol <= 0: return list(pts)
+    keep = bytearray(n); keep[0] = keep[-1] = 1
+    tol2 = tol * tol
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        ax, ay = pts[a][0], pts[a][1]
+        dx, dy = pts[b][0] - ax, pts[b][1] - ay
+        l2 = dx*dx + dy*dy
+        best, idx = -1.0, -1
+        for i in range(a + 1, b):
+            px, py = pts[i][0] - ax, pts[i][1] - ay
+            if l2:
+                c = px*dy - py*dx; d2 = c*c / l2
+            else:
+                d2 = px*px + py*py
+            if d2 > best: best, idx = d2, i
+        if best > tol2:
+            keep[idx] = 1
+            stack.append((a, idx)); stack.append((idx, b))
+    return [p for p, k in zip(pts, keep) if k]
+
+class PathRecorder:
+    """Acumula movimentos (x, y, ts_ns) e entrega blocos já simplificados.
+    Memória limitada a PATH_MAX_POINTS pontos brutos por vez."""
+    def __init__(self, tolerance: float):
+        self.tolerance = tolerance
+        self._pts: list[tuple[int, int, int]] = []
+
+    def add(self, x: int, y: int, ts: int) -> list[tuple[int, int, int]] | None:
+        """Adiciona um ponto; devolve o bloco anterior se ele terminou aqui."""
+        out = None
+        pts = self._pts
+        if pts and (ts - pts[-1][2] > PATH_GAP_NS or len(pts) >= PATH_MAX_POINTS):
+            last = pts[-1]
+            out = self.flush()
+            if ts - last[2] <= PATH_GAP_NS: self._pts.append(last)   # bloco contínuo
+        self._pts.append((x, y, ts))
+        return out
+
+    def flush(self) -> list[tuple[int, int, int]] | None:
+        pts, self._pts = self._pts, []
+        return simplify_path(pts, self.tolerance) if pts else None
+
+def path_step(pts: list[tuple[int, int, int]]) -> dict:
+    """Passo 'path' com tempos em ms relativos ao primeiro vértice."""
+    t0 = pts[0][2]
+    return {"kind": "path", "value": {"points": [[x, y, (t - t0) // 1_000_000] for x, y, t in pts]}}
+
+# ------------ captura de região e passos de espera -------------
+# Os passos wait_* leem só o retângulo pedido (1 px a alguns milhares), nunca
+# a tela inteira: mss (BitBlt/XGetImage direto) se instalado, senão
+# PIL.ImageGrab com bbox e, por último, pyautogui.screenshot(region=...).
+def load_mss():
+    global mss
+    import mss
+
+def load_imagegrab():
+    global ImageGrab
+    from PIL import ImageGrab
+
+class RegionGrabber:
+    """Captura retângulos da tela como bytes RGB (w*h*3, linha a linha).
+    O objeto do mss não pode trocar de thread: cada thread cria o seu."""
+    def __init__(self):
+        self.name = ("mss" if installed("mss") and lazy_import(load_mss) else
+                     "pil" if installed("PIL") and lazy_import(load_imagegrab) else "pyautogui")
+        self._local = threading.local()
+        self._bounds: tuple[int, int, int, int] | None = None
+        self.grabs = 0
+
+    def _sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None: sct = self._local.sct = mss.mss()
+        return sct
+
+    def bounds(self) -> tuple[int, int, int, int]:
+        """(x, y, w, h) da tela virtual (todos os monitores), lido uma vez."""
+        if self._bounds is None:
+            if self.name == "mss":
+                m = self._sct().monitors[0]
+                self._bounds = (m["left"], m["top"], m["width"], m["height"])
+            elif self.name == "pil":
+                self._bounds = (0, 0, *ImageGrab.grab(all_screens=True).size)
+            else:
+                require(load_pyautogui)
+                self._bounds = (0, 0, *pyautogui.size())
+        return self._bounds
+
+    def grab(self, x: int, y: int, w: int, h: int) -> bytes:
+        self.grabs += 1
+        if self.name == "mss":
+            return self._sct().grab({"left": x, "top": y, "width": w, "height": h}).rgb
+        if self.name == "pil":
+            img = ImageGrab.grab(bbox=(x, y, x + w, y + h), all_screens=True)
         else:
-            if x is None: pdi.click(button=button)
-            else:         pdi.click(x=x, y=y, button=button)
+            require(load_pyautogui)
+            img = pyautogui.screenshot(region=(x, y, w, h))
+        return img.convert("RGB").tobytes()
+
+_grabber: RegionGrabber | None = None
+
+def get_grabber() -> RegionGrabber:
+    global _grabber
+    if _grabber is None: _grabber = RegionGrabber()
+    return _grabber
+
+def region_hash(buf: bytes) -> str:
+    return hashlib.blake2b(buf, digest_size=8).hexdigest()
+
+def parse_color(v) -> tuple[int, int, int]:
+    """'#rrggbb' ou [r, g, b]."""
+    if isinstance(v, str):
+        v = v.strip().lstrip("#")
+        if len(v) != 6: raise ValueError(f"cor inválida: {v!r}")
+        return int(v[0:2], 16), int(v[2:4], 16), int(v[4:6], 16)
+    r, g, b = (max(0, min(255, int(c))) for c in v)
+    return r, g, b
+
+WAIT_MODES = ("color", "hash", "change")
+WAIT_ON_TIMEOUT = ("continue", "stop")
+WAIT_REGION_PX = 32   # lado da região do "esperar mudança" criada pela UI, centrada no cursor
+
+@dataclass(frozen=True)
+class WaitSpec:
+    """Espera até a região (x, y, w, h) satisfazer `mode`, lendo-a `rate_hz`
+    vezes por segundo. color: `threshold` dos pixels a até `tolerance` (por
+    canal) de `color`; hash: blake2b dos bytes igual a `hash`; change:
+    `threshold` dos pixels diferem (> tolerance) da leitura inicial."""
+    mode: str = "color"
+    x: int = 0
+    y: int = 0
+    w: int = 1
+    h: int = 1
+    color: tuple[int, int, int] = (0, 0, 0)
+    hash: str = ""
+    tolerance: int = 0
+    threshold: float = 1.0
+    timeout: float = 10.0        # 0 = sem limite
+    rate_hz: float = 30.0
+    button: str = ""             # clica no centro da região quando bater
+    on_timeout: str = "continue"
+
+    @property
+    def pixel(self) -> bool: return self.mode == "color" and self.w == self.h == 1
+
+def wait_spec(step: dict) -> WaitSpec:
+    """Valida um passo wait_pixel/wait_region (levanta ValueError/KeyError)."""
+    v = step.get("value") or {}
+    pixel = step.get("kind") == "wait_pixel"
+    mode = "color" if pixel else str(v.get("mode", "color"))
+    if mode not in WAIT_MODES: raise ValueError(f"modo de espera inválido: {mode!r}")
+    w, h = (1, 1) if pixel else (max(1, int(v.get("w", 1))), max(1, int(v.get("h", 1))))
+    on_timeout = str(v.get("on_timeout", "continue"))
+    return WaitSpec(mode=mode, x=int(v["x"]), y=int(v["y"]), w=w, h=h,
+                    color=parse_color(v["color"]) if mode == "color" else (0, 0, 0),
+                    hash=str(v["hash"]).lower() if mode == "hash" else "",
+                    tolerance=max(0, min(255, int(v.get("tolerance", 0)))),
+                    threshold=max(0.0, min(1.0, float(v.get("threshold", 0.01 if mode == "change" else 1.0)))),
+                    timeout=max(0.0, float(v.get("timeout", 10.0))),
+                    rate_hz=max(1.0, min(1000.0, float(v.get("rate_hz", 30.0)))),
+                    button=str(v.get("button") or ""),
+                    on_timeout=on_timeout if on_timeout in WAIT_ON_TIMEOUT else "continue")
+
+def wait_step(spec: WaitSpec) -> dict:
+    """Volta ao esquema de `macro_steps`, só com os campos fora do padrão."""
+    v: dict = {"x": spec.x, "y": spec.y}
+    if not spec.pixel: v.update(mode=spec.mode, w=spec.w, h=spec.h)
+    if spec.mode == "color": v["color"] = "#%02x%02x%02x" % spec.color
+    if spec.mode == "hash": v["hash"] = spec.hash
+    default = WaitSpec(threshold=0.01 if spec.mode == "change" else 1.0)
+    for f in ("tolerance", "threshold", "timeout", "rate_hz", "button", "on_timeout"):
+        if getattr(spec, f) != getattr(default, f): v[f] = getattr(spec, f)
+    return {"kind": "wait_pixel" if spec.pixel else "wait_region", "value": v}
+
+def wait_matcher(spec: WaitSpec):
+    """matches(buf, ref) -> bool para a região de `spec`. Com NumPy a
+    comparação é vetorizada; sem, percorre os bytes (regiões pequenas)."""
+    n = spec.w * spec.h
+    need = max(1, math.ceil(spec.threshold * n))
+    tol = spec.tolerance
+    if spec.mode == "hash":
+        return lambda buf, ref: region_hash(buf) == spec.hash
+    if installed("numpy") and lazy_import(load_numpy):
+        if spec.mode == "color":
+            target = np.array(spec.color, dtype=np.int16)
+            def matches(buf, ref):
+                px = np.frombuffer(buf, dtype=np.uint8).reshape(-1, 3).astype(np.int16)
+                return int(np.count_nonzero(np.abs(px - target).max(axis=1) <= tol)) >= need
+        else:
+            def matches(buf, ref):
+                if buf == ref: return False
+                a = np.frombuffer(buf, dtype=np.uint8).reshape(-1, 3).astype(np.int16)
+                b = np.frombuffer(ref, dtype=np.uint8).reshape(-1, 3).astype(np.int16)
+                return int(np.count_nonzero(np.abs(a - b).max(axis=1) > tol)) >= need
+        return matches
+    if spec.mode == "color":
+        r, g, b = spec.color
+        exact = bytes(spec.color) * n if tol == 0 and need == n else None
+        def matches(buf, ref):
+            if exact is not None: return buf == exact
+            hits = 0
+            for i in range(0, 3 * n, 3):
+                if abs(buf[i] - r) <= tol and abs(buf[i+1] - g) <= tol and abs(buf[i+2] - b) <= tol:
+                    hits += 1
+                    if hits >= need: return True
+            return False
     else:
-        if double:
-            if x is None: pyautogui.doubleClick(button=button)
-            else:         pyautogui.doubleClick(x=x, y=y, button=button)
+        def matches(buf, ref):
+            if buf == ref: return False
+            hits = 0
+            for i in range(0, 3 * n, 3):
+                if (abs(buf[i] - ref[i]) > tol or abs(buf[i+1] - ref[i+1]) > tol
+                        or abs(buf[i+2] - ref[i+2]) > tol):
+                    hits += 1
+                    if hits >= need: return True
+            return False
+    return matches
+
+# ------------ busca de imagem (find_click) -------------
+# Localiza um recorte (template) na tela sem varrer a tela inteira a cada
+# passo: 1) janela pequena ao redor do último acerto; 2) senão, pirâmide na
+# ROI (ou na tela): correlação normalizada na imagem reduzida 2**L vezes e
+# refinamento em resolução cheia só ao redor dos melhores candidatos. Com
+# OpenCV (cv2) a correlação é a dele; sem, FFT + imagens integrais no NumPy.
+TEMPLATES_DIR = MACROS_DIR / "templates"
+FIND_CACHE_MARGIN = 16    # px ao redor do último acerto
+FIND_MIN_SIDE = 8         # lado mínimo do template no nível mais reduzido
+FIND_MAX_LEVEL = 3
+FIND_CANDIDATES = 3       # candidatos do nível reduzido refinados em resolução cheia
+FIND_COARSE_SLACK = 0.4   # reduzida, a correlação cai (fase dos blocos): aceita candidatos abaixo do limiar
+FIND_TEMPLATE_PX = 48     # lado do recorte criado pela UI
+FIND_CACHE_SIZE = 64      # templates (e pirâmides) mantidos entre execuções
+
+def load_cv2():
+    global cv2
+    import cv2
+
+def load_pil():
+    global Image
+    from PIL import Image
+
+def template_path(name: str) -> Path:
+    p = Path(name)
+    return p if p.is_absolute() else TEMPLATES_DIR / p
+
+def rgb_view(buf: bytes, w: int, h: int):
+    return np.frombuffer(buf, dtype=np.uint8).reshape(h, w, 3)
+
+def gray(rgb):
+    """RGB (h, w, 3) -> cinza float32 (pesos do ITU-R 601, os do 'L' do PIL e do cv2)."""
+    return rgb.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+def box_down(a, f: int):
+    """Média de blocos f x f (cinza ou RGB) em float32; sobras das bordas
+    são descartadas. Somas com passo: sem cópia da imagem inteira em float."""
+    h, w = a.shape[0] // f, a.shape[1] // f
+    if _loaded.get("load_cv2"):
+        return cv2.resize(a, (w, h), interpolation=cv2.INTER_AREA).astype(np.float32)
+    a = a[:h*f, :w*f]
+    rows = a[0::f].astype(np.float32)
+    for i in range(1, f): rows += a[i::f]
+    out = rows[:, 0::f].copy()
+    for j in range(1, f): out += rows[:, j::f]
+    out *= 1.0 / (f * f)
+    return out
+
+def _fast_len(n: int) -> int:
+    """Menor 2^a·3^b·5^c ≥ n: tamanhos primos deixam a FFT várias vezes mais lenta."""
+    best = 1 << (n - 1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            p = p35
+            while p < n: p *= 2
+            best = min(best, p)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+def load_template(path: Path):
+    if _loaded.get("load_cv2"):
+        img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if img is None: raise FileNotFoundError(f"template não encontrado: {path}")
+        return img.astype(np.float32)
+    require(load_pil)
+    with Image.open(path) as im:
+        return np.asarray(im.convert("L"), dtype=np.float32)
+
+def save_template(path: Path, buf: bytes, w: int, h: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if installed("PIL") and lazy_import(load_pil):
+        Image.frombytes("RGB", (w, h), buf).save(path)
+    else:
+        require(load_numpy); require(load_cv2)
+        cv2.imwrite(str(path), np.frombuffer(buf, dtype=np.uint8).reshape(h, w, 3)[:, :, ::-1])
+
+def match_template(img, tpl):
+    """Mapa de correlação normalizada (TM_CCOEFF_NORMED) em cada posição
+    válida do template dentro de `img`, ou None se não couber."""
+    th, tw = tpl.shape; ih, iw = img.shape
+    if ih < th or iw < tw: return None
+    if _loaded.get("load_cv2"): return cv2.matchTemplate(img, tpl, cv2.TM_CCOEFF_NORMED)
+    n = th * tw
+    t = tpl.astype(np.float64); t -= t.mean()
+    tnorm = math.sqrt(float((t * t).sum()))
+    out = np.zeros((ih - th + 1, iw - tw + 1))
+    if tnorm == 0: return out   # template liso não tem correlação definida
+    a = img.astype(np.float64)
+    shape = (_fast_len(ih + th - 1), _fast_len(iw + tw - 1))
+    num = np.fft.irfft2(np.fft.rfft2(a, shape) * np.fft.rfft2(t[::-1, ::-1], shape), shape)[th-1:ih, tw-1:iw]
+    def box(v):   # soma de cada janela th x tw via imagem integral
+        ii = np.zeros((ih + 1, iw + 1)); ii[1:, 1:] = v.cumsum(0).cumsum(1)
+        return ii[th:, tw:] - ii[:-th, tw:] - ii[th:, :-tw] + ii[:-th, :-tw]
+    s1 = box(a)
+    var = box(a * a) - s1 * s1 / n
+    ok = var > 1e-2 * n   # janelas lisas ficam em 0 (o erro da FFT domina)
+    np.divide(num, np.sqrt(np.where(ok, var, 1.0)) * tnorm, out=out, where=ok)
+    return np.clip(out, -1.0, 1.0, out=out)
+
+def _peaks(res, k: int, floor: float, w: int, h: int) -> list[tuple[int, int, float]]:
+    """Até `k` máximos ≥ floor, suprimindo a vizinhança (w x h) de cada um."""
+    res = res.copy(); out = []
+    for _ in range(k):
+        y, x = divmod(int(res.argmax()), res.shape[1])
+        score = float(res[y, x])
+        if score < floor: break
+        out.append((x, y, score))
+        res[max(0, y - h // 2):y + h // 2 + 1, max(0, x - w // 2):x + w // 2 + 1] = -1.0
+    return out
+
+@dataclass(frozen=True)
+class FindSpec:
+    """Passo find_click: acha `template` (PNG, relativo a TEMPLATES_DIR) com
+    correlação ≥ threshold dentro de `roi` (x, y, w, h; None = tela toda),
+    tentando `rate_hz` vezes por segundo até `timeout`, e clica no centro + offset."""
+    template: str
+    threshold: float = 0.9
+    roi: tuple[int, int, int, int] | None = None
+    timeout: float = 5.0
+    rate_hz: float = 10.0
+    button: str = "left"      # "" = só espera aparecer
+    offset: tuple[int, int] = (0, 0)
+    on_timeout: str = "continue"
+
+def find_spec(step: dict) -> FindSpec:
+    """Valida um passo find_click (levanta ValueError/KeyError)."""
+    v = step.get("value") or {}
+    roi = v.get("roi")
+    if roi is not None:
+        x, y, w, h = (int(c) for c in roi)
+        if w < 1 or h < 1: raise ValueError(f"roi inválida: {roi!r}")
+        roi = (x, y, w, h)
+    dx, dy = (int(c) for c in v.get("offset", (0, 0)))
+    on_timeout = str(v.get("on_timeout", "continue"))
+    return FindSpec(template=str(v["template"]), roi=roi,
+                    threshold=max(0.0, min(1.0, float(v.get("threshold", 0.9)))),
+                    timeout=max(0.0, float(v.get("timeout", 5.0))),
+                    rate_hz=max(0.5, min(200.0, float(v.get("rate_hz", 10.0)))),
+                    button=str(v.get("button", "left") or ""), offset=(dx, dy),
+                    on_timeout=on_timeout if on_timeout in WAIT_ON_TIMEOUT else "continue")
+
+def find_step(spec: FindSpec) -> dict:
+    """Volta ao esquema de `macro_steps`, só com os campos fora do padrão."""
+    v: dict = {"template": spec.template}
+    default = FindSpec(spec.template)
+    for f in ("threshold", "roi", "timeout", "rate_hz", "button", "offset", "on_timeout"):
+        val = getattr(spec, f)
+        if val != getattr(default, f): v[f] = list(val) if isinstance(val, tuple) else val
+    return {"kind": "find_click", "value": v}
+
+class TemplateFinder:
+    """Pirâmide do template de um FindSpec e o último acerto (coordenadas
+    de tela), reaproveitados entre as tentativas, voltas e execuções."""
+    def __init__(self, spec: FindSpec, image=None):
+        require(load_numpy)
+        if installed("cv2"): lazy_import(load_cv2)
+        self.spec = spec
+        # `image` (cinza float32) dispensa o arquivo: usado pelo bench.py
+        pyr = [load_template(template_path(spec.template)) if image is None else image]
+        while len(pyr) <= FIND_MAX_LEVEL and min(pyr[0].shape) >> len(pyr) >= FIND_MIN_SIDE:
+            pyr.append(box_down(pyr[0], 1 << len(pyr)))
+        self.pyr = pyr
+        self.level = len(pyr) - 1
+        self.h, self.w = pyr[0].shape
+        self.last: tuple[int, int] | None = None
+
+    def _best(self, img, tpl) -> tuple[int, int, float] | None:
+        res = match_template(img, tpl)
+        if res is None: return None
+        y, x = divmod(int(res.argmax()), res.shape[1])
+        return x, y, float(res[y, x])
+
+    def locate(self, grabber) -> tuple[int, int, float, bool] | None:
+        """(x, y, correlação, veio do cache) do canto do melhor acerto ≥
+        threshold, ou None."""
+        spec, w, h, L = self.spec, self.w, self.h, self.level
+        ax, ay, aw, ah = spec.roi or grabber.bounds()
+        if self.last is not None:
+            m, (lx, ly) = FIND_CACHE_MARGIN, self.last
+            x0, y0 = max(ax, lx - m), max(ay, ly - m)
+            x1, y1 = min(ax + aw, lx + w + m), min(ay + ah, ly + h + m)
+            if x1 - x0 >= w and y1 - y0 >= h:
+                best = self._best(gray(rgb_view(grabber.grab(x0, y0, x1 - x0, y1 - y0), x1 - x0, y1 - y0)),
+                                  self.pyr[0])
+                if best is not None and best[2] >= spec.threshold:
+                    self.last = (x0 + best[0], y0 + best[1])
+                    return (*self.last, best[2], True)
+        rgb = rgb_view(grabber.grab(ax, ay, aw, ah), aw, ah)
+        if L == 0:
+            found = self._best(gray(rgb), self.pyr[0])
         else:
-            if x is None: pyautogui.click(button=button)
-            else:         pyautogui.click(x=x, y=y, button=button)
+            # só o nível reduzido vira cinza inteiro; o cheio, só nas janelas
+            res = match_template(gray(box_down(rgb, 1 << L)), self.pyr[L])
+            cands = [] if res is None else _peaks(res, FIND_CANDIDATES, spec.threshold - FIND_COARSE_SLACK,
+                                                  self.pyr[L].shape[1], self.pyr[L].shape[0])
+            found, r = None, 2 << L   # a posição reduzida erra até 2**L px
+            for cx, cy, _ in cands:
+                fx, fy = cx << L, cy << L
+                x0, y0 = max(0, fx - r), max(0, fy - r)
+                best = self._best(gray(rgb[y0:fy + h + r, x0:fx + w + r]), self.pyr[0])
+                if best is not None and (found is None or best[2] > found[2]):
+                    found = (x0 + best[0], y0 + best[1], best[2])
+        if found is None or found[2] < spec.threshold: return None
+        self.last = (ax + found[0], ay + found[1])
+        return (*self.last, found[2], False)
 
-def press_key_token(tok: str):
-    if HAVE_PDI:
-        pdi.press(tok); return
-    from pynput import keyboard as _kb
-    ctrl = _kb.Controller()
-    key_map = {"esc":_kb.Key.esc,"space":_kb.Key.space,"pgup":_kb.Key.page_up,"pgdn":_kb.Key.page_down,
-               "home":_kb.Key.home,"end":_kb.Key.end,"insert":_kb.Key.insert,"delete":_kb.Key.delete,
-               "up":_kb.Key.up,"down":_kb.Key.down,"left":_kb.Key.left,"right":_kb.Key.right,
-               "tab":_kb.Key.tab,"enter":_kb.Key.enter,"backspace":_kb.Key.backspace}
-    if tok.startswith("f") and tok[1:].isdigit():
-        n = int(tok[1:])
-        if 1 <= n <= 24:
-            k = getattr(_kb.Key, f"f{n}")
-            ctrl.press(k); ctrl.release(k); return
-    if tok in key_map:
-        k = key_map[tok]; ctrl.press(k); ctrl.release(k); return
-    if len(tok) == 1:
-        ctrl.press(tok); ctrl.release(tok)
+_finders: OrderedDict[tuple, TemplateFinder] = OrderedDict()
+
+def get_finder(spec: FindSpec) -> TemplateFinder:
+    """TemplateFinder do passo, refeito se o arquivo do template mudar."""
+    path = template_path(spec.template)
+    try: key = (spec, path.stat().st_mtime_ns)
+    except OSError: raise FileNotFoundError(f"template não encontrado: {path}") from None
+    f = _finders.get(key)
+    if f is None:
+        f = _finders[key] = TemplateFinder(spec)
+        while len(_finders) > FIND_CACHE_SIZE: _finders.popitem(last=False)
+    else:
+        _finders.move_to_end(key)
+    return f
+
+# ------------ macro compilada -------------
+OP_DELAY, OP_KEY, OP_CLICK, OP_KEY_DOWN, OP_KEY_UP, OP_HOLD, OP_PATH, OP_MOUSE_DOWN, OP_MOUSE_UP, OP_WAIT, OP_FIND = range(11)
+OPCODES = {"delay": OP_DELAY, "key": OP_KEY, "click": OP_CLICK,
+           "key_down": OP_KEY_DOWN, "key_up": OP_KEY_UP, "hold": OP_HOLD,
+           "path": OP_PATH, "mouse_down": OP_MOUSE_DOWN, "mouse_up": OP_MOUSE_UP,
+           "wait_pixel": OP_WAIT, "wait_region": OP_WAIT, "find_click": OP_FIND}
+KEY_OPS = (OP_KEY, OP_KEY_DOWN, OP_KEY_UP, OP_HOLD)
+
+class MacroProgram:
+    """Macro compilada em arrays: opcodes, argumento (id de tecla/botão
+    internado), coordenadas empacotadas (x,y por passo) e delays já resolvidos.
+    `offsets` é o instante de cada passo desde o início da volta; `hold`
+    e `path` ocupam `delays[i]` segundos na linha do tempo, como um delay.
+    Vértices dos caminhos ficam em `path_pts` (x, y, ms) e o caminho `a`
+    vai de path_ix[a] a path_ix[a+1] (em vértices). Passos de espera apontam
+    para `waits[a]` e os de busca de imagem para `finds[a]`; duram o que a
+    tela demorar (0 na linha do tempo)."""
+    __slots__ = ("ops", "arg", "xy", "delays", "offsets", "duration", "keys", "buttons",
+                 "path_pts", "path_ix", "waits", "finds")
+
+    def __init__(self):
+        self.ops = array("B")
+        self.arg = array("H")
+        self.xy = array("i")
+        self.delays = array("d")
+        self.offsets = array("d")
+        self.duration = 0.0
+        self.keys: list[str] = []
+        self.buttons: list[str] = []
+        self.path_pts = array("i")
+        self.path_ix = array("I", [0])
+        self.waits: list[WaitSpec] = []
+        self.finds: list[FindSpec] = []
+
+    def __len__(self): return len(self.ops)
+
+    def nbytes(self) -> int:
+        return sum(len(a) * a.itemsize for a in (self.ops, self.arg, self.xy, self.delays,
+                                                  self.offsets, self.path_pts, self.path_ix))
+
+    def copy(self) -> "MacroProgram":
+        c = MacroProgram()
+        for name in self.__slots__:
+            v = getattr(self, name)
+            setattr(c, name, v[:] if isinstance(v, (array, list)) else v)
+        return c
+
+def _intern(table: list[str], index: dict[str, int], name: str) -> int:
+    i = index.get(name)
+    if i is None:
+        i = index[name] = len(table); table.append(name)
+    return i
+
+def macro_humanizer(s: AppSettings) -> DelayStream | None:
+    """Fatores dos passos delay da macro, ou None sem variação."""
+    if s.macro_delay_variation_pct <= 0: return None
+    return DelayStream(1.0, s.macro_delay_variation_pct, s.delay_profile, sub_seed(s.humanize_seed or None, -1))
+
+def humanize_timeline(prog: MacroProgram, stream: DelayStream):
+    """Offsets e duração de uma volta com cada passo delay multiplicado por um
+    fator de `stream` (base 1.0); os passos seguintes se deslocam junto."""
+    n_delay = prog.ops.count(OP_DELAY)
+    if stream.constant or not n_delay: return prog.offsets, prog.duration
+    factors = stream.take(n_delay)
+    if _loaded.get("load_numpy"):
+        ops = np.frombuffer(prog.ops, dtype=np.uint8)
+        extra = np.zeros(len(ops))
+        mask = ops == OP_DELAY
+        extra[mask] = np.frombuffer(prog.delays)[mask] * (np.asarray(factors) - 1.0)
+        shift = np.cumsum(extra)
+        offsets = np.frombuffer(prog.offsets) + shift - extra   # só os delays *anteriores* deslocam
+        return offsets.tolist(), prog.duration + float(shift[-1])
+    offsets, shift, k = array("d", prog.offsets), 0.0, 0
+    ops, delays = prog.ops, prog.delays
+    for i in range(len(ops)):
+        offsets[i] += shift
+        if ops[i] == OP_DELAY:
+            shift += delays[i] * (factors[k] - 1.0); k += 1
+    return offsets, prog.duration + shift
+
+def compile_macro(steps: list[dict], use_recorded_delays: bool = True, forced_delay: float = 1.0) -> MacroProgram:
+    """Converte `macro_steps` (lista de dicts) num MacroProgram. Passos
+    desconhecidos são ignorados; delays já saem com a política aplicada."""
+    prog = MacroProgram()
+    key_ix: dict[str, int] = {}; btn_ix: dict[str, int] = {}
+    ops, arg, xy, delays, offsets = prog.ops, prog.arg, prog.xy, prog.delays, prog.offsets
+    forced = max(0.0, float(forced_delay))
+    t = 0.0
+    for step in steps:
+        op = OPCODES.get(step.get("kind"))
+        if op is None: continue
+        v = step.get("value") or {}
+        a = x = y = 0; d = 0.0
+        if op == OP_DELAY:
+            d = max(0.0, float(v.get("seconds", 0.0))) if use_recorded_delays else forced
+        elif op in KEY_OPS:
+            a = _intern(prog.keys, key_ix, str(v["token"]))
+            if op == OP_HOLD: d = max(0.0, float(v.get("seconds", 0.0)))
+        elif op == OP_PATH:
+            pts = v.get("points") or []
+            if not pts: continue
+            for px, py, pt in pts: prog.path_pts.extend((int(px), int(py), int(pt)))
+            a = len(prog.path_ix) - 1
+            prog.path_ix.append(prog.path_ix[-1] + len(pts))
+            x, y = int(pts[0][0]), int(pts[0][1]); d = max(0, int(pts[-1][2])) / 1000.0
+        elif op == OP_WAIT:
+            try: spec = wait_spec(step)
+            except (KeyError, TypeError, ValueError) as e:
+                print("Passo de espera inválido:", repr(e)); continue
+            a = len(prog.waits); prog.waits.append(spec)
+            x, y = spec.x, spec.y
+        elif op == OP_FIND:
+            try: spec = find_spec(step)
+            except (KeyError, TypeError, ValueError) as e:
+                print("Passo find_click inválido:", repr(e)); continue
+            a = len(prog.finds); prog.finds.append(spec)
+        else:
+            a = _intern(prog.buttons, btn_ix, str(v.get("button", "left")))
+            x = int(v["x"]); y = int(v["y"])
+        ops.append(op); arg.append(a); xy.append(x); xy.append(y); delays.append(d)
+        offsets.append(t); t += d
+    prog.duration = t
+    return prog
+
+class MacroRunner:
+    """Interpretador do MacroProgram com tabela de despacho por opcode.
+
+    Modo 'relative' encadeia os delays (comportamento antigo); 'timeline'
+    agenda cada passo em início_da_volta + offset, então o custo de injeção
+    não se acumula. Em ambos registra o drift de cada volta (duração real -
+    nominal) e o pior atraso de passo (só timeline)."""
+    def __init__(self, prog: MacroProgram, stop_event: threading.Event, timeline: bool = True,
+                 backend: InputBackend | None = None, path_rate_hz: float = 120.0,
+                 gate: PauseGate | None = None, cursor: CursorLock | None = None,
+                 humanize: DelayStream | None = None, grabber: RegionGrabber | None = None):
+        self.prog = prog
+        self.humanize = humanize   # fatores (base 1.0) aplicados aos passos delay
+        self.grabber = grabber     # só resolvido (get_grabber) se a macro tiver esperas/buscas
+        self.gate = gate or PauseGate()
+        self.cursor = cursor or CursorLock()
+        self.path_rate_hz = path_rate_hz
+        self.stop_event = stop_event
+        self.telemetry = RunTelemetry()
+        self.backend = TimedBackend(backend or get_backend(), self.telemetry)
+        self.timeline = timeline
+        self.loops_done = 0
+        self.pc = 0
+        self.loop_drift: deque[float] = deque(maxlen=10_000)
+        self.worst_late = 0.0
+        self.worst_step = -1
+        self.wait_time = Histogram()   # µs que cada passo de espera levou até bater
+        self.wait_timeouts = 0
+        self.find_time = Histogram()   # µs de cada tentativa de find_click (captura + correlação)
+        self.find_cache_hits = 0
+        self.find_timeouts = 0
+        self.find_last: dict[int, tuple[float, float, bool]] = {}   # passo -> (ms, correlação, cache)
+        self.started_at: float | None = None
+        self.ended_at: float | None = None
+
+    @property
+    def steps_done(self) -> int: return self.loops_done * len(self.prog) + self.pc
+
+    @property
+    def first_event_at(self) -> float | None: return self.backend.first_event_at
+
+    def summary(self) -> str:
+        drift = max(self.loop_drift, default=0.0)
+        txt = f"{self.loops_done} voltas • drift máx {drift*1000:.1f} ms"
+        if self.timeline:
+            txt += f" • atraso máx {self.worst_late*1000:.1f} ms (passo {self.worst_step})"
+        if self.wait_time.n:
+            txt += (f" • esperas p50 {self.wait_time.percentile(0.5)/1000:.0f} ms"
+                    f" ({self.wait_timeouts} timeouts)")
+        if self.find_time.n:
+            txt += (f" • busca p50 {self.find_time.percentile(0.5)/1000:.1f} ms"
+                    f" (cache {self.find_cache_hits}, {self.find_timeouts} timeouts)")
+        return txt
+
+    def run(self, loops: int = 0) -> bool:
+        """Executa `loops` voltas (0 = infinito). Retorna False se parado."""
+        with HiResTimer():
+            return drive(self.steps(loops), self.stop_event, self.gate)
+
+    def progress(self) -> str:
+        return f"{self.steps_done} passos • {self.loops_done} voltas"
+
+    def steps(self, loops: int = 0):
+        """Gerador dos passos (ver drive()): produz deadlines e recebe o tempo
+        pausado, que desloca o início da volta."""
+        prog, stop = self.prog, self.stop_event
+        ops, arg, xy, delays, offsets = prog.ops, prog.arg, prog.xy, prog.delays, prog.offsets
+        buttons, duration = prog.buttons, prog.duration
+        human = self.humanize if self.humanize and not self.humanize.constant else None
+        factor = human.next if human else None
+        clock, is_set = time.perf_counter, stop.is_set
+        timeline, cursor = self.timeline, self.cursor
+        backend = self.backend
+        click, tap, key_down, key_up = backend.click, backend.tap, backend.key_down, backend.key_up
+        # tokens -> objetos nativos do backend, uma vez por execução
+        natives = [backend.key(t) for t in prog.keys]
+
+        # handlers: None = passo imediato; gerador = passo que espera (yield from)
+        tel = self.telemetry
+        def sleep(deadline):
+            nonlocal start
+            shift = yield deadline
+            start += shift
+            if shift: tel.resync()
+            elif deadline >= 0: tel.late.record(int((clock() - deadline) * 1e6))
+            return shift
+        def blocking(fn, *args):
+            # captura/correlação rodam no pool (offload); o loop do engine só
+            # espera o Future. Devolve (resultado, tempo pausado)
+            nonlocal start
+            fut = offload(fn, *args)
+            shift = yield fut
+            start += shift
+            if shift: tel.resync()
+            return fut.result(), shift
+        def claim():
+            while cursor.owner is not None and cursor.owner is not self:
+                yield from sleep(WAIT_CURSOR)
+            cursor.owner = self
+        def unclaim():
+            if cursor.owner is self and not backend.held_buttons: cursor.owner = None
+        def op_delay(i):
+            self.pc = i
+            if timeline: return None
+            return sleep(clock() + (delays[i] * factor() if factor else delays[i]))
+        def op_key(i):
+            k = natives[arg[i]]
+            if k is not None: tap(k)
+        def op_click(i):
+            if cursor.owner is not None and cursor.owner is not self: return click_later(i)
+            click(buttons[arg[i]], False, xy[2*i], xy[2*i+1])
+        def click_later(i):
+            yield from claim()
+            click(buttons[arg[i]], False, xy[2*i], xy[2*i+1])
+            unclaim()
+        def op_key_down(i):
+            k = natives[arg[i]]
+            if k is not None: key_down(k)
+        def op_key_up(i):
+            k = natives[arg[i]]
+            if k is not None: key_up(k)
+        def op_hold(i):
+            k = natives[arg[i]]
+            return None if k is None else hold(i, k)
+        def hold(i, k):
+            self.pc = i
+            key_down(k)
+            try:
+                yield from sleep((start + offsets[i] if timeline else clock()) + delays[i])
+            finally:
+                key_up(k)
+
+        move, mouse_down, mouse_up = backend.move, backend.mouse_down, backend.mouse_up
+        pts, path_ix, step = prog.path_pts, prog.path_ix, 1.0 / self.path_rate_hz
+        def op_path(i): return path(i)
+        def path(i):
+            # reinterpola entre vértices na taxa configurada; o cursor fica
+            # reservado a este job do primeiro ao último ponto
+            self.pc = i
+            yield from claim()
+            try:
+                a = arg[i]; lo, hi = path_ix[a], path_ix[a+1]
+                t0 = (start + offsets[i]) if timeline else clock()
+                dur = pts[3*hi - 1] / 1000.0
+                seg, t = lo, 0.0
+                while True:
+                    while seg < hi - 2 and pts[3*(seg+1) + 2] / 1000.0 <= t: seg += 1
+                    if seg + 1 < hi:
+                        ta, tb = pts[3*seg + 2] / 1000.0, pts[3*(seg+1) + 2] / 1000.0
+                        f = 1.0 if tb <= ta else min(1.0, max(0.0, (t - ta) / (tb - ta)))
+                        xa, ya, xb, yb = pts[3*seg], pts[3*seg + 1], pts[3*(seg+1)], pts[3*(seg+1) + 1]
+                        move(round(xa + (xb - xa) * f), round(ya + (yb - ya) * f))
+                    else:
+                        move(pts[3*seg], pts[3*seg + 1])
+                    if t >= dur: return
+                    t = min(dur, t + step)
+                    t0 += yield from sleep(t0 + t)
+            finally:
+                unclaim()
+        def op_mouse_down(i):
+            if cursor.owner is not None and cursor.owner is not self: return drag_later(i)
+            cursor.owner = self   # segura o cursor até o mouse_up (arraste)
+            mouse_down(buttons[arg[i]], xy[2*i], xy[2*i+1])
+        def drag_later(i):
+            yield from claim()
+            mouse_down(buttons[arg[i]], xy[2*i], xy[2*i+1])
+        def op_mouse_up(i):
+            mouse_up(buttons[arg[i]], xy[2*i], xy[2*i+1])
+            unclaim()
+
+        waits, finds = prog.waits, prog.finds
+        if (waits or finds) and self.grabber is None: self.grabber = get_grabber()
+        grab = self.grabber.grab if waits else None
+        matchers = [wait_matcher(w) for w in waits]
+        def op_wait(i): return wait(i)
+        def wait(i):
+            # lê só a região, `rate_hz` vezes por segundo, até bater ou estourar
+            # o timeout; os passos seguintes contam a partir daqui (o tempo de
+            # espera não entra no drift da volta)
+            self.pc = i
+            spec, match = waits[arg[i]], matchers[arg[i]]
+            x, y, w, h = spec.x, spec.y, spec.w, spec.h
+            period = 1.0 / spec.rate_hz
+            t0 = t = clock()
+            limit = t0 + spec.timeout if spec.timeout > 0 else math.inf
+            ref = None
+            if spec.mode == "change":
+                ref, shift = yield from blocking(grab, x, y, w, h)
+                t += shift; limit += shift; t0 += shift
+            def probe(): return match(grab(x, y, w, h), ref)
+            while True:
+                if is_set(): return
+                hit, shift = yield from blocking(probe)
+                t += shift; limit += shift; t0 += shift
+                if hit: break
+                now = clock()
+                if now >= limit:
+                    self.wait_timeouts += 1
+                    if spec.on_timeout == "stop": stop.set()
+                    else: reanchor(i, t0)
+                    return
+                t = max(t + period, now)
+                shift = yield from sleep(min(t, limit))
+                t += shift; limit += shift; t0 += shift
+                if is_set(): return
+            self.wait_time.record(int((clock() - t0) * 1e6))
+            reanchor(i, t0)
+            if spec.button: yield from click_at(spec.button, x + w // 2, y + h // 2)
+        finders = [get_finder(f) for f in finds]   # carrega os templates antes da 1ª volta
+        def op_find(i): return find(i)
+        def find(i):
+            # tenta `rate_hz` vezes por segundo; cada tentativa olha primeiro o
+            # último acerto e só então a pirâmide na ROI
+            self.pc = i
+            spec, finder = finds[arg[i]], finders[arg[i]]
+            period = 1.0 / spec.rate_hz
+            t0 = t = clock()
+            limit = t0 + spec.timeout if spec.timeout > 0 else math.inf
+            while True:
+                if is_set(): return
+                (hit, a, b), shift = yield from blocking(timed_locate, finder)
+                t += shift; limit += shift; t0 += shift
+                if TRACE.on: TRACE.complete("find", a, b)
+                self.find_time.record(int((b - a) * 1e6))
+                if hit is not None: break
+                if b >= limit:
+                    self.find_timeouts += 1
+                    if spec.on_timeout == "stop": stop.set()
+                    else: reanchor(i, t0)
+                    return
+                t = max(t + period, b)
+                shift = yield from sleep(min(t, limit))
+                t += shift; limit += shift; t0 += shift
+                if is_set(): return
+            x, y, score, cached = hit
+            self.find_cache_hits += cached
+            self.find_last[i] = ((b - a) * 1000, score, cached)
+            reanchor(i, t0)
+            if spec.button:
+                yield from click_at(spec.button, x + finder.w // 2 + spec.offset[0], y + finder.h // 2 + spec.offset[1])
+        def timed_locate(finder):
+            a = clock()
+            hit = finder.locate(self.grabber)
+            return hit, a, clock()
+        def click_at(button, x, y):
+            if cursor.owner is not None and cursor.owner is not self:
+                yield from claim()
+                click(button, False, x, y)
+                unclaim()
+            else:
+                click(button, False, x, y)
+        def reanchor(i, t0):
+            nonlocal start
+            if timeline: start = clock() - offsets[i]
+            else: start += clock() - t0
+
+        table = (op_delay, op_key, op_click, op_key_down, op_key_up, op_hold,
+                 op_path, op_mouse_down, op_mouse_up, op_wait, op_find)
+        loops_left = math.inf if loops == 0 else loops
+        start = self.started_at = clock()
+        try:
+            while loops_left > 0:
+                if timeline:
+                    # a volta inteira é sorteada antes de começar (um lote por volta)
+                    if human: offsets, duration = humanize_timeline(prog, human)
+                    for i, op in enumerate(ops):
+                        if op != OP_DELAY:
+                            shift = yield start + offsets[i]
+                            if shift: start += shift; tel.resync()
+                            target = start + offsets[i]
+                            now = clock(); late = now - target
+                            tel.step(target, now)
+                            if late > self.worst_late: self.worst_late, self.worst_step = late, i
+                        if is_set():
+                            self.pc = i; return False
+                        w = table[op](i)
+                        if w is not None: yield from w
+                    # delay final da volta também faz parte da linha do tempo
+                    start += yield start + duration
+                else:
+                    for i, op in enumerate(ops):
+                        if is_set():
+                            self.pc = i; return False
+                        w = table[op](i)
+                        if w is not None: yield from w
+                now = clock()
+                self.loop_drift.append(now - start - (duration if timeline else prog.duration))
+                self.pc = 0; self.loops_done += 1
+                loops_left -= 1
+                if timeline:
+                    start += duration
+                    if now - start > duration: start = now  # atraso de mais de uma volta: reancora
+                else:
+                    start = now
+            return True
+        finally:
+            backend.release_all()
+            if cursor.owner is self: cursor.owner = None
+            self.ended_at = clock()
+
+    def stats(self) -> dict:
+        elapsed = (self.ended_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        return {"mode": "macro", "backend": self.backend.name, "steps": self.steps_done,
+                "loops": self.loops_done, "elapsed_s": round(elapsed, 6),
+                "max_loop_drift_ms": round(max(self.loop_drift, default=0.0) * 1000, 3),
+                "worst_step_late_ms": round(self.worst_late * 1000, 3) if self.timeline else None,
+                "worst_step": self.worst_step if self.timeline else None,
+                **({"waits": {**self.wait_time.summary(), "timeouts": self.wait_timeouts,
+                              "grabber": self.grabber.name}} if self.prog.waits else {}),
+                **({"finds": {"latency_us": self.find_time.summary(), "cache_hits": self.find_cache_hits,
+                              "timeouts": self.find_timeouts,
+                              "steps": {str(i): {"ms": round(ms, 3), "score": round(sc, 4), "cache": c}
+                                        for i, (ms, sc, c) in sorted(self.find_last.items())}}}
+                   if self.prog.finds else {}),
+                "telemetry": self.telemetry.summary()}
+
+# ------------ formato binário de macro (.mtm) -------------
+# Cabeçalho + registros de tamanho fixo + vértices dos caminhos + tabela de
+# strings, tudo little-endian. Os registros são lidos por colunas direto do
+# mmap (views com passo), sem criar um dict/tupla por passo.
+MTM_MAGIC = b"MTCM"
+MTM_VERSION = 4                              # v2: passos de espera; v3: find_click; v4: strings com tamanho u32 (v1–v3 ainda são lidas)
+MTM_HEADER = struct.Struct("<4sHHIIIId")   # magic, versão, tam. registro, passos, vértices, strings, bytes strtab, duração
+MTM_RECORD = struct.Struct("<BBHiiIdd")    # op, flags, arg, x, y, aux (vértices do path), delay, offset
+MTM_VERTEX = struct.Struct("<iii")         # x, y, ms
+MTM_STRING = struct.Struct("<BI")           # tipo, bytes UTF-8 (até v3: "<BB", no máx. 255 bytes)
+STR_KEY, STR_BUTTON, STR_WAIT, STR_FIND = 0, 1, 2, 3   # WAIT/FIND: o passo em JSON compacto
+
+def save_macro_bin(path: Path, prog: MacroProgram):
+    """Grava um MacroProgram (compilado com os delays gravados) em .mtm."""
+    strtab = bytearray()
+    waits = [json.dumps(wait_step(w), separators=(",", ":")) for w in prog.waits]
+    finds = [json.dumps(find_step(f), separators=(",", ":")) for f in prog.finds]
+    for kind, names in ((STR_KEY, prog.keys), (STR_BUTTON, prog.buttons), (STR_WAIT, waits), (STR_FIND, finds)):
+        for name in names:
+            b = name.encode("utf-8")
+            strtab += MTM_STRING.pack(kind, len(b)) + b
+    n = len(prog)
+    path_ix, aux = prog.path_ix, 0
+    out = bytearray(MTM_HEADER.pack(MTM_MAGIC, MTM_VERSION, MTM_RECORD.size, n, len(prog.path_pts) // 3,
+                                    len(prog.keys) + len(prog.buttons) + len(waits) + len(finds), len(strtab), prog.duration))
+    ops, arg, xy, delays, offsets = prog.ops, prog.arg, prog.xy, prog.delays, prog.offsets
+    pack = MTM_RECORD.pack
+    for i in range(n):
+        op = ops[i]
+        aux = path_ix[arg[i]+1] - path_ix[arg[i]] if op == OP_PATH else 0
+        out += pack(op, 0, arg[i], xy[2*i], xy[2*i+1], aux, delays[i], offsets[i])
+    pts = array("i", prog.path_pts)
+    if sys.byteorder == "big": pts.byteswap()
+    out += pts.tobytes() + strtab
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(out); os.replace(tmp, path)
+
+def _column(view: memoryview, fmt: str, size: int, offset: int, stride: int) -> array:
+    col = array(fmt)
+    col.frombytes(view.cast("B")[offset::stride].tobytes() if size == 1 else
+                  view.cast(fmt)[offset // size::stride // size].tobytes())
+    if size > 1 and sys.byteorder == "big": col.byteswap()
+    return col
+
+def load_macro_bin(path: Path, use_recorded_delays: bool = True, forced_delay: float = 1.0) -> MacroProgram:
+    """Carrega um .mtm via mmap direto para as colunas do MacroProgram."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, ver, rec_size, n, n_pts, n_str, str_len, duration = MTM_HEADER.unpack_from(mm, 0)
+        if magic != MTM_MAGIC: raise ValueError(f"{path.name}: não é um arquivo de macro")
+        if not 1 <= ver <= MTM_VERSION or rec_size != MTM_RECORD.size:
+            raise ValueError(f"{path.name}: versão {ver} não suportada")
+        prog = MacroProgram()
+        base = MTM_HEADER.size
+        with memoryview(mm)[base:base + n*rec_size] as recs:
+            prog.ops = _column(recs, "B", 1, 0, rec_size)
+            prog.arg = _column(recs, "H", 2, 2, rec_size)
+            xs, ys = _column(recs, "i", 4, 4, rec_size), _column(recs, "i", 4, 8, rec_size)
+            aux = _column(recs, "I", 4, 12, rec_size)
+            prog.delays = _column(recs, "d", 8, 16, rec_size)
+            prog.offsets = _column(recs, "d", 8, 24, rec_size)
+        xy = array("i", bytes(8 * n)); xy[0::2] = xs; xy[1::2] = ys
+        prog.xy = xy
+        base += n * rec_size
+        prog.path_pts.frombytes(mm[base:base + n_pts*MTM_VERTEX.size])
+        if sys.byteorder == "big": prog.path_pts.byteswap()
+        base += n_pts * MTM_VERTEX.size
+        strtab = mm[base:base + str_len]
+        head = MTM_STRING if ver >= 4 else struct.Struct("<BB")
+        pos = 0
+        for _ in range(n_str):
+            kind, ln = head.unpack_from(strtab, pos)
+            pos += head.size
+            text = strtab[pos:pos+ln].decode("utf-8")
+            if kind == STR_WAIT: prog.waits.append(wait_spec(json.loads(text)))
+            elif kind == STR_FIND: prog.finds.append(find_spec(json.loads(text)))
+            else: (prog.keys if kind == STR_KEY else prog.buttons).append(text)
+            pos += ln
+    # vértices por path, na ordem dos passos
+    ix = prog.path_ix
+    for op, a in zip(prog.ops, aux):
+        if op == OP_PATH: ix.append(ix[-1] + a)
+    prog.duration = duration
+    if not use_recorded_delays: retime_program(prog, forced_delay)
+    return prog
+
+def retime_program(prog: MacroProgram, forced_delay: float):
+    """Troca todos os delays por `forced_delay` e recalcula offsets/duração."""
+    forced = max(0.0, float(forced_delay))
+    t = 0.0
+    delays, offsets = prog.delays, prog.offsets
+    for i, op in enumerate(prog.ops):
+        if op == OP_DELAY: delays[i] = forced
+        offsets[i] = t; t += delays[i]
+    prog.duration = t
+
+def program_to_steps(prog: MacroProgram) -> list[dict]:
+    """Converte de volta para o esquema JSON de `macro_steps`."""
+    names = {v: k for k, v in OPCODES.items()}
+    pts, ix = prog.path_pts, prog.path_ix
+    steps = []
+    for i, op in enumerate(prog.ops):
+        a, x, y, d = prog.arg[i], prog.xy[2*i], prog.xy[2*i+1], prog.delays[i]
+        if op == OP_DELAY:   v = {"seconds": d}
+        elif op == OP_HOLD:  v = {"token": prog.keys[a], "seconds": d}
+        elif op in KEY_OPS:  v = {"token": prog.keys[a]}
+        elif op == OP_PATH:  v = {"points": [list(pts[3*j:3*j+3]) for j in range(ix[a], ix[a+1])]}
+        elif op == OP_WAIT:  steps.append(wait_step(prog.waits[a])); continue
+        elif op == OP_FIND:  steps.append(find_step(prog.finds[a])); continue
+        else:                v = {"button": prog.buttons[a], "x": x, "y": y}
+        steps.append({"kind": names[op], "value": v})
+    return steps
+
+def steps_to_bin(steps: list[dict], path: Path):
+    save_macro_bin(path, compile_macro(steps))
+
+def bin_to_steps(path: Path) -> list[dict]:
+    return program_to_steps(load_macro_bin(path))
+
+# ------------ biblioteca de macros -------------
+class MacroLibrary:
+    """Diretório com um .mtm por macro e um index.json pequeno (nome,
+    passos, duração, hash). Só o índice é lido na inicialização; os corpos
+    são carregados sob demanda num LRU limitado por `cache_bytes`."""
+    INDEX = "index.json"
+
+    def __init__(self, root: Path = MACROS_DIR, cache_bytes: int = 64 << 20):
+        self.root = root
+        self.cache_bytes = cache_bytes
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, MacroProgram] = OrderedDict()
+        self._cached_bytes = 0
+        self.index: dict[str, dict] = {}
+        try:
+            data = json.loads((root / self.INDEX).read_text(encoding="utf-8"))
+            self.index = dict(data.get("macros", {}))
+        except Exception:
+            pass
+
+    def names(self) -> list[str]: return sorted(self.index, key=str.lower)
+    def __contains__(self, name: str) -> bool: return name in self.index
+
+    @staticmethod
+    def _file_for(name: str) -> str:
+        slug = re.sub(r"[^\w.-]+", "_", name).strip("._") or "macro"
+        return f"{slug}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}.mtm"
+
+    def _write_index(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(self.root / self.INDEX, json.dumps({"version": 1, "macros": self.index}, indent=2))
+
+    def save(self, name: str, steps: list[dict]):
+        prog = compile_macro(steps)
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / self._file_for(name)
+        save_macro_bin(path, prog)
+        with self._lock:
+            self.index[name] = {"file": path.name, "steps": len(prog), "duration": prog.duration,
+                                "hash": hashlib.sha1(path.read_bytes()).hexdigest()}
+            self._evict(name)
+            self._write_index()
+
+    def delete(self, name: str):
+        with self._lock:
+            info = self.index.pop(name, None)
+            self._evict(name)
+            self._write_index()
+        if info:
+            try: (self.root / info["file"]).unlink()
+            except OSError: pass
+
+    def get(self, name: str) -> MacroProgram:
+        """Programa compilado (com os delays gravados); não modifique o retorno."""
+        with self._lock:
+            prog = self._cache.get(name)
+            if prog is not None:
+                self._cache.move_to_end(name); return prog
+            info = self.index[name]
+        prog = load_macro_bin(self.root / info["file"])
+        with self._lock:
+            if name not in self._cache:
+                self._cache[name] = prog; self._cached_bytes += prog.nbytes()
+                while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+                    _, old = self._cache.popitem(last=False); self._cached_bytes -= old.nbytes()
+        return prog
+
+    def _evict(self, name: str):
+        old = self._cache.pop(name, None)
+        if old is not None: self._cached_bytes -= old.nbytes()
+
+def resolve_macro_program(s: AppSettings, library: MacroLibrary, name: str | None = None) -> MacroProgram:
+    """Programa da macro `name` (padrão: a selecionada; biblioteca ou passos
+    gravados) com a política de delays das configurações aplicada."""
+    name = s.macro_name if name is None else name
+    if name and name in library:
+        prog = library.get(name)
+        if not s.macro_use_recorded_delays:
+            prog = prog.copy(); retime_program(prog, s.macro_forced_delay)
+        return prog
+    return compile_macro(s.macro_steps, s.macro_use_recorded_delays, s.macro_forced_delay)
+
+# ------------ engine (vários jobs numa thread) -------------
+JOB_PRIORITY = {"macro": 1, "autoclick": 0}   # quem leva o cursor primeiro quando há disputa
+
+class Job:
+    """Um runner agendado no Engine (uma task do event loop)."""
+    __slots__ = ("id", "name", "kind", "priority", "runner", "steps", "gen", "task", "resumed",
+                 "state", "result", "error", "trigger", "stop_at")
+
+    def __init__(self, id: int, name: str, kind: str, priority: int, runner, steps, trigger):
+        self.id, self.name, self.kind, self.priority, self.runner = id, name, kind, priority, runner
+        self.steps = steps or runner.steps   # fábrica do gerador (MacroRunner: lambda: r.steps(loops))
+        self.gen = None
+        self.task = None              # asyncio.Task, criada na thread do engine
+        self.resumed = None           # asyncio.Event: setado enquanto não está pausado
+        self.state = "waiting"        # waiting | running | done
+        self.result: bool | None = None
+        self.error: BaseException | None = None
+        self.trigger = trigger        # (instante do atalho, countdown) para medir latência
+        self.stop_at: float | None = None
+
+class Engine:
+    """Núcleo de execução: um event loop asyncio numa thread própria.
+
+    Cada job é uma task que consome o gerador do runner (steps()): dorme
+    com os timers do loop até perto do deadline e faz spin no final, então
+    dezenas de jobs dividem a thread sem trocas de contexto por passo. Como
+    tudo roda aqui, as chamadas de backend nunca se intercalam; sequências
+    que dependem do cursor (caminhos, arrastes) o reservam em `cursor` e os
+    demais esperam, os de maior prioridade primeiro. As outras threads
+    (UI, hooks) só entram via call_soon_threadsafe; parar é cancelar a task,
+    o que fecha o gerador ali mesmo (finally: solta teclas/botões). Nada
+    bloqueante roda no loop: capturas de tela e buscas vão para offload().
+    Sem jobs, o loop fica bloqueado no select, sem timeout."""
+    def __init__(self, on_done=None):
+        self.cursor = CursorLock()
+        self.on_done = on_done         # chamado na thread do engine ao fim de cada job
+        self.jobs: dict[int, Job] = {}
+        self.loop = None
+        self._cursor_wait: list = []   # (-prioridade, seq, future)
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._timer: HiResTimer | None = None
+
+    # ---- API (qualquer thread) ----
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="engine", daemon=True)
+                self._thread.start()
+        self._ready.wait()
+
+    def call(self, fn, *args):
+        """Agenda `fn(*args)` na thread do engine."""
+        if self.loop is None: self.start()
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def submit(self, runner, name: str, kind: str, priority: int = 0, delay: float = 0.0,
+               trigger: tuple[float, float] | None = None, steps=None) -> Job:
+        """Agenda `runner` (AutoclickRunner/MacroRunner) para daqui a `delay` s."""
+        with self._lock:
+            job = Job(next(self._ids), name, kind, priority, runner, steps, trigger)
+            self.jobs[job.id] = job
+        self.call(self._spawn, job, time.perf_counter() + max(0.0, delay))
+        return job
+
+    def stop(self, job_id: int | None = None):
+        """Para um job (ou todos, com None)."""
+        now = time.perf_counter()
+        for job in self._select(job_id):
+            if job.stop_at is None: job.stop_at = now
+            job.runner.stop_event.set(); job.runner.gate.resume()
+        self.call(self._cancel, job_id)
+
+    def pause(self, job_id: int | None = None) -> bool:
+        """Alterna a pausa de um job (ou de todos). Retorna o novo estado."""
+        jobs = self._select(job_id)
+        paused = not all(j.runner.gate.paused for j in jobs) if jobs else False
+        for j in jobs: (j.runner.gate.pause if paused else j.runner.gate.resume)()
+        self.call(self._sync_pause)
+        return paused
+
+    def find(self, kind: str, name: str) -> Job | None:
+        return next((j for j in self._select(None) if j.kind == kind and j.name == name), None)
+
+    def running(self) -> bool: return bool(self.jobs)
+
+    def _select(self, job_id: int | None) -> list[Job]:
+        with self._lock:
+            if job_id is None: return list(self.jobs.values())
+            job = self.jobs.get(job_id)
+        return [job] if job else []
+
+    # ---- thread do engine ----
+    def _run(self):
+        require(load_asyncio)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+        self.loop.run_forever()
+
+    def _spawn(self, job: Job, start: float):
+        if job.id not in self.jobs: return          # parado antes de começar
+        job.state = "running"
+        job.resumed = asyncio.Event()
+        if not job.runner.gate.paused: job.resumed.set()
+        if self._timer is None: self._timer = HiResTimer().__enter__()
+        job.task = self.loop.create_task(self._main(job, start))
+
+    def _cancel(self, job_id: int | None):
+        for job in self._select(job_id):
+            if job.task is not None: job.task.cancel()
+            elif job.state == "waiting": self._finish(job, False)
+
+    def _sync_pause(self):
+        for job in self._select(None):
+            if job.resumed is None: continue
+            (job.resumed.clear if job.runner.gate.paused else job.resumed.set)()
+
+    async def _sleep_until(self, deadline: float):
+        rem = deadline - time.perf_counter()
+        # sempre passa pelo loop: os outros jobs e o cancelamento não esperam rajadas
+        await asyncio.sleep(rem - SPIN_SECONDS if rem > SPIN_SECONDS else 0)
+        # spin cooperativo: cada volta devolve o loop aos outros jobs
+        clock = time.perf_counter
+        while clock() < deadline: await asyncio.sleep(0)
+
+    async def _cursor_free(self, job: Job):
+        fut = self.loop.create_future()
+        heapq.heappush(self._cursor_wait, (-job.priority, next(self._seq), fut))
+        self._wake_cursor()   # pode ter sido liberado entre o yield e aqui
+        await fut
+
+    def _wake_cursor(self):
+        # acorda na ordem de prioridade; cada um revalida o cursor ao retomar
+        cursor, waiting = self.cursor, self._cursor_wait
+        if not waiting or (cursor.owner is not None and not cursor.owner.stop_event.is_set()): return
+        while waiting:
+            fut = heapq.heappop(waiting)[2]
+            if not fut.done(): fut.set_result(None)
+
+    async def _main(self, job: Job, start: float):
+        result, error = False, None
+        label = f"{job.kind} {job.name or '(aba)'}"
+        try:
+            await self._sleep_until(start)
+            TRACE.instant(f"start {label}")
+            gen = job.gen = job.steps()
+            stopped = job.runner.stop_event.is_set
+            d = next(gen)
+            while True:
+                if not isinstance(d, float):   # Future de offload(): o trabalho bloqueante roda no pool
+                    await asyncio.wait((asyncio.wrap_future(d),))
+                elif d < 0: await self._cursor_free(job)
+                else: await self._sleep_until(d)
+                # stop() marca o flag antes de agendar o _cancel: se a espera
+                # acabou nesse intervalo, o passo não pode mais injetar nada
+                if stopped(): break
+                shift = 0.0
+                if not job.resumed.is_set():
+                    t0 = time.perf_counter()
+                    await job.resumed.wait()
+                    shift = time.perf_counter() - t0
+                    if stopped(): break
+                if TRACE.on:
+                    t0 = time.perf_counter(); d = gen.send(shift)
+                    TRACE.complete(label, t0, time.perf_counter())
+                else:
+                    d = gen.send(shift)
+                self._wake_cursor()
+        except StopIteration as e:
+            result = bool(e.value)
+        except asyncio.CancelledError:
+            TRACE.instant(f"cancel {label}")
+        except BaseException as e:
+            error = e
+        finally:
+            try:
+                if job.gen is not None: job.gen.close()   # roda os finally: solta teclas/botões
+            except BaseException as e:
+                error = error or e
+            self._finish(job, result, error)
+
+    def _finish(self, job: Job, result: bool, error: BaseException | None = None):
+        job.state, job.result, job.error = "done", result, error
+        with self._lock:
+            self.jobs.pop(job.id, None)
+            idle = not self.jobs
+        if self.cursor.owner is job.runner: self.cursor.owner = None
+        self._wake_cursor()
+        if idle and self._timer is not None:
+            self._timer.__exit__(); self._timer = None
+        if self.on_done:
+            try: self.on_done(job)
+            except Exception as e: print("Engine on_done:", repr(e))
 
 # ------------ Listener global -------------
-class GlobalListener(threading.Thread):
-    def __init__(self, app_ref):
-        super().__init__(daemon=True)
+EV_KEY, EV_CLICK, EV_MOVE, EV_KEYUP = 0, 1, 2, 3
+
+def build_hotkey_routes(s: AppSettings) -> dict[str, tuple[str, str]]:
+    """Tabela de atalhos: token ou acorde -> (ação, argumento). Ações: toggle,
+    stop, pause, macro (nome) e autoclick (preset). Num conflito vale a mais
+    prioritária: emergência > pausa > toggle > macros/presets."""
+    routes = {tok: ("autoclick", name) for tok, name in s.preset_hotkeys.items()}
+    routes.update({tok: ("macro", name) for tok, name in s.macro_hotkeys.items()})
+    for tok, action in ((s.hotkey_toggle, "toggle"), (s.hotkey_pause, "pause"), (s.hotkey_emergency, "stop")):
+        if tok: routes[tok] = (action, "")
+    return routes
+
+class SpscRing:
+    """Buffer circular limitado, um produtor e um consumidor, sem locks:
+    só o produtor escreve `_w` e só o consumidor escreve `_r` (o GIL
+    garante a atomicidade de cada atribuição). Cheio = evento descartado."""
+    def __init__(self, capacity: int = 4096):
+        cap = 1 << max(1, capacity - 1).bit_length()
+        self._buf: list = [None] * cap
+        self._mask = cap - 1
+        self._cap = cap
+        self._w = 0
+        self._r = 0
+        self.dropped = 0
+        # tempo gasto no callback do hook (escrito só pelo produtor)
+        self.hook_count = 0
+        self.hook_ns_total = 0
+        self.hook_ns_max = 0
+
+    def push(self, item) -> bool:
+        w = self._w
+        if w - self._r >= self._cap:
+            self.dropped += 1; return False
+        self._buf[w & self._mask] = item
+        self._w = w + 1
+        return True
+
+    def __len__(self): return self._w - self._r
+
+    def drain(self, out: list):
+        r, w, buf, mask = self._r, self._w, self._buf, self._mask
+        while r < w:
+            i = r & mask
+            out.append(buf[i]); buf[i] = None
+            r += 1
+        self._r = r
+
+    def note_hook(self, t0: int):
+        dt = time.perf_counter_ns() - t0
+        self.hook_count += 1; self.hook_ns_total += dt
+        if dt > self.hook_ns_max: self.hook_ns_max = dt
+
+class GlobalListener:
+    """Os callbacks do pynput (threads de hook do SO) só empurram
+    (perf_counter_ns, tipo, dado) num SpscRing por hook e, se nenhum
+    consumo estava pedido, acordam a thread consumidora: uma rajada de
+    eventos vira um único despertar. O consumo gera passos de macro e
+    despacha os atalhos numa thread própria, fora do loop do engine: a
+    emergência só seta os stop events e não espera nenhum job."""
+    def __init__(self, app_ref, engine: Engine):
         self.app = app_ref
+        self.engine = engine
         self.k_listener = None
         self.m_listener = None
-        self._stop = threading.Event()
-        # gravação de macro?
+        self._scheduled = False          # consumo já pedido à thread consumidora?
+        self._wake_ev = threading.Event()
+        self._consumer: threading.Thread | None = None
+        self._stop_rec_pending = False
+        self.k_ring = SpscRing()
+        self.m_ring = SpscRing(16384)    # movimentos chegam a milhares/s
+        # gravação de macro? janela [início, fim) em perf_counter_ns
         self.record_macro = False
-        self._last_event_ts: float | None = None
+        self.record_moves = False
+        self._path: PathRecorder | None = None
+        self._rec_start_ns = 0
+        self._rec_stop_ns = 0
+        self._last_event_ns: int | None = None
         # gravação de hotkeys?
-        self.record_field: str | None = None  # 'toggle'|'emergency'|None
+        self.record_field: str | None = None  # 'toggle'|'emergency'|'pause'|'macro'|'preset'|None
+        self.mods: set[str] = set()           # modificadores segurados (para os acordes)
 
-    def run(self):
-        self.k_listener = keyboard.Listener(on_press=self.on_key_press)
-        self.m_listener = mouse.Listener(on_click=self.on_click)
+    def start(self):
+        # pynput e o loop do engine importam em segundo plano; os hooks em si
+        # são threads do próprio pynput
+        threading.Thread(target=self._start_hooks, name="hooks", daemon=True).start()
+
+    def _start_hooks(self):
+        self.engine.start()
+        self._consumer = threading.Thread(target=self._consume_loop, name="hooks-consumer", daemon=True)
+        self._consumer.start()
+        if not lazy_import(load_pynput):
+            print("pynput indisponível: atalhos e gravação desativados."); return
+        self.k_listener = keyboard.Listener(on_press=self.on_key_press, on_release=self.on_key_release)
+        self.m_listener = mouse.Listener(on_click=self.on_click, on_move=self.on_move)
         self.k_listener.start(); self.m_listener.start()
-        while not self._stop.is_set():
-            time.sleep(0.05)
+
+    def _wake(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self._wake_ev.set()
+
+    def _consume_loop(self):
+        ev = self._wake_ev
+        while True:
+            ev.wait(); ev.clear()   # limpa antes de ler: um set durante o consumo não se perde
+            self._drain()
+            if self._stop_rec_pending:
+                self._stop_rec_pending = False; self._stop_rec()
+
+    @traced("listener.drain")
+    def _drain(self):
+        WAKEUPS["listener"] += 1
+        self._scheduled = False   # antes de ler: o que chegar depois agenda outro consumo
+        batch: list = []
+        self.k_ring.drain(batch); self.m_ring.drain(batch)
+        if not batch: return
+        batch.sort(key=lambda ev: ev[0])   # intercala teclado e mouse na ordem real
+        for ev in batch: self._consume(ev)
+        self.app.notify_capture()
+
+    def stop(self):
         try:
-            self.k_listener.stop(); self.m_listener.stop()
+            if self.k_listener: self.k_listener.stop()
+            if self.m_listener: self.m_listener.stop()
         except Exception: pass
 
-    def stop(self): self._stop.set()
+    def hook_stats(self) -> tuple[int, float, float, int]:
+        """(eventos, média µs, máx µs, descartados) dos callbacks de hook."""
+        n = self.k_ring.hook_count + self.m_ring.hook_count
+        total = self.k_ring.hook_ns_total + self.m_ring.hook_ns_total
+        mx = max(self.k_ring.hook_ns_max, self.m_ring.hook_ns_max)
+        return n, (total / n / 1000 if n else 0.0), mx / 1000, self.k_ring.dropped + self.m_ring.dropped
 
     def set_record_field(self, field: str | None):
         self.record_field = field
@@ -194,65 +2907,125 @@ class GlobalListener(threading.Thread):
         else:     self.app.set_status("Parado")
 
     def start_macro_rec(self):
-        self.record_macro = True
-        self._last_event_ts = time.time()
         self.app.clear_macro_steps_ui()
+        s = self.app.settings
+        self._path = PathRecorder(s.macro_path_tolerance) if s.macro_record_moves else None
+        self._rec_start_ns = time.perf_counter_ns(); self._rec_stop_ns = 0
+        self._last_event_ns = self._rec_start_ns   # a espera até o 1º evento também é um delay
+        self.record_macro = True
+        self.record_moves = s.macro_record_moves
         self.app.set_status("Gravando macro… (use 'Parar gravação' para finalizar)")
 
     def stop_macro_rec(self):
-        self.record_macro = False
-        self._last_event_ts = None
+        # eventos ainda na fila com ts anterior a este instante ainda entram
+        self._rec_stop_ns = time.perf_counter_ns()
+        self.record_moves = False
+        if self._consumer is None: self._stop_rec()
+        else: self._stop_rec_pending = True; self._wake_ev.set()
         self.app.set_status("Macro gravada.")
 
-    def on_key_press(self, k):
-        tok = key_to_token(k)
-        if not tok: return
+    def _stop_rec(self):
+        self._drain()
+        self._finish_rec()
+        self.app.notify_capture()
 
-        if self.record_field:
-            self.app.update_hotkey(self.record_field, tok)
-            self.set_record_field(None)
-            self.app.flash_info(f"Atalho definido: {token_label(tok)}")
-            return
+    def _recording(self, ts: int) -> bool:
+        return self.record_macro and ts >= self._rec_start_ns and not (self._rec_stop_ns and ts >= self._rec_stop_ns)
 
-        if self.record_macro:
-            now = time.time()
-            if self._last_event_ts is not None:
-                self.app.append_macro_delay(now - self._last_event_ts)
-            self._last_event_ts = now
-            self.app.append_macro_key(tok)
-            return
+    def _finish_rec(self):
+        self._emit_path(self._path.flush() if self._path else None)
+        self.record_macro = False
+        self._path = None
 
-        s = self.app.settings
-        if tok == s.hotkey_emergency: self.app.root.after(0, self.app.stop_all)
-        elif tok == s.hotkey_toggle:  self.app.root.after(0, self.app.toggle_start_stop)
+    def _emit_gap(self, ts: int):
+        if self._last_event_ns is not None:
+            self.app.append_macro_delay((ts - self._last_event_ns) / 1e9)
+
+    def _emit_path(self, pts):
+        if not pts: return
+        self._emit_gap(pts[0][2])
+        self.app.append_macro_step(path_step(pts))
+        self._last_event_ns = pts[-1][2]
+
+    # ---- callbacks de hook: só carimbam e enfileiram ----
+    def on_key_press(self, k):
+        t0 = time.perf_counter_ns()
+        self.k_ring.push((t0, EV_KEY, k))
+        if TRACE.on: TRACE.instant("hook.key", t0 / 1e9)
+        if not self._scheduled: self._wake()
+        self.k_ring.note_hook(t0)
+
+    def on_key_release(self, k):
+        t0 = time.perf_counter_ns()
+        self.k_ring.push((t0, EV_KEYUP, k))
+        if TRACE.on: TRACE.instant("hook.keyup", t0 / 1e9)
+        if not self._scheduled: self._wake()
+        self.k_ring.note_hook(t0)
 
     def on_click(self, x, y, button, pressed):
-        # DISPARA SÓ NO PRESS (evita duplo-toggle press+release)
-        if not pressed:
+        t0 = time.perf_counter_ns()
+        # DISPARA SÓ NO PRESS (evita duplo-toggle press+release); o release
+        # só interessa ao gravar arrastes
+        if pressed or self.record_moves:
+            self.m_ring.push((t0, EV_CLICK, (x, y, button, pressed)))
+            if TRACE.on: TRACE.instant("hook.click", t0 / 1e9)
+            if not self._scheduled: self._wake()
+        self.m_ring.note_hook(t0)
+
+    def on_move(self, x, y):
+        if not self.record_moves: return
+        t0 = time.perf_counter_ns()
+        self.m_ring.push((t0, EV_MOVE, (x, y)))
+        if not self._scheduled: self._wake()
+        self.m_ring.note_hook(t0)
+
+    # ---- consumidor ----
+    def _consume(self, ev):
+        ts, kind, data = ev
+        if kind == EV_MOVE:
+            if self._path and self._recording(ts):
+                self._emit_path(self._path.add(int(data[0]), int(data[1]), ts))
+            return
+        if kind == EV_KEYUP:
+            mod = MODIFIERS.get(key_to_token(data) or "")
+            if mod: self.mods.discard(mod)
             return
-        tok = mouse_to_token(button)
+        if kind == EV_KEY:
+            tok = key_to_token(data)
+        else:
+            tok = mouse_to_token(data[2])
         if not tok: return
+        pressed = kind == EV_KEY or data[3]
+        mod = MODIFIERS.get(tok) if kind == EV_KEY else None
+        if mod: self.mods.add(mod)
 
-        if self.record_field:
-            self.app.update_hotkey(self.record_field, tok)
-            self.set_record_field(None)
-            self.app.flash_info(f"Atalho definido: {token_label(tok)}")
+        if self.record_field and pressed:
+            if mod: return   # espera a tecla principal do acorde
+            field, tok = self.record_field, chord_token(self.mods, tok)
+            self.app.ui_call(self.app.update_hotkey, field, tok)
+            self.app.ui_call(self.set_record_field, None)
+            self.app.ui_call(self.app.flash_info, f"Atalho definido: {token_label(tok)}")
             return
 
-        if self.record_macro:
-            now = time.time()
-            if self._last_event_ts is not None:
-                self.app.append_macro_delay(now - self._last_event_ts)
-            self._last_event_ts = now
-            btn = tok.split(".", 1)[-1]  # left/right/middle/x1/x2
-            self.app.append_macro_click(btn, int(x), int(y))
+        if self._recording(ts):
+            if self._path: self._emit_path(self._path.flush())
+            self._emit_gap(ts)
+            self._last_event_ns = ts
+            if kind == EV_KEY:
+                self.app.append_macro_key(tok)
+            else:
+                btn = tok.split(".", 1)[-1]  # left/right/middle/x1/x2
+                # com movimentos, press/release viram mouse_down/up (arrastes)
+                step = ("mouse_down" if pressed else "mouse_up") if self._path else "click"
+                self.app.append_macro_click(btn, int(data[0]), int(data[1]), step)
             return
 
-        s = self.app.settings
-        if tok == s.hotkey_emergency:
-            self.app.root.after(0, self.app.stop_all)
-        elif tok == s.hotkey_toggle:
-            self.app.root.after(0, self.app.toggle_start_stop)
+        if not pressed: return
+        routes = self.app.routes
+        # o acorde exato primeiro; senão o token sozinho (Esc com Shift segurado ainda para)
+        route = routes.get(chord_token(self.mods, tok)) if self.mods and not mod else None
+        route = route or routes.get(tok)
+        if route: self.app.dispatch(*route, trigger_ns=ts)
 
 # ----------------- Tray (bandeja) -----------------
 class TrayIcon:
@@ -285,7 +3058,7 @@ class TrayIcon:
         )
 
     def show(self):
-        if not HAVE_TRAY or self.visible: return
+        if not HAVE_TRAY or self.visible or not lazy_import(load_tray): return
         self.visible = True
         self.icon = pystray.Icon(APP_NAME, self._build_image(self.app.engine_running()), APP_NAME, self._menu())
         self.thread = threading.Thread(target=self.icon.run, daemon=True); self.thread.start()
@@ -294,36 +3067,102 @@ class TrayIcon:
         if self.icon: self.icon.stop()
         self.icon = None; self.visible = False
 
-    def toggle_window(self, icon=None, item=None): self.app.toggle_window_visibility()
-    def toggle_run(self, icon=None, item=None): self.app.toggle_start_stop()
-    def exit_app(self, icon=None, item=None): self.app.quit_from_tray()
+    # callbacks da thread do pystray: o Tk só é tocado na sua própria thread
+    def toggle_window(self, icon=None, item=None): self.app.ui_call(self.app.toggle_window_visibility)
+    def toggle_run(self, icon=None, item=None): self.app.ui_call(self.app.toggle_start_stop)
+    def exit_app(self, icon=None, item=None): self.app.ui_call(self.app.quit_from_tray)
     def update_running(self):
         if self.icon: self.icon.icon = self._build_image(self.app.engine_running())
 
+# ----------------- notificador da UI -----------------
+class UiNotifier:
+    """Fila única das outras threads (engine, hooks, bandeja) para o Tk, com
+    no máximo um after pendente. post(): cada chave guarda só o último valor;
+    call(): chamadas em ordem, todas executadas. Uma rajada vira um único
+    callback."""
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._pending: dict[str, tuple] = {}
+        self._calls: deque[tuple] = deque()
+        self._scheduled = False
+
+    def post(self, key: str, fn, *args):
+        with self._lock:
+            self._pending[key] = (fn, args)
+            if self._scheduled: return
+            self._scheduled = True
+        self.root.after(0, self._flush)
+
+    def call(self, fn, *args):
+        with self._lock:
+            self._calls.append((fn, args))
+            if self._scheduled: return
+            self._scheduled = True
+        self.root.after(0, self._flush)
+
+    @traced("tk.notify")
+    def _flush(self):
+        WAKEUPS["ui_notify"] += 1
+        with self._lock:
+            items, self._pending, self._scheduled = self._pending, {}, False
+            calls, self._calls = self._calls, deque()
+        for fn, args in calls: fn(*args)
+        for fn, args in items.values(): fn(*args)
+
+def os_wakeups() -> int | None:
+    """Trocas de contexto (voluntárias + involuntárias) somadas em todas as
+    threads do processo; só no Linux (/proc), None nos demais."""
+    try:
+        total = 0
+        for st in Path("/proc/self/task").glob("*/status"):
+            for line in st.read_text().splitlines():
+                if "ctxt_switches:" in line:
+                    total += int(line.split(":")[1])
+        return total
+    except (OSError, ValueError):
+        return None
+
 # ----------------- APP -----------------
 class MTechClickerApp:
     def __init__(self, root: tk.Tk):
         self.root = root
         root.title(f"{APP_NAME} – autoclick + macro (jogos)")
         self._apply_theme()
-        root.geometry("760x720"); root.minsize(760, 720); root.resizable(False, False)
+        # altura natural do layout ~1005 px; em telas menores o conteúdo rola (_scroll_area)
+        root.geometry(f"760x{min(1005, root.winfo_screenheight() - 80)}"); root.minsize(640, 400)
 
         self.settings = load_settings()
+        self.store = SettingsStore(self.settings, call=self.ui_call)
+        self.library = MacroLibrary()
+        self._backend_name: str | None = None
+        self._backend_lock = threading.Lock()
+        self.backend_ready_at: float | None = None
 
-        self.stop_event = threading.Event()
-        self.worker_thread: threading.Thread | None = None
+        self.engine = Engine(on_done=self._job_done)
+        self._launch_lock = threading.Lock()
+        self.routes = build_hotkey_routes(self.settings)
+        self.hotkey_latency: deque[float] = deque(maxlen=256)   # ms, atalho -> 1º evento injetado
+        self.stop_latency: deque[float] = deque(maxlen=256)     # ms, stop -> worker parado e teclas soltas
+        self.notify = UiNotifier(root)
+        self._tick_id = None
+        self.countdown_until: float | None = None
         self.start_time = None
-        self.click_count = 0
+        self._last_jobs: list[Job] = []
+        self._ui_steps: deque[str] = deque()
+        self._ui_drain_pending = False
 
         self.tray = TrayIcon(self) if HAVE_TRAY else None
 
         self._build_ui()
 
-        self.listener = GlobalListener(self)
+        self.listener = GlobalListener(self, self.engine)
         self.listener.start()
 
         if HAVE_TRAY: self.root.bind("<Unmap>", self._on_minimize)
-        self._tick()
+        # o backend (pyautogui/pydirectinput/…) carrega em segundo plano depois
+        # que a janela já está na tela; quem precisar antes espera no lock
+        self.root.after_idle(lambda: threading.Thread(target=self._warm_backend, daemon=True).start())
 
     # ---- tema ----
     def _apply_theme(self):
@@ -338,8 +3177,27 @@ class MTechClickerApp:
             except Exception: pass
 
     # ---- UI ----
+    def _scroll_area(self) -> ttk.Frame:
+        """Frame dentro de um Canvas com barra vertical: a janela cabe em telas
+        de 768/900 px e o resto do layout rola (roda do mouse fora das listas)."""
+        outer = ttk.Frame(self.root); outer.pack(fill="both", expand=True)
+        canvas = tk.Canvas(outer, highlightthickness=0, borderwidth=0)
+        bar = ttk.Scrollbar(outer, orient="vertical", command=canvas.yview)
+        canvas.configure(yscrollcommand=bar.set)
+        bar.pack(side="right", fill="y"); canvas.pack(side="left", fill="both", expand=True)
+        inner = ttk.Frame(canvas)
+        win = canvas.create_window(0, 0, window=inner, anchor="nw")
+        inner.bind("<Configure>", lambda e: canvas.configure(scrollregion=(0, 0, e.width, e.height)))
+        canvas.bind("<Configure>", lambda e: canvas.itemconfigure(win, width=e.width))
+        def wheel(e):
+            if isinstance(e.widget, (tk.Listbox, tk.Text)): return   # essas rolam sozinhas
+            if canvas.yview() == (0.0, 1.0): return
+            canvas.yview_scroll(-1 if (getattr(e, "num", 0) == 4 or e.delta > 0) else 1, "units")
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"): self.root.bind(seq, wheel, add="+")
+        return inner
+
     def _build_ui(self):
-        main = ttk.Frame(self.root, padding=12); main.pack(fill="both", expand=True)
+        main = ttk.Frame(self._scroll_area(), padding=12); main.pack(fill="both", expand=True)
 
         hdr = ttk.Frame(main); hdr.pack(fill="x", pady=(0,6))
         ttk.Label(hdr, text=APP_NAME, font=("Segoe UI", 14, "bold")).pack(side="left")
@@ -352,10 +3210,28 @@ class MTechClickerApp:
         self.emerg_var  = tk.StringVar(value=token_label(self.settings.hotkey_emergency))
         self._hotrow(hot, "Atalho Iniciar/Parar (toggle):", self.toggle_var, lambda: self._record_hotkey("toggle"))
         self._hotrow(hot, "Atalho Emergência (parar):", self.emerg_var,  lambda: self._record_hotkey("emergency"))
+        self.pause_var  = tk.StringVar(value=token_label(self.settings.hotkey_pause) if self.settings.hotkey_pause else "—")
+        self._hotrow(hot, "Atalho Pausar/Retomar:", self.pause_var, lambda: self._record_hotkey("pause"))
         cnt = ttk.Frame(commons); cnt.pack(fill="x", pady=(6,0))
         ttk.Label(cnt, text="⏳ Contagem inicial (s):").pack(side="left")
         self.count_var = tk.StringVar(value=str(self.settings.start_countdown))
         ttk.Entry(cnt, width=10, textvariable=self.count_var).pack(side="left", padx=(6, 14))
+        ttk.Label(cnt, text="Backend de input:").pack(side="left")
+        self.backend_var = tk.StringVar(value=self.settings.input_backend)
+        ttk.Combobox(cnt, width=14, state="readonly", textvariable=self.backend_var,
+                     values=["auto", *BACKENDS]).pack(side="left", padx=(6, 14))
+        ttk.Label(cnt, text="Telemetria:").pack(side="left")
+        self.telemetry_var = tk.StringVar(value=self.settings.telemetry_export)
+        ttk.Combobox(cnt, width=6, state="readonly", textvariable=self.telemetry_var,
+                     values=["off", "json", "csv"]).pack(side="left", padx=(6, 0))
+        hum = ttk.Frame(commons); hum.pack(fill="x", pady=(6,0))
+        ttk.Label(hum, text="🎲 Variação dos delays — perfil:").pack(side="left")
+        self.profile_var = tk.StringVar(value=self.settings.delay_profile)
+        ttk.Combobox(hum, width=10, state="readonly", textvariable=self.profile_var,
+                     values=list(DELAY_PROFILES)).pack(side="left", padx=(6, 14))
+        ttk.Label(hum, text="Semente (0 = aleatória):").pack(side="left")
+        self.seed_var = tk.StringVar(value=str(self.settings.humanize_seed))
+        ttk.Entry(hum, width=10, textvariable=self.seed_var).pack(side="left", padx=(6, 0))
 
         # ===== Abas =====
         self.tabs = ttk.Notebook(main); self.tabs.pack(fill="both", expand=True)
@@ -387,7 +3263,11 @@ class MTechClickerApp:
                      values=["until_stop","fixed_amount"]).pack(side="left", padx=(6, 14))
         ttk.Label(r4, text="Qtde (se 'fixed_amount'):").pack(side="left")
         self.amount_var = tk.StringVar(value=str(self.settings.run_amount))
-        ttk.Entry(r4, width=8, textvariable=self.amount_var).pack(side="left")
+        ttk.Entry(r4, width=8, textvariable=self.amount_var).pack(side="left", padx=(6, 14))
+        ttk.Label(r4, text="Atrasos:").pack(side="left")
+        self.miss_var = tk.StringVar(value=self.settings.miss_policy)
+        ttk.Combobox(r4, width=8, state="readonly", textvariable=self.miss_var,
+                     values=["skip","catchup"]).pack(side="left", padx=(6, 0))
 
         pos = ttk.LabelFrame(auto, text="Destino do clique", padding=10)
         pos.pack(fill="x", pady=8)
@@ -397,12 +3277,49 @@ class MTechClickerApp:
         self.pos_label = ttk.Label(pos, text=self._pos_text()); self.pos_label.grid(row=1, column=0, sticky="w", pady=(6,0))
         ttk.Button(pos, text="📍 Capturar agora", command=self.capture_position_ui).grid(row=1, column=1, padx=8)
 
+        multi = ttk.LabelFrame(auto, text="Vários alvos", padding=8); multi.pack(fill="x", pady=(0, 8))
+        mrow = ttk.Frame(multi); mrow.pack(fill="x")
+        self.multi_var = tk.BooleanVar(value=self.settings.autoclick_mode == "multi")
+        ttk.Checkbutton(mrow, text="Usar lista de alvos (cada um com botão/tipo/intervalo)",
+                        variable=self.multi_var).pack(side="left")
+        ttk.Button(mrow, text="🧹", width=3, command=self.clear_targets).pack(side="right")
+        ttk.Button(mrow, text="🗑 Remover", command=self.remove_target).pack(side="right", padx=6)
+        ttk.Button(mrow, text="➕ Adicionar (cursor)", command=self.add_target).pack(side="right")
+        self.targets_list = tk.Listbox(multi, height=4)
+        self.targets_list.pack(fill="x", pady=(6, 0))
+
+        pre = ttk.Frame(auto); pre.pack(fill="x")
+        ttk.Label(pre, text="Preset:").pack(side="left")
+        self.preset_var = tk.StringVar()
+        self.preset_combo = ttk.Combobox(pre, width=18, state="readonly", textvariable=self.preset_var)
+        self.preset_combo.pack(side="left", padx=(6, 6))
+        self.preset_combo.bind("<<ComboboxSelected>>", lambda e: self.load_preset(self.preset_var.get()))
+        ttk.Button(pre, text="💾 Salvar preset…", command=self.save_preset).pack(side="left")
+        ttk.Button(pre, text="🗑", width=3, command=self.delete_preset).pack(side="left", padx=6)
+        self.preset_hotkey_var = tk.StringVar(value="—")
+        ttk.Label(pre, textvariable=self.preset_hotkey_var, width=10, relief="groove", anchor="center").pack(side="right")
+        ttk.Button(pre, text="Atalho", command=lambda: self._record_hotkey("preset")).pack(side="right", padx=6)
+
         # --- Aba Macro ---
         macro = ttk.Frame(self.tabs, padding=8); self.tabs.add(macro, text="Macro")
         top = ttk.Frame(macro); top.pack(fill="x")
         ttk.Button(top, text="⏺ Gravar macro", command=self.start_macro_record).pack(side="left")
         ttk.Button(top, text="⏹ Parar gravação", command=self.stop_macro_record).pack(side="left", padx=6)
         ttk.Button(top, text="🧹 Limpar", command=self.clear_macro_steps).pack(side="left", padx=6)
+        ttk.Button(top, text="📤 Exportar .mtm", command=self.export_macro_bin).pack(side="right")
+        ttk.Button(top, text="📥 Importar .mtm", command=self.import_macro_bin).pack(side="right", padx=6)
+
+        lib = ttk.Frame(macro); lib.pack(fill="x", pady=(8,0))
+        ttk.Label(lib, text="Macro:").pack(side="left")
+        self.macro_name_var = tk.StringVar(value=self.settings.macro_name or RECORDED_LABEL)
+        self.macro_combo = ttk.Combobox(lib, width=22, state="readonly", textvariable=self.macro_name_var)
+        self.macro_combo.pack(side="left", padx=(6, 6))
+        self.macro_combo.bind("<<ComboboxSelected>>", lambda e: self.select_macro(self.macro_name_var.get()))
+        ttk.Button(lib, text="💾 Salvar como…", command=self.save_macro_as).pack(side="left")
+        ttk.Button(lib, text="🗑 Excluir", command=self.delete_macro).pack(side="left", padx=6)
+        self.macro_hotkey_var = tk.StringVar()
+        ttk.Label(lib, textvariable=self.macro_hotkey_var, width=10, relief="groove", anchor="center").pack(side="right")
+        ttk.Button(lib, text="Atalho", command=lambda: self._record_hotkey("macro")).pack(side="right", padx=6)
 
         opts = ttk.Frame(macro); opts.pack(fill="x", pady=(8,0))
         self.macro_use_rec_var = tk.BooleanVar(value=self.settings.macro_use_recorded_delays)
@@ -410,11 +3327,33 @@ class MTechClickerApp:
         ttk.Label(opts, text="Delay fixo (s):").pack(side="left", padx=(12,4))
         self.macro_fixed_delay_var = tk.StringVar(value=str(self.settings.macro_forced_delay))
         ttk.Entry(opts, width=8, textvariable=self.macro_fixed_delay_var).pack(side="left")
+        self.macro_timeline_var = tk.BooleanVar(value=self.settings.macro_playback == "timeline")
+        ttk.Checkbutton(opts, text="Linha do tempo absoluta", variable=self.macro_timeline_var).pack(side="left", padx=(12,0))
+        ttk.Label(opts, text="Variação (%):").pack(side="left", padx=(12,4))
+        self.macro_var_var = tk.StringVar(value=str(self.settings.macro_delay_variation_pct))
+        ttk.Entry(opts, width=5, textvariable=self.macro_var_var).pack(side="left")
 
         loop = ttk.Frame(macro); loop.pack(fill="x", pady=(8,0))
         ttk.Label(loop, text="Loops (0 = infinito):").pack(side="left")
         self.macro_loops_var = tk.StringVar(value=str(self.settings.macro_loops))
         ttk.Entry(loop, width=8, textvariable=self.macro_loops_var).pack(side="left", padx=(6,14))
+        self.macro_moves_var = tk.BooleanVar(value=self.settings.macro_record_moves)
+        ttk.Checkbutton(loop, text="Gravar movimentos", variable=self.macro_moves_var).pack(side="left")
+        ttk.Label(loop, text="Tolerância (px):").pack(side="left", padx=(12,4))
+        self.macro_tol_var = tk.StringVar(value=str(self.settings.macro_path_tolerance))
+        ttk.Entry(loop, width=5, textvariable=self.macro_tol_var).pack(side="left")
+        ttk.Label(loop, text="Replay (Hz):").pack(side="left", padx=(12,4))
+        self.macro_rate_var = tk.StringVar(value=str(self.settings.macro_path_rate_hz))
+        ttk.Entry(loop, width=6, textvariable=self.macro_rate_var).pack(side="left")
+
+        wt = ttk.Frame(macro); wt.pack(fill="x", pady=(8,0))
+        ttk.Label(wt, text="Passos de tela (cursor em 3 s):").pack(side="left")
+        ttk.Button(wt, text="🎯 Cor do pixel", command=lambda: self.add_wait_step("color")).pack(side="left", padx=(6,0))
+        ttk.Button(wt, text="🔄 Mudança + clique", command=lambda: self.add_wait_step("change")).pack(side="left", padx=6)
+        ttk.Button(wt, text="🖼 Achar + clique", command=lambda: self.add_wait_step("find")).pack(side="left")
+        ttk.Label(wt, text="Timeout (s):").pack(side="left", padx=(12,4))
+        self.wait_timeout_var = tk.StringVar(value="10")
+        ttk.Entry(wt, width=5, textvariable=self.wait_timeout_var).pack(side="left")
 
         mid = ttk.LabelFrame(macro, text="Passos gravados", padding=8)
         mid.pack(fill="both", expand=True, pady=8)
@@ -428,6 +3367,16 @@ class MTechClickerApp:
         ttk.Label(st, textvariable=self.status_var, font=("Segoe UI", 11, "bold")).pack(anchor="w")
         self.stats_var = tk.StringVar(value="Cliques/Passos: 0 • Tempo: 00:00")
         ttk.Label(st, textvariable=self.stats_var).pack(anchor="w", pady=(6,2))
+        self.hook_var = tk.StringVar(value="Hook: 0 eventos")
+        ttk.Label(st, textvariable=self.hook_var, foreground="#6b7280").pack(anchor="w")
+        self.targets_var = tk.StringVar(value="")
+        ttk.Label(st, textvariable=self.targets_var, foreground="#6b7280", wraplength=700, justify="left").pack(anchor="w")
+        self.jobs_var = tk.StringVar(value="")
+        ttk.Label(st, textvariable=self.jobs_var, foreground="#6b7280", wraplength=700, justify="left").pack(anchor="w")
+        self.timing_var = tk.StringVar(value="")
+        ttk.Label(st, textvariable=self.timing_var, foreground="#6b7280", wraplength=700, justify="left").pack(anchor="w")
+        self.latency_var = tk.StringVar(value="Atalho → 1º evento: —")
+        ttk.Label(st, textvariable=self.latency_var, foreground="#6b7280").pack(anchor="w")
 
         # ===== Botões (sempre visíveis) =====
         btns = ttk.Frame(main); btns.pack(fill="x", pady=(6,0))
@@ -436,8 +3385,13 @@ class MTechClickerApp:
         self.stop_btn = ttk.Button(btns, text="⏹ Parar", command=self.stop_all, state="disabled")
         self.stop_btn.pack(side="left")
         ttk.Button(btns, text="💾 Salvar Config", command=self.save_current_settings).pack(side="right")
+        self.trace_btn = ttk.Button(btns, text="⏺ Trace", command=self.toggle_trace)
+        self.trace_btn.pack(side="right", padx=(0,8))
 
+        self._refresh_macro_combo()
         self._load_macro_list_from_settings()
+        self._refresh_presets()
+        self._refresh_targets()
 
     def _hotrow(self, parent, label, var, cmd):
         row = ttk.Frame(parent); row.pack(fill="x", pady=3)
@@ -454,20 +3408,138 @@ class MTechClickerApp:
         return f"Posição fixa: ({self.settings.fixed_x}, {self.settings.fixed_y})"
 
     def _toggle_pos(self):
-        self.settings.use_fixed_position = True if self.use_fixed.get() else False
+        with self.store.lock:
+            self.settings.use_fixed_position = True if self.use_fixed.get() else False
         self.pos_label.config(text=self._pos_text())
 
     def _record_hotkey(self, field: str):
+        if field == "macro" and not self.settings.macro_name:
+            messagebox.showinfo("Macro", "Salve a macro na biblioteca antes de definir um atalho."); return
+        if field == "preset" and self.preset_var.get() not in self.settings.autoclick_presets:
+            messagebox.showinfo("Preset", "Salve ou escolha um preset antes de definir um atalho."); return
         self.listener.set_record_field(field)
 
     def update_hotkey(self, field: str, token: str):
-        if field == "toggle":
-            self.settings.hotkey_toggle = token
-            self.toggle_var.set(token_label(token))
-        elif field == "emergency":
-            self.settings.hotkey_emergency = token
-            self.emerg_var.set(token_label(token))
-        save_settings(self.settings)
+        with self.store.lock:
+            if field == "toggle":
+                self.settings.hotkey_toggle = token
+                self.toggle_var.set(token_label(token))
+            elif field == "emergency":
+                self.settings.hotkey_emergency = token
+                self.emerg_var.set(token_label(token))
+            elif field == "pause":
+                self.settings.hotkey_pause = token
+                self.pause_var.set(token_label(token))
+            elif field == "macro" and self.settings.macro_name:
+                self.settings.macro_hotkeys[token] = self.settings.macro_name
+                self._load_macro_list_from_settings()
+            elif field == "preset" and self.preset_var.get() in self.settings.autoclick_presets:
+                self.settings.preset_hotkeys[token] = self.preset_var.get()
+                self._refresh_presets()
+        self._rebuild_routes()
+        self.store.mark_dirty()
+
+    def _rebuild_routes(self):
+        self.routes = build_hotkey_routes(self.settings)   # troca atômica; o listener só lê
+
+    # ---- autoclick multi-alvo ----
+    def _refresh_targets(self):
+        self.targets_list.delete(0, tk.END)
+        self.targets_list.insert(tk.END, *[
+            f"#{i+1}  ({t['x']}, {t['y']})  {t['button']} {t['click_type']}  a cada {t['delay']:.3f}s ({1/t['delay']:.1f} cps)"
+            for i, t in enumerate(self.settings.autoclick_targets)])
+
+    def add_target(self):
+        """Novo alvo na posição atual do cursor, com botão/tipo/delay dos campos acima."""
+        try:
+            delay = float(self.delay_var.get())
+        except ValueError:
+            messagebox.showerror("Erro", "Delay base inválido."); return
+        x, y = self.backend.position()
+        with self.store.lock:
+            self.settings.autoclick_targets.append(clamp_target(
+                {"x": x, "y": y, "button": self.btn_var.get(), "click_type": self.type_var.get(), "delay": delay}))
+        self.multi_var.set(True)
+        self._refresh_targets(); self.store.mark_dirty()
+
+    def remove_target(self):
+        with self.store.lock:
+            for i in reversed(self.targets_list.curselection()):
+                del self.settings.autoclick_targets[i]
+        self._refresh_targets(); self.store.mark_dirty()
+
+    def clear_targets(self):
+        with self.store.lock:
+            self.settings.autoclick_targets = []
+        self._refresh_targets(); self.store.mark_dirty()
+
+    def _targets_text(self, ac: "AutoclickRunner", limit: int = 12) -> str:
+        rates = ac.target_rates()
+        parts = [f"#{i+1} {a:.1f}/{w:.1f}" + (f" ({m} perdas)" if m else "")
+                 for i, (a, w, m) in enumerate(rates[:limit])]
+        if len(rates) > limit: parts.append(f"… +{len(rates) - limit}")
+        return "Alvos (cps real/pedido): " + " • ".join(parts)
+
+    # ---- presets de autoclick ----
+    def _refresh_presets(self):
+        names = sorted(self.settings.autoclick_presets)
+        self.preset_combo.config(values=names)
+        if self.preset_var.get() not in names: self.preset_var.set("")
+        cur = self.preset_var.get()
+        keys = [tok for tok, n in self.settings.preset_hotkeys.items() if n == cur and cur]
+        self.preset_hotkey_var.set(", ".join(token_label(t) for t in keys) or "—")
+
+    def save_preset(self):
+        try:
+            self._sync_ui_to_settings()
+        except ValueError as e:
+            messagebox.showerror("Erro", str(e)); return
+        name = simpledialog.askstring("Salvar preset", "Nome do preset:", initialvalue=self.preset_var.get(), parent=self.root)
+        name = (name or "").strip()
+        if not name: return
+        with self.store.lock:
+            self.settings.autoclick_presets[name] = {k: json_copy(getattr(self.settings, k)) for k in PRESET_FIELDS}
+        self.preset_var.set(name); self._refresh_presets()
+        self.store.mark_dirty()
+
+    def delete_preset(self):
+        name = self.preset_var.get()
+        if not name or not messagebox.askyesno("Preset", f"Excluir o preset '{name}'?"): return
+        with self.store.lock:
+            self.settings.autoclick_presets.pop(name, None)
+            self.settings.preset_hotkeys = {t: n for t, n in self.settings.preset_hotkeys.items() if n != name}
+        self.preset_var.set(""); self._refresh_presets(); self._rebuild_routes()
+        self.store.mark_dirty()
+
+    def load_preset(self, name: str):
+        """Coloca os valores do preset nos campos da aba Autoclick."""
+        p = preset_settings(self.settings, name)
+        self.delay_var.set(str(p.delay_seconds)); self.var_var.set(str(p.delay_variation_pct))
+        self.btn_var.set(p.mouse_button); self.type_var.set(p.click_type)
+        self.runmode_var.set(p.run_mode); self.amount_var.set(str(p.run_amount))
+        self.miss_var.set(p.miss_policy)
+        with self.store.lock:
+            self.settings.fixed_x, self.settings.fixed_y = p.fixed_x, p.fixed_y
+            self.settings.autoclick_targets = [dict(t) for t in p.autoclick_targets]
+        self.use_fixed.set(p.use_fixed_position); self._toggle_pos()
+        self.multi_var.set(p.autoclick_mode == "multi"); self._refresh_targets()
+        self._refresh_presets()
+
+    # ---- backend de input ----
+    @property
+    def backend(self) -> InputBackend:
+        self._apply_backend()
+        return get_backend()
+
+    def _apply_backend(self):
+        with self._backend_lock:
+            if self.settings.input_backend != self._backend_name:
+                set_backend(self.settings.input_backend)
+                self._backend_name = self.settings.input_backend
+
+    def _warm_backend(self):
+        self._apply_backend()
+        self.backend_ready_at = time.perf_counter()
 
     def set_status(self, text: str): self.status_var.set(text)
     def flash_info(self, text: str): messagebox.showinfo("Info", text)
@@ -475,39 +3547,181 @@ class MTechClickerApp:
     # --------- Macro helpers ----------
     def _load_macro_list_from_settings(self):
         self.steps_list.delete(0, tk.END)
-        for step in self.settings.macro_steps:
-            self.steps_list.insert(tk.END, self._step_to_str(step))
+        name = self.settings.macro_name
+        try:
+            steps = program_to_steps(self.library.get(name)) if name else self.settings.macro_steps
+        except Exception as e:
+            print("Falha ao carregar macro:", repr(e)); steps = []
+        self.steps_list.insert(tk.END, *[self._step_to_str(st) for st in steps[:MAX_LIST_STEPS]])
+        if len(steps) > MAX_LIST_STEPS:
+            self.steps_list.insert(tk.END, f"… mais {len(steps) - MAX_LIST_STEPS} passos")
+        keys = [tok for tok, n in self.settings.macro_hotkeys.items() if n == name and name]
+        self.macro_hotkey_var.set(", ".join(token_label(t) for t in keys) or "—")
+
+    # --------- biblioteca ----------
+    def _refresh_macro_combo(self):
+        self.macro_combo.config(values=[RECORDED_LABEL, *self.library.names()])
+        self.macro_name_var.set(self.settings.macro_name or RECORDED_LABEL)
+
+    def select_macro(self, name: str):
+        name = "" if name == RECORDED_LABEL or name not in self.library else name
+        with self.store.lock: self.settings.macro_name = name
+        self._refresh_macro_combo(); self._load_macro_list_from_settings()
+        self.store.mark_dirty()
+
+    def save_macro_as(self):
+        name = self.settings.macro_name
+        steps = program_to_steps(self.library.get(name)) if name else self.settings.macro_steps
+        if not steps:
+            messagebox.showwarning("Macro", "Nenhuma macro gravada."); return
+        new = simpledialog.askstring("Salvar macro", "Nome da macro:", initialvalue=name, parent=self.root)
+        new = (new or "").strip()
+        if not new or new == RECORDED_LABEL: return
+        try:
+            self.library.save(new, steps)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao salvar macro: {e}"); return
+        self.select_macro(new)
+
+    def delete_macro(self):
+        name = self.settings.macro_name
+        if not name or not messagebox.askyesno("Macro", f"Excluir a macro '{name}'?"): return
+        self.library.delete(name)
+        with self.store.lock:
+            self.settings.macro_hotkeys = {t: n for t, n in self.settings.macro_hotkeys.items() if n != name}
+        self._rebuild_routes()
+        self.select_macro("")
 
     def _step_to_str(self, step: dict) -> str:
         k = step["kind"]; v = step["value"]
         if k == "delay": return f"delay {v['seconds']:.3f}s"
         if k == "key":   return f"key {token_label(v['token'])}"
+        if k in ("key_down", "key_up"): return f"{k} {token_label(v['token'])}"
+        if k in ("mouse_down", "mouse_up"): return f"{k} {v['button']} @({v['x']},{v['y']})"
+        if k == "path":  return f"path {len(v['points'])} pts {v['points'][-1][2]/1000:.3f}s"
+        if k == "hold":  return f"hold {token_label(v['token'])} {v['seconds']:.3f}s"
         if k == "click": return f"click {v['button']} @({v['x']},{v['y']})"
+        if k in ("wait_pixel", "wait_region"):
+            spec = wait_spec(step)
+            what = {"color": v.get("color"), "hash": f"hash {spec.hash[:8]}", "change": "mudar"}[spec.mode]
+            area = f"@({spec.x},{spec.y})" if spec.pixel else f"@({spec.x},{spec.y} {spec.w}x{spec.h})"
+            click = f" → {spec.button}" if spec.button else ""
+            return f"esperar {what} {area} ≤{spec.timeout:g}s{click}"
+        if k == "find_click":
+            spec = find_spec(step)
+            roi = "tela" if spec.roi is None else "roi ({},{} {}x{})".format(*spec.roi)
+            return f"achar {spec.template} em {roi} ≥{spec.threshold:g} → {spec.button or '—'}"
         return str(step)
 
     def clear_macro_steps_ui(self):
-        self.settings.macro_steps = []
-        self.steps_list.delete(0, tk.END); save_settings(self.settings)
+        if self.settings.macro_name: self.select_macro("")
+        with self.store.lock: self.settings.macro_steps = []
+        self._ui_steps.clear()
+        self.steps_list.delete(0, tk.END); self.store.mark_dirty()
 
     def clear_macro_steps(self): self.clear_macro_steps_ui()
 
+    # append_* rodam na thread consumidora do listener: a lista da UI só é
+    # atualizada em lote por _drain_ui
+    def append_macro_step(self, step: dict):
+        with self.store.lock: self.settings.macro_steps.append(step)
+        self._ui_steps.append(self._step_to_str(step))
+
     def append_macro_delay(self, seconds: float):
-        seconds = max(0.0, float(seconds))
-        step = {"kind":"delay", "value":{"seconds": seconds}}
-        self.settings.macro_steps.append(step)
-        self.steps_list.insert(tk.END, self._step_to_str(step)); save_settings(self.settings)
+        self.append_macro_step({"kind":"delay", "value":{"seconds": max(0.0, float(seconds))}})
 
     def append_macro_key(self, token: str):
-        step = {"kind":"key", "value":{"token": token}}
-        self.settings.macro_steps.append(step)
-        self.steps_list.insert(tk.END, self._step_to_str(step)); save_settings(self.settings)
+        self.append_macro_step({"kind":"key", "value":{"token": token}})
+
+    def append_macro_click(self, button: str, x: int, y: int, kind: str = "click"):
+        self.append_macro_step({"kind":kind, "value":{"button": button, "x": int(x), "y": int(y)}})
+
+    def add_wait_step(self, mode: str):
+        """Em 3 s lê o cursor e acrescenta à macro gravada um wait_pixel com a
+        cor atual, um wait_region que clica quando a área ao redor mudar ou
+        um find_click com o recorte ao redor do cursor (salvo em TEMPLATES_DIR)."""
+        try:
+            timeout = max(0.0, float(self.wait_timeout_var.get()))
+        except ValueError:
+            messagebox.showerror("Erro", "Timeout inválido."); return
+        def capture():
+            x, y = self.backend.position()
+            if mode == "color":
+                try: rgb = get_grabber().grab(x, y, 1, 1)
+                except Exception as e:
+                    messagebox.showerror("Erro", f"Falha ao capturar a tela: {e}"); return
+                step = {"kind": "wait_pixel", "value": {"x": x, "y": y, "color": "#%02x%02x%02x" % tuple(rgb[:3]),
+                                                        "tolerance": 8, "timeout": timeout}}
+            elif mode == "find":
+                half = FIND_TEMPLATE_PX // 2
+                name = time.strftime("tpl-%Y%m%d-%H%M%S.png")
+                try:
+                    save_template(TEMPLATES_DIR / name, get_grabber().grab(x - half, y - half, 2*half, 2*half),
+                                  2*half, 2*half)
+                except Exception as e:
+                    messagebox.showerror("Erro", f"Falha ao salvar o recorte: {e}"); return
+                step = {"kind": "find_click", "value": {"template": name, "timeout": timeout}}
+            else:
+                half = WAIT_REGION_PX // 2
+                step = {"kind": "wait_region", "value": {"x": x - half, "y": y - half, "w": 2*half, "h": 2*half,
+                                                         "mode": "change", "timeout": timeout, "button": "left"}}
+            if self.settings.macro_name: self.select_macro("")
+            self.append_macro_step(step); self._drain_ui()
+            self.set_status("Parado")
+        self.set_status("Posicione o cursor… 3 s")
+        self.root.after(3000, capture)
+
+    def export_macro_bin(self):
+        name = self.settings.macro_name
+        if not name and not self.settings.macro_steps:
+            messagebox.showwarning("Macro", "Nenhuma macro gravada."); return
+        fn = filedialog.asksaveasfilename(defaultextension=".mtm", filetypes=[("Macro MTech", "*.mtm")])
+        if not fn: return
+        try:
+            if name: save_macro_bin(Path(fn), self.library.get(name))
+            else:    steps_to_bin(self.settings.macro_steps, Path(fn))
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao exportar: {e}")
+
+    def import_macro_bin(self):
+        fn = filedialog.askopenfilename(filetypes=[("Macro MTech", "*.mtm")])
+        if not fn: return
+        try:
+            steps = bin_to_steps(Path(fn))
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao importar: {e}"); return
+        with self.store.lock: self.settings.macro_steps = steps
+        self.select_macro("")
+
+    def ui_call(self, fn, *args):
+        """Agenda `fn(*args)` no loop do Tk (para chamadas vindas de outras threads)."""
+        self.notify.call(fn, *args)
 
-    def append_macro_click(self, button: str, x: int, y: int):
-        step = {"kind":"click", "value":{"button": button, "x": int(x), "y": int(y)}}
-        self.settings.macro_steps.append(step)
-        self.steps_list.insert(tk.END, self._step_to_str(step)); save_settings(self.settings)
+    def notify_capture(self):
+        """Chamado pelo consumidor do listener após cada lote; agrupa as
+        atualizações da UI num único after a cada UI_DRAIN_MS."""
+        if not self._ui_drain_pending:
+            self._ui_drain_pending = True
+            self.notify.call(self.root.after, UI_DRAIN_MS, self._drain_ui)
 
-    def start_macro_record(self): self.listener.start_macro_rec()
+    @traced("tk.drain_ui")
+    def _drain_ui(self):
+        WAKEUPS["ui_drain"] += 1
+        self._ui_drain_pending = False
+        items = []
+        while self._ui_steps: items.append(self._ui_steps.popleft())
+        if items:
+            self.steps_list.insert(tk.END, *items); self.steps_list.see(tk.END)
+            self.store.mark_dirty()
+        n, avg, mx, dropped = self.listener.hook_stats()
+        self.hook_var.set(f"Hook: {n} eventos • média {avg:.1f} µs • máx {mx:.1f} µs • descartados {dropped}")
+
+    def start_macro_record(self):
+        try:
+            self._sync_ui_to_settings()
+        except ValueError as e:
+            messagebox.showerror("Erro", str(e)); return
+        self.listener.start_macro_rec()
     def stop_macro_record(self):  self.listener.stop_macro_rec()
 
     # --------- ações principais ----------
@@ -516,37 +3730,114 @@ class MTechClickerApp:
         return "autoclick" if tab.lower().startswith("autoclick") else "macro"
 
     def toggle_start_stop(self):
-        if self.worker_thread and self.worker_thread.is_alive():
+        if self.engine_running():
             self.stop_all()
         else:
             self.start_current_tab_mode()
 
-    def start_current_tab_mode(self):
-        if self.worker_thread and self.worker_thread.is_alive(): return
+    def dispatch(self, action: str, arg: str = "", trigger_ns: int | None = None):
+        """Executa uma rota de atalho. Roda na thread consumidora do listener:
+        parar e pausar vão direto ao engine (só setam eventos); iniciar
+        macro/preset (biblioteca, compilação, backend) vai para offload(),
+        para não atrasar o próximo atalho; o toggle, que depende da aba e dos
+        campos da tela, passa pelo loop do Tk. O atalho de uma macro ou preset
+        liga/desliga só o seu job; os demais seguem rodando."""
+        TRACE.instant(f"hotkey.{action}")
+        if action == "stop" or (action == "toggle" and self.engine_running()):
+            self.halt()
+        elif action == "pause":
+            if self.engine_running():
+                paused = self.engine.pause()
+                self.post_status("Pausado" if paused else self._running_text())
+        elif action == "toggle":
+            self.ui_call(self.start_current_tab_mode, trigger_ns)
+        elif action in ("macro", "autoclick"):
+            job = self.engine.find(action, arg)
+            if job:
+                self.engine.stop(job.id)
+            elif action == "macro" and arg in self.library or \
+                    action == "autoclick" and arg in self.settings.autoclick_presets:
+                offload(self._launch_route, action, arg, trigger_ns)
+
+    def _launch_route(self, mode: str, name: str, trigger_ns: int | None):
         try:
-            self._sync_ui_to_settings(); save_settings(self.settings)
+            if self.launch(mode, name, trigger_ns) and mode == "macro":
+                self.notify.post("select", self.select_macro, name)
+        except Exception as e:
+            print(f"Erro ao iniciar {mode} {name!r}:", repr(e))
+
+    def start_current_tab_mode(self, trigger_ns: int | None = None):
+        self.start_mode(self.current_mode(), trigger_ns)
+
+    def start_mode(self, mode: str, trigger_ns: int | None = None):
+        if self.engine.find(mode, ""): return
+        try:
+            self._sync_ui_to_settings(); self.store.mark_dirty()
         except ValueError as e:
             messagebox.showerror("Erro", str(e)); return
+        self.launch(mode, None, trigger_ns)
 
-        self.stop_event.clear(); self.click_count = 0; self.start_time = None
-        self.start_btn.config(state="disabled"); self.stop_btn.config(state="normal")
-        self.status_var.set("Preparando...")
+    def launch(self, mode: str, arg: str | None = None, trigger_ns: int | None = None) -> bool:
+        """Agenda um job no engine com as configurações atuais (de qualquer
+        thread, sem esperar o Tk). `arg`: nome da macro ou do preset (None =
+        campos da aba); `trigger_ns`: instante do atalho, para medir a latência
+        até o primeiro evento injetado. Jobs de nomes diferentes rodam juntos.
+        O runner recebe uma cópia das configurações (store.frozen()): a UI
+        pode alterá-las enquanto isto roda no pool."""
+        s, name = self.store.frozen(), arg or ""
+        with self._launch_lock:
+            if self.engine.find(mode, name): return False
+            try:
+                if mode == "autoclick":
+                    cfg = AutoclickRun.from_settings(preset_settings(s, arg) if arg else s)
+                    runner = AutoclickRunner(cfg, threading.Event(), self.backend, PauseGate(), self.engine.cursor)
+                    steps = None
+                else:
+                    prog = resolve_macro_program(s, self.library, arg)
+                    if not len(prog):
+                        self.notify.post("warn", messagebox.showwarning, "Macro", "Nenhuma macro gravada."); return False
+                    runner = MacroRunner(prog, threading.Event(), s.macro_playback == "timeline", self.backend,
+                                         s.macro_path_rate_hz, PauseGate(), self.engine.cursor, macro_humanizer(s))
+                    steps = lambda loops=s.macro_loops: runner.steps(loops)
+            except Exception as e:
+                print(f"Erro ao iniciar {mode}:", repr(e))
+                self.post_status("Erro — veja o console"); return False
+            cd = s.start_countdown
+            if not self.engine_running(): self.start_time = None
+            if cd > 0: self.countdown_until = time.perf_counter() + cd
+            trigger = (trigger_ns / 1e9, cd) if trigger_ns else None
+            self.engine.submit(runner, name, mode, JOB_PRIORITY[mode], cd, trigger, steps)
+        self.post_status("Preparando..." if cd > 0 else self._running_text())
+        self.notify.post("run_state", self._show_running)
+        return True
 
-        mode = self.current_mode()
-        target = self._worker_autoclick if mode == "autoclick" else self._worker_macro
-        self.worker_thread = threading.Thread(target=target, daemon=True)
-        self.worker_thread.start()
-        if self.tray: self.tray.update_running()
+    def halt(self):
+        """Parada vinda de qualquer thread; a UI acompanha pelo notificador."""
+        self._request_stop()
+        self.notify.post("run_state", self._show_stopped)
 
     def stop_all(self):
-        self.stop_event.set()
+        self._request_stop()
+        self._show_stopped()
+
+    def _request_stop(self):
+        # a espera do engine acorda no ato; cada job sai depois da chamada de
+        # backend em andamento e solta teclas/botões (finally do gerador)
+        self.engine.stop(); self.countdown_until = None
+
+    def _show_running(self):
+        self.start_btn.config(state="disabled"); self.stop_btn.config(state="normal")
+        if self._tick_id is None: self._tick()
+        if self.tray: self.tray.update_running()
+
+    def _show_stopped(self):
         self.start_btn.config(state="normal"); self.stop_btn.config(state="disabled")
         self.status_var.set("Parado")
         if self.tray: self.tray.update_running()
 
     def save_current_settings(self):
         try:
-            self._sync_ui_to_settings(); save_settings(self.settings)
+            self._sync_ui_to_settings(); self.store.mark_dirty(); self.store.flush()
             self.pos_label.config(text=self._pos_text())
             messagebox.showinfo("Configurações", "Configurações salvas.")
         except ValueError as e:
@@ -554,120 +3845,151 @@ class MTechClickerApp:
 
     def _sync_ui_to_settings(self):
         s = self.settings
-        # comuns
-        s.start_countdown = float(self.count_var.get())
-        # autoclick
-        s.delay_seconds = float(self.delay_var.get())
-        s.delay_variation_pct = float(self.var_var.get())
-        s.mouse_button = str(self.btn_var.get())
-        s.click_type = str(self.type_var.get())
-        s.use_fixed_position = bool(self.use_fixed.get())
-        s.run_mode = str(self.runmode_var.get())
-        s.run_amount = int(self.amount_var.get())
-        # macro
-        s.macro_use_recorded_delays = bool(self.macro_use_rec_var.get())
-        s.macro_forced_delay = float(self.macro_fixed_delay_var.get())
-        s.macro_loops = int(self.macro_loops_var.get())
-        s.clamp()
+        with self.store.lock:
+            # comuns
+            s.start_countdown = float(self.count_var.get())
+            s.input_backend = str(self.backend_var.get())
+            s.telemetry_export = str(self.telemetry_var.get())
+            s.delay_profile = str(self.profile_var.get())
+            s.humanize_seed = int(self.seed_var.get() or 0)
+            # autoclick
+            s.delay_seconds = float(self.delay_var.get())
+            s.delay_variation_pct = float(self.var_var.get())
+            s.mouse_button = str(self.btn_var.get())
+            s.click_type = str(self.type_var.get())
+            s.use_fixed_position = bool(self.use_fixed.get())
+            s.run_mode = str(self.runmode_var.get())
+            s.run_amount = int(self.amount_var.get())
+            s.miss_policy = str(self.miss_var.get())
+            s.autoclick_mode = "multi" if self.multi_var.get() else "single"
+            # macro
+            s.macro_use_recorded_delays = bool(self.macro_use_rec_var.get())
+            s.macro_forced_delay = float(self.macro_fixed_delay_var.get())
+            s.macro_delay_variation_pct = float(self.macro_var_var.get())
+            s.macro_loops = int(self.macro_loops_var.get())
+            s.macro_playback = "timeline" if self.macro_timeline_var.get() else "relative"
+            s.macro_record_moves = bool(self.macro_moves_var.get())
+            s.macro_path_tolerance = float(self.macro_tol_var.get())
+            s.macro_path_rate_hz = float(self.macro_rate_var.get())
+            s.clamp()
         if s.use_fixed_position and (s.fixed_x is None or s.fixed_y is None):
             raise ValueError("Você marcou 'Usar posição fixa', mas não capturou as coordenadas.")
+        if s.autoclick_mode == "multi" and not s.autoclick_targets:
+            raise ValueError("Você marcou 'Usar lista de alvos', mas a lista está vazia.")
+        self._apply_backend()
 
     def capture_position_ui(self):
-        pos = pyautogui.position()
-        self.settings.fixed_x, self.settings.fixed_y = int(pos.x), int(pos.y)
-        self.settings.use_fixed_position = True
+        x, y = self.backend.position()
+        with self.store.lock:
+            self.settings.fixed_x, self.settings.fixed_y = x, y
+            self.settings.use_fixed_position = True
         self.use_fixed.set(True)
         self.pos_label.config(text=self._pos_text())
-        save_settings(self.settings)
-        self.flash_info(f"Posição capturada em ({pos.x}, {pos.y}).")
+        self.store.mark_dirty()
+        self.flash_info(f"Posição capturada em ({x}, {y}).")
 
     # --------- apoio ---------
-    def _countdown_block(self):
-        if self.settings.start_countdown > 0:
-            start = time.time()
-            while not self.stop_event.is_set():
-                rem = self.settings.start_countdown - (time.time() - start)
-                if rem <= 0: break
-                self.root.after(0, lambda r=max(0, rem): self.status_var.set(f"Iniciando em {r:0.1f}s…"))
-                time.sleep(0.05)
-
-    # --------- workers ----------
-    def _worker_autoclick(self):
-        try:
-            self._countdown_block()
-            if self.stop_event.is_set(): return
-            self.start_time = time.time()
-            self.root.after(0, lambda: self.status_var.set("Rodando (autoclick)…"))
-
-            total = math.inf if self.settings.run_mode == "until_stop" else self.settings.run_amount
-            while not self.stop_event.is_set() and self.click_count < total:
-                if self.settings.use_fixed_position:
-                    do_mouse_click(self.settings.mouse_button, self.settings.click_type=="double",
-                                   x=int(self.settings.fixed_x), y=int(self.settings.fixed_y))
-                else:
-                    do_mouse_click(self.settings.mouse_button, self.settings.click_type=="double")
+    def post_status(self, text: str):
+        TRACE.instant("status")
+        self.notify.post("status", self.status_var.set, text)
 
-                self.click_count += 1
+    # --------- jobs ----------
+    def _running_text(self) -> str:
+        kinds = sorted({j.kind for j in list(self.engine.jobs.values())})
+        return f"Rodando ({', '.join(kinds) or '—'})…"
 
-                d = human_delay(self.settings.delay_seconds, self.settings.delay_variation_pct)
-                end = time.time() + d
-                while time.time() < end and not self.stop_event.is_set():
-                    time.sleep(min(0.02, end - time.time()))
-        except pyautogui.FailSafeException:
-            self.root.after(0, lambda: self.status_var.set("Parado (FailSafe)"))
-        except Exception as e:
-            print("Erro no autoclick:", repr(e))
-            self.root.after(0, lambda: self.status_var.set("Erro — veja o console"))
-        finally:
-            self.root.after(0, self._finish)
+    def _job_done(self, job: Job):
+        """Fim de um job (thread do engine): erros e parada vão para a UI."""
+        if isinstance(job.error, FAILSAFE_ERRORS):
+            self.halt(); self.post_status("Parado (FailSafe)")
+        elif job.error is not None:
+            print(f"Erro no job {job.kind} {job.name!r}:", repr(job.error))
+            self.post_status("Erro — veja o console")
+        elif job.kind == "macro" and job.gen is not None:
+            summary = job.runner.summary()
+            self.post_status(f"{'Concluído' if job.result else 'Parado'} — {summary}")
+        self.notify.post(f"done{job.id}", self._finish, job)
 
-    def _worker_macro(self):
-        try:
-            if not self.settings.macro_steps:
-                self.root.after(0, lambda: messagebox.showwarning("Macro", "Nenhuma macro gravada.")); return
-
-            self._countdown_block()
-            if self.stop_event.is_set(): return
-
-            self.start_time = time.time()
-            self.root.after(0, lambda: self.status_var.set("Rodando (macro)…"))
-
-            loops_left = math.inf if self.settings.macro_loops == 0 else self.settings.macro_loops
-
-            while not self.stop_event.is_set() and loops_left > 0:
-                for step in list(self.settings.macro_steps):
-                    if self.stop_event.is_set(): break
-                    k = step["kind"]; v = step["value"]
-                    if k == "delay":
-                        sec = v["seconds"] if self.settings.macro_use_recorded_delays else self.settings.macro_forced_delay
-                        end = time.time() + max(0.0, float(sec))
-                        while time.time() < end and not self.stop_event.is_set():
-                            time.sleep(min(0.02, end - time.time()))
-                    elif k == "key":
-                        press_key_token(v["token"])
-                    elif k == "click":
-                        do_mouse_click(v["button"], False, x=int(v["x"]), y=int(v["y"]))
-                if loops_left is not math.inf:
-                    loops_left -= 1
-        except pyautogui.FailSafeException:
-            self.root.after(0, lambda: self.status_var.set("Parado (FailSafe)"))
-        except Exception as e:
-            print("Erro na macro:", repr(e))
-            self.root.after(0, lambda: self.status_var.set("Erro — veja o console"))
-        finally:
-            self.root.after(0, self._finish)
-
-    def _finish(self):
+    @traced("tk.finish")
+    def _finish(self, job: Job):
+        if job.trigger: self._record_latency(job)
+        if self.settings.telemetry_export != "off" and job.gen is not None: self._export_telemetry(job)
+        if job.stop_at is not None and job.runner.ended_at:
+            self.stop_latency.append(max(0.0, job.runner.ended_at - job.stop_at) * 1000)
+            self._show_latency()
+        if self.engine_running(): return
+        if self._tick_id is not None:
+            self.root.after_cancel(self._tick_id); self._tick()   # contagem final
+        self._last_jobs = []
         self.start_btn.config(state="normal"); self.stop_btn.config(state="disabled")
         if self.tray: self.tray.update_running()
 
+    @traced("tk.tick")
     def _tick(self):
-        if self.start_time and (self.worker_thread and self.worker_thread.is_alive()):
+        """Estatísticas/contagem na tela; só se reagenda enquanto há jobs
+        (parado, o app não acorda)."""
+        WAKEUPS["ui_tick"] += 1
+        jobs = list(self.engine.jobs.values())
+        alive = bool(jobs)
+        if alive: self._last_jobs = jobs
+        else: jobs = self._last_jobs   # contagem final dos que acabaram
+        cd = self.countdown_until
+        if cd is not None:
+            left = cd - time.perf_counter()
+            if left > 0: self.status_var.set(f"Iniciando em {left:0.1f}s…")
+            else: self.countdown_until = None; self.status_var.set(self._running_text())
+        for job in jobs:
+            if job.trigger: self._record_latency(job)
+        started = [j for j in jobs if j.runner.started_at]
+        if started and self.start_time is None: self.start_time = time.time()
+        if self.start_time:
             elapsed = int(time.time() - self.start_time); mm, ss = divmod(elapsed, 60)
-            self.stats_var.set(f"Cliques/Passos: {self.click_count} • Tempo: {mm:02d}:{ss:02d}")
-        else:
+            count = sum(j.runner.steps_done if j.kind == "macro" else j.runner.clicks for j in jobs)
+            missed = sum(j.runner.missed for j in jobs if j.kind == "autoclick")
+            late = sum(j.runner.late for j in jobs if j.kind == "autoclick")
+            self.stats_var.set(f"Cliques/Passos: {count} • Tempo: {mm:02d}:{ss:02d}"
+                               + (f" • Perdas: {missed}" if missed else "")
+                               + (f" • Atrasos: {late}" if late else ""))
+            multi = next((j.runner for j in jobs if j.kind == "autoclick" and j.runner.cfg.targets), None)
+            self.targets_var.set(self._targets_text(multi) if multi else "")
+        elif alive:
             self.stats_var.set("Cliques/Passos: 0 • Tempo: 00:00")
-        self.root.after(100, self._tick)
+        self.jobs_var.set(self._jobs_text(jobs) if alive else "")
+        if jobs:
+            j = jobs[0]
+            self.timing_var.set(f"{j.kind} {j.name or '(aba)'}: {j.runner.telemetry.status_text()}")
+        self._tick_id = self.root.after(TICK_MS, self._tick) if alive else None
+
+    def _export_telemetry(self, job: Job):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        name = re.sub(r"[^\w.-]+", "_", job.name or "aba")
+        path = TELEMETRY_DIR / f"{stamp}-{job.kind}-{name}-{job.id}.{self.settings.telemetry_export}"
+        try:
+            job.runner.telemetry.export(path, {"kind": job.kind, "name": job.name, "stats": job.runner.stats()})
+        except OSError as e:
+            print("Falha ao exportar telemetria:", repr(e))
+
+    def _jobs_text(self, jobs: list[Job], limit: int = 6) -> str:
+        parts = [f"{'⏸' if j.runner.gate.paused else '▶'} {j.kind} {j.name or '(aba)'}: {j.runner.progress()}"
+                 for j in jobs[:limit]]
+        if len(jobs) > limit: parts.append(f"… +{len(jobs) - limit}")
+        return "Jobs: " + " • ".join(parts)
+
+    def _record_latency(self, job: Job):
+        """Atalho -> primeiro evento injetado (sem o countdown), pelo
+        TimedBackend: na macro conta delays/esperas/buscas antes dele."""
+        first = job.runner.first_event_at
+        if first is None: return
+        (t, cd), job.trigger = job.trigger, None
+        self.hotkey_latency.append((first - t - cd) * 1000)
+        self._show_latency()
+
+    def _show_latency(self):
+        def fmt(d: deque) -> str:
+            if not d: return "—"
+            lat = sorted(d)
+            return f"últ {d[-1]:.2f} • p50 {lat[len(lat) // 2]:.2f} • máx {lat[-1]:.2f} ms (n={len(lat)})"
+        self.latency_var.set(f"Atalho → 1º evento: {fmt(self.hotkey_latency)}   |   Parada: {fmt(self.stop_latency)}")
 
     # --- tray/window helpers ---
     def _on_minimize(self, event):
@@ -680,26 +4002,244 @@ class MTechClickerApp:
         else:
             self.root.withdraw();  self.tray.show() if self.tray else None
 
-    def engine_running(self): return bool(self.worker_thread and self.worker_thread.is_alive())
+    def engine_running(self): return self.engine.running()
+
+    def toggle_trace(self):
+        """Liga o tracing; na segunda vez desliga e grava o trace-event JSON
+        (abra em ui.perfetto.dev ou chrome://tracing)."""
+        if not TRACE.on:
+            TRACE.start(); self.trace_btn.config(text="⏹ Trace (gravando)"); return
+        TRACE.stop(); self.trace_btn.config(text="⏺ Trace")
+        path = TELEMETRY_DIR / f"trace-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        try:
+            TRACE.export(path)
+            self.flash_info(f"Trace salvo em {path} ({min(TRACE.count, TRACE.capacity)} eventos).")
+        except OSError as e:
+            messagebox.showerror("Erro", f"Falha ao salvar o trace: {e}")
 
     def quit_from_tray(self):
         self.stop_all()
+        if TRACE.on and os.environ.get("MTC_TRACE"):
+            TRACE.stop()
+            try: TRACE.export(Path(os.environ["MTC_TRACE"]))
+            except OSError as e: print("Falha ao salvar o trace:", repr(e))
         if self.listener: self.listener.stop()
         if self.tray: self.tray.hide()
+        self.store.close()
         self.root.after(100, self.root.destroy)
 
     def on_close(self): self.quit_from_tray()
 
+# ----------------- CLI (sem GUI) -----------------
+def _cli_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="main.py", description=f"{APP_NAME} sem interface: imprime as estatísticas em JSON.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--backend", default="auto", choices=["auto", *BACKENDS])
+    common.add_argument("--countdown", type=float, default=0.0, help="segundos antes de começar")
+    common.add_argument("--duration", type=float, default=0.0, help="para após N segundos (0 = sem limite)")
+    common.add_argument("--telemetry", type=Path, help="exporta os histogramas da execução (.json ou .csv)")
+    common.add_argument("--trace", type=Path, help="grava um trace-event JSON (Perfetto/chrome://tracing)")
+    common.add_argument("--profile", default="uniform", choices=DELAY_PROFILES, help="distribuição da variação dos delays")
+    common.add_argument("--seed", type=int, help="semente da variação (execuções reproduzíveis)")
+
+    run = sub.add_parser("run", parents=[common], help="executa uma macro")
+    src = run.add_mutually_exclusive_group()
+    src.add_argument("--macro", help="nome da macro na biblioteca")
+    src.add_argument("--file", type=Path, help="arquivo .mtm ou .json (lista de passos)")
+    run.add_argument("--loops", type=int, help="voltas (0 = infinito; padrão: configurações)")
+    run.add_argument("--playback", choices=("relative", "timeline"), help="modo de replay (padrão: configurações)")
+    run.add_argument("--forced-delay", type=float, help="substitui todos os delays por este valor")
+    run.add_argument("--variation", type=float, default=0.0, help="variação aleatória dos passos delay (%%)")
+
+    ac = sub.add_parser("autoclick", parents=[common], help="autoclick")
+    rate = ac.add_mutually_exclusive_group()
+    rate.add_argument("--cps", type=float, help="cliques por segundo")
+    rate.add_argument("--delay", type=float, help="segundos entre cliques")
+    ac.add_argument("--variation", type=float, default=0.0, help="variação aleatória do delay (%%)")
+    ac.add_argument("--count", type=int, default=0, help="número de cliques (0 = até parar)")
+    ac.add_argument("--button", default="left", choices=["left", "right", "middle"])
+    ac.add_argument("--double", action="store_true")
+    ac.add_argument("--pos", type=int, nargs=2, metavar=("X", "Y"), help="posição fixa")
+    ac.add_argument("--policy", default="skip", choices=["skip", "catchup"])
+    ac.add_argument("--target", action="append", default=[], metavar="X,Y[,BOTÃO[,DELAY[,double]]]",
+                    help="alvo do modo multi-alvo (repetível); DELAY padrão = --delay/--cps")
+
+    gr = sub.add_parser("grab", help="lê uma região da tela (cor média e hash para passos wait_*)")
+    gr.add_argument("x", type=int); gr.add_argument("y", type=int)
+    gr.add_argument("w", type=int, nargs="?", default=1); gr.add_argument("h", type=int, nargs="?", default=1)
+    gr.add_argument("--save", type=Path, help="grava a região em PNG (template de find_click)")
+    return ap
+
+def cli_grab(args) -> int:
+    try:
+        g = get_grabber()
+        t0 = time.perf_counter()
+        buf = g.grab(args.x, args.y, max(1, args.w), max(1, args.h))
+        ms = (time.perf_counter() - t0) * 1000
+        if args.save: save_template(args.save, buf, max(1, args.w), max(1, args.h))
+    except Exception as e:
+        print(json.dumps({"error": repr(e)})); return 1
+    n = len(buf) // 3
+    mean = tuple(round(sum(buf[c::3]) / n) for c in range(3))
+    print(json.dumps({"grabber": g.name, "color": "#%02x%02x%02x" % mean, "hash": region_hash(buf),
+                      "grab_ms": round(ms, 3)}))
+    return 0
+
+def _cli_macro_program(args) -> tuple[MacroProgram, AppSettings]:
+    if args.file:
+        s = AppSettings()
+        if args.file.suffix.lower() == ".mtm":
+            prog = load_macro_bin(args.file)
+        else:
+            prog = compile_macro(json.loads(args.file.read_text(encoding="utf-8")))
+    else:
+        # as configurações (e seus macro_steps) só são lidas quando necessárias
+        s = AppSettings(macro_name=args.macro) if args.macro else load_settings()
+        if args.macro and args.macro not in (lib := MacroLibrary()):
+            raise SystemExit(f"macro '{args.macro}' não encontrada")
+        prog = resolve_macro_program(s, lib if args.macro else MacroLibrary())
+    if args.forced_delay is not None:
+        prog = prog.copy(); retime_program(prog, args.forced_delay)
+    return prog, s
+
+def cli_main(argv: list[str]) -> int:
+    args = _cli_parser().parse_args(argv)
+    if args.cmd == "grab": return cli_grab(args)
+    stop = threading.Event()
+    try:
+        backend = set_backend(args.backend)
+        if args.cmd == "autoclick":
+            delay = 1.0 / args.cps if args.cps else (args.delay if args.delay is not None else AppSettings.delay_seconds)
+            x, y = args.pos if args.pos else (None, None)
+            targets = []
+            for spec in args.target:
+                f = spec.split(",")
+                try:
+                    t = clamp_target({"x": f[0], "y": f[1], "button": f[2] if len(f) > 2 else args.button,
+                                      "delay": f[3] if len(f) > 3 else delay,
+                                      "click_type": "double" if (f[4:] == ["double"] or args.double) else "single"})
+                except (IndexError, ValueError):
+                    raise SystemExit(f"alvo inválido: {spec}")
+                targets.append(ClickTarget(t["x"], t["y"], t["button"], t["click_type"] == "double", t["delay"]))
+            cfg = AutoclickRun(button=args.button, double=args.double, x=x, y=y, delay=max(0.0, delay),
+                               variation_pct=max(0.0, min(100.0, args.variation)),
+                               total=args.count if args.count > 0 else math.inf, policy=args.policy,
+                               targets=tuple(targets), profile=args.profile, seed=args.seed)
+            runner = AutoclickRunner(cfg, stop, backend)
+            job = runner.run
+        else:
+            prog, s = _cli_macro_program(args)
+            if not len(prog): raise SystemExit("macro vazia")
+            human = (DelayStream(1.0, min(100.0, args.variation), args.profile, sub_seed(args.seed, -1))
+                     if args.variation > 0 else None)
+            runner = MacroRunner(prog, stop, (args.playback or s.macro_playback) == "timeline", backend, s.macro_path_rate_hz, humanize=human)
+            loops = s.macro_loops if args.loops is None else max(0, args.loops)
+            job = lambda: runner.run(loops)
+    except SystemExit as e:
+        print(json.dumps({"error": str(e)})); return 1
+
+    result: dict = {}
+    if args.trace: TRACE.start()
+    def work():
+        try:
+            result["completed"] = bool(job())
+        except Exception as e:
+            result["error"] = repr(e)
+
+    if args.countdown > 0 and stop.wait(args.countdown): return 1
+    t = threading.Thread(target=work, daemon=True)
+    t.start()
+    deadline = time.perf_counter() + args.duration if args.duration > 0 else math.inf
+    try:
+        while t.is_alive():
+            t.join(min(0.2, max(0.0, deadline - time.perf_counter())))
+            if time.perf_counter() >= deadline: stop.set()
+    except KeyboardInterrupt:
+        stop.set(); t.join()
+        result["interrupted"] = True
+    stats = runner.stats()
+    if runner.started_at is not None:
+        stats["startup_ms"] = round((runner.started_at - _T0 - max(0.0, args.countdown)) * 1000, 3)
+    if runner.first_event_at is not None:   # 1º evento injetado (clique no autoclick)
+        stats["first_click_ms"] = round((runner.first_event_at - _T0 - max(0.0, args.countdown)) * 1000, 3)
+    stats.update(result)
+    if args.telemetry:
+        try: runner.telemetry.export(args.telemetry, {"mode": args.cmd})
+        except OSError as e: stats["telemetry_error"] = repr(e)
+    if args.trace:
+        TRACE.stop()
+        try: TRACE.export(args.trace)
+        except OSError as e: stats["trace_error"] = repr(e)
+    print(json.dumps(stats))
+    return 1 if "error" in result else 0
+
 # ----------------- MAIN -----------------
 def main():
+    # antes de tudo: sem isso, coordenadas da CLI e da UI saem escaladas em telas com DPI > 100%
     try:
         import ctypes; ctypes.windll.shcore.SetProcessDpiAwareness(1)
     except Exception: pass
+    if len(sys.argv) > 1:
+        sys.exit(cli_main(sys.argv[1:]))
+    _import_gui()
 
     root = tk.Tk()
+    if os.environ.get("MTC_TRACE"): TRACE.start()   # grava desde a partida; exporta ao fechar
     app = MTechClickerApp(root)
     root.protocol("WM_DELETE_WINDOW", app.on_close)
+    if os.environ.get("MTC_STARTUP_PROBE"): _startup_probe(root, app)
+    if os.environ.get("MTC_WAKEUP_PROBE"): _wakeup_probe(root, app, float(os.environ["MTC_WAKEUP_PROBE"]))
     root.mainloop()
 
+def _wakeup_probe(root, app, secs: float):
+    """Usado pelo bench.py: despertares/s parado e com um autoclick (backend
+    null, 100 CPS) rodando, pelos contadores do app e pelo SO (Linux)."""
+    import tempfile
+    app.store.close()   # a medição não toca no settings.json do usuário
+    app.store = SettingsStore(app.settings, Path(tempfile.gettempdir()) / "mtc_probe_settings.json", call=app.ui_call)
+    out: dict = {"seconds": secs}
+    def snap(): return dict(WAKEUPS), os_wakeups(), time.perf_counter()
+    def rate(a, b):
+        dt = b[2] - a[2]
+        keys = set(a[0]) | set(b[0])
+        r = {k: round((b[0].get(k, 0) - a[0].get(k, 0)) / dt, 2) for k in sorted(keys)}
+        r["app_total"] = round(sum(r.values()), 2)
+        if a[1] is not None and b[1] is not None: r["os_ctx_switches"] = round((b[1] - a[1]) / dt, 2)
+        return r
+    def idle_start():
+        s0 = snap()
+        root.after(int(secs * 1000), lambda: idle_end(s0))
+    def idle_end(s0):
+        out["idle_per_s"] = rate(s0, snap())
+        app.count_var.set("0"); app.backend_var.set("null"); app.delay_var.set("0.01")
+        app.var_var.set("0"); app.runmode_var.set("until_stop")
+        s1 = snap()
+        app.start_mode("autoclick")
+        root.after(int(secs * 1000), lambda: run_end(s1))
+    def run_end(s1):
+        out["running_per_s"] = rate(s1, snap())
+        print(json.dumps(out), flush=True)
+        app.on_close()
+    root.after(1000, idle_start)   # deixa a partida (warm-up do backend) assentar
+
+def _startup_probe(root, app):
+    """Usado pelo bench.py: mede janela visível e backend pronto (a partir do
+    início do processo), imprime JSON e fecha."""
+    marks: dict[str, float] = {}
+    def on_map(_e=None):
+        if "window_ms" not in marks:
+            root.update_idletasks()
+            marks["window_ms"] = (time.perf_counter() - _T0) * 1000
+    def poll():
+        if "window_ms" in marks and app.backend_ready_at is not None:
+            print(json.dumps({"time_to_window_ms": round(marks["window_ms"], 3),
+                              "time_to_backend_ms": round((app.backend_ready_at - _T0) * 1000, 3),
+                              "backend": get_backend().name}), flush=True)
+            app.on_close(); return
+        root.after(5, poll)
+    root.bind("<Map>", on_map, add="+")
+    root.after(5, poll)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# main.py é um módulo solto na raiz (sem pacote): deixa `import main` funcionar com `pytest` puro
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
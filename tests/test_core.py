@@ -0,0 +1,213 @@
+"""Partes puras/determinísticas do engine: sem tela, sem hooks e sem Tk.
+As execuções usam NullBackend/RecordingBackend, então nada é injetado."""
+import threading
+import time
+
+import pytest
+
+import main as app
+
+STEPS = [
+    {"kind": "key", "value": {"token": "a"}},
+    {"kind": "delay", "value": {"seconds": 0.25}},
+    {"kind": "click", "value": {"button": "left", "x": 10, "y": 20}},
+    {"kind": "hold", "value": {"token": "space", "seconds": 0.5}},
+    {"kind": "key_down", "value": {"token": "shift"}},
+    {"kind": "key_up", "value": {"token": "shift"}},
+    {"kind": "mouse_down", "value": {"button": "right", "x": 1, "y": 2}},
+    {"kind": "path", "value": {"points": [[1, 2, 0], [50, 60, 40], [100, 80, 90]]}},
+    {"kind": "mouse_up", "value": {"button": "right", "x": 100, "y": 80}},
+    {"kind": "wait_pixel", "value": {"x": 5, "y": 6, "color": "#fa0000", "tolerance": 8, "timeout": 2.0}},
+    {"kind": "wait_region", "value": {"x": 0, "y": 0, "mode": "change", "w": 20, "h": 20, "button": "left"}},
+    {"kind": "find_click", "value": {"template": "x.png", "roi": [0, 0, 300, 300], "offset": [3, -2]}},
+]
+
+
+# ---------- macro: compilação e .mtm ----------
+def test_compile_roundtrip_steps():
+    prog = app.compile_macro(STEPS)
+    assert len(prog) == len(STEPS)
+    assert app.program_to_steps(prog) == STEPS
+    # delay + hold + path (90 ms) ocupam a linha do tempo; esperas/buscas duram 0
+    assert prog.duration == pytest.approx(0.25 + 0.5 + 0.09)
+    assert list(prog.offsets[:4]) == pytest.approx([0.0, 0.0, 0.25, 0.25])
+
+def test_compile_forced_delay_and_unknown_steps():
+    steps = [{"kind": "delay", "value": {"seconds": 3.0}}, {"kind": "nope", "value": {}},
+             {"kind": "delay", "value": {"seconds": 0.1}}]
+    prog = app.compile_macro(steps, use_recorded_delays=False, forced_delay=0.5)
+    assert list(prog.delays) == [0.5, 0.5]
+
+def test_mtm_roundtrip(tmp_path):
+    path = tmp_path / "m.mtm"
+    app.steps_to_bin(STEPS, path)
+    assert path.read_bytes()[:4] == app.MTM_MAGIC
+    assert app.bin_to_steps(path) == STEPS
+    prog, back = app.compile_macro(STEPS), app.load_macro_bin(path)
+    assert list(back.offsets) == list(prog.offsets) and back.duration == prog.duration
+    assert back.waits == prog.waits and back.finds == prog.finds
+
+
+# ---------- simplificação RDP ----------
+def test_simplify_path_collinear_keeps_endpoints():
+    pts = [(i, 2 * i, i * 1000) for i in range(50)]
+    assert app.simplify_path(pts, 1.0) == [pts[0], pts[-1]]
+
+def test_simplify_path_keeps_corner_and_times():
+    pts = [(i, 0, i) for i in range(10)] + [(9, j, 10 + j) for j in range(1, 10)]
+    assert app.simplify_path(pts, 0.5) == [(0, 0, 0), (9, 0, 9), (9, 9, 19)]
+
+def test_simplify_path_tolerance_zero_is_identity():
+    pts = [(0, 0, 0), (1, 1, 1), (2, 0, 2)]
+    assert app.simplify_path(pts, 0) == pts
+    assert app.simplify_path(pts, 5.0) == [pts[0], pts[-1]]
+
+
+# ---------- SpscRing ----------
+def test_spsc_ring_overflow_drops_and_keeps_order():
+    ring = app.SpscRing(5)   # arredonda para 8
+    assert all(ring.push(i) for i in range(8))
+    assert not ring.push(8) and not ring.push(9)
+    assert ring.dropped == 2 and len(ring) == 8
+    out: list = []
+    ring.drain(out)
+    assert out == list(range(8)) and len(ring) == 0
+    assert ring.push("x"); out.clear(); ring.drain(out)
+    assert out == ["x"]
+
+
+# ---------- Histogram ----------
+def test_histogram_exact_below_sub_buckets():
+    h = app.Histogram()
+    for us in range(1, 11): h.record(us)
+    assert h.percentile(0.5) == 5.0 and h.percentile(1.0) == 10.0
+    assert h.summary()["min"] == 1 and h.summary()["max"] == 10
+
+def test_histogram_percentiles_relative_error():
+    h = app.Histogram()
+    for us in range(1, 100_001): h.record(us)
+    for q in (0.5, 0.9, 0.99, 0.999):
+        assert h.percentile(q) == pytest.approx(q * 100_000, rel=0.016)
+    assert h.n == 100_000 and h.max == 100_000
+    assert h.percentile(1.0) == pytest.approx(100_000, rel=0.016)   # meio do balde, nunca acima do máx
+
+def test_histogram_empty_and_clamped():
+    h = app.Histogram()
+    assert h.percentile(0.5) == 0.0 and h.summary() == {"n": 0}
+    h.record(-5); h.record(app.HIST_MAX_US * 4)
+    assert h.min == 0 and h.max == app.HIST_MAX_US
+
+
+# ---------- ClickScheduler ----------
+def _fire_backlog(policy: str, behind_s: float = 1.0, interval: float = 0.01):
+    sc = app.ClickScheduler(threading.Event(), policy)
+    sc.start(time.perf_counter() - behind_s)
+    fired = 0
+    while sc.deadline < time.perf_counter():
+        fired += 1; sc.advance(interval)
+    return sc, fired
+
+def test_scheduler_skip_drops_backlog():
+    sc, fired = _fire_backlog("skip")
+    assert fired <= 3
+    assert sc.missed >= 97 and sc.late >= 1
+
+def test_scheduler_catchup_bursts_then_drops():
+    sc, fired = _fire_backlog("catchup")
+    assert fired >= app.MAX_CATCHUP_BURST
+    # todo deadline da grade ou disparou ou foi descartado
+    assert fired + sc.missed == pytest.approx(101, abs=2)
+    assert sc.late >= app.MAX_CATCHUP_BURST
+
+def test_scheduler_on_time_counts_nothing():
+    sc = app.ClickScheduler(threading.Event(), "catchup")
+    sc.start()
+    for _ in range(5): sc.advance(10.0)
+    assert sc.missed == sc.late == 0
+    assert sc.deadline > time.perf_counter() + 49
+
+
+# ---------- DelayStream ----------
+@pytest.mark.parametrize("profile", app.DELAY_PROFILES)
+def test_delay_stream_seed_repeats(profile):
+    a = app.DelayStream(0.1, 30, profile, seed=42, batch=16)
+    b = app.DelayStream(0.1, 30, profile, seed=42, batch=16)
+    xs = [a.next() for _ in range(40)]   # atravessa vários lotes
+    assert xs == [b.next() for _ in range(40)]
+    assert xs != [app.DelayStream(0.1, 30, profile, seed=43).next() for _ in range(40)]
+    assert min(xs) >= 0
+
+@pytest.mark.parametrize("profile", ("uniform", "clamped"))
+def test_delay_stream_bounded_profiles(profile):
+    s = app.DelayStream(0.2, 25, profile, seed=1)
+    assert all(0.15 <= d <= 0.25 for d in (s.next() for _ in range(2000)))
+
+def test_delay_stream_constant():
+    s = app.DelayStream(0.3, 0)
+    assert s.constant and {s.next() for _ in range(10)} == {0.3} and s.take(3) == [0.3] * 3
+
+
+# ---------- runners com backends que não injetam ----------
+def test_macro_runner_records_events():
+    rec = app.RecordingBackend()
+    steps = [{"kind": "click", "value": {"button": "left", "x": 10, "y": 20}},
+             {"kind": "delay", "value": {"seconds": 0.005}},
+             {"kind": "key", "value": {"token": "a"}}]
+    for timeline in (False, True):
+        rec.count = 0
+        r = app.MacroRunner(app.compile_macro(steps), threading.Event(), timeline, rec)
+        assert r.run(2)
+        assert [(k, x, y) for _, k, x, y in rec.events()] == [
+            (app.REC_CLICK, 10, 20), (app.REC_KEY, -1, -1)] * 2
+        assert r.loops_done == 2
+
+def test_autoclick_runner_fixed_amount():
+    run = app.AutoclickRun(button="left", double=False, x=5, y=6, delay=0.001,
+                           variation_pct=0.0, total=10, policy="skip")
+    r = app.AutoclickRunner(run, threading.Event(), app.NullBackend())
+    assert r.run() and r.clicks == 10
+    assert r.stats()["clicks"] == 10
+
+def test_engine_injects_nothing_after_stop():
+    # stop() seta o flag e só depois agenda o cancelamento no loop; o atraso
+    # de 2 ms alarga essa janela: nenhum clique pode sair dentro dela
+    ended: dict[int, threading.Event] = {}
+    engine = app.Engine(on_done=lambda job: ended[job.id].set())
+    for _ in range(10):
+        rec, stop = app.RecordingBackend(), threading.Event()
+        run = app.AutoclickRun("left", False, 1, 1, 0.0005, 0.0, float("inf"), "skip")   # 2000 cps
+        runner = app.AutoclickRunner(run, stop, rec)
+        job = engine.submit(runner, "", "autoclick"); ended[job.id] = threading.Event()
+        time.sleep(0.02)
+        stop.set(); t_stop = time.perf_counter_ns()
+        time.sleep(0.002)
+        engine.stop(job.id)
+        assert ended[job.id].wait(2.0)
+        assert runner.clicks > 0
+        assert [ts for ts, *_ in rec.events() if ts > t_stop] == []
+
+def test_mtm_long_strings(tmp_path):
+    template = "templates/" + "t" * 300 + ".png"
+    steps = [{"kind": "find_click", "value": {"template": template}},
+             {"kind": "key", "value": {"token": "é" * 200}}]   # 400 bytes UTF-8
+    path = tmp_path / "long.mtm"
+    app.steps_to_bin(steps, path)
+    assert app.bin_to_steps(path) == steps
+
+def test_settings_store_frozen_is_a_private_copy(tmp_path):
+    s = app.AppSettings(autoclick_presets={"p": {"delay_seconds": 0.5}}, delay_seconds=-1.0)
+    store = app.SettingsStore(s, tmp_path / "s.json")
+    try:
+        snap = store.frozen()
+        s.autoclick_presets["p"]["delay_seconds"] = 9.0; s.macro_steps.append({"kind": "key"})
+        assert snap.autoclick_presets == {"p": {"delay_seconds": 0.5}} and snap.macro_steps == []
+        assert snap.delay_seconds == 0.0 and s.delay_seconds == -1.0   # clamp só na cópia
+    finally:
+        store.close()
+
+def test_first_event_at_counts_leading_delay():
+    steps = [{"kind": "delay", "value": {"seconds": 0.05}}, {"kind": "key", "value": {"token": "a"}}]
+    r = app.MacroRunner(app.compile_macro(steps), threading.Event(), False, app.NullBackend())
+    assert r.first_event_at is None
+    assert r.run(1)
+    assert r.first_event_at - r.started_at >= 0.05